@@ -0,0 +1,199 @@
+"""
+In-process endpoint benchmark behind ``manage.py benchmark_endpoints``.
+
+Every GET route served by a DRF view (router list/retrieve/custom actions and
+``@api_view`` functions) is discovered from the URLconf and driven through
+the DRF test client as an admin user, normally against a database filled by
+``seed_school``; actions that need query parameters take them from the
+seeded rows (``ACTION_PARAMS``). Each endpoint records p50/p95 latency and
+its SQL query count into a JSON baseline; ``compare`` reports the endpoints
+that got slower or started running more queries than the baseline allows.
+"""
+import math
+import re
+import statistics
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import URLResolver, get_resolver, reverse
+from rest_framework.test import APIClient
+
+from server.metrics import QueryRecorder
+from attendance.models import Attendance, AttendanceBitmap
+from finance.models import FeePayment
+from students.models import Enrollment, TeacherAssignment
+from timetable.models import TimeSlot, Timetable
+
+# Latency differences below this many milliseconds are treated as noise
+LATENCY_FLOOR_MS = 5
+
+
+def _first(model, **fields):
+	"""Query params naming the values of ``fields`` (param: field) on the newest ``model`` row, or None"""
+	row = model._default_manager.order_by("-pk").values(*fields.values()).first()
+	if row is None:
+		return None
+	return {param: row[field] for param, field in fields.items()}
+
+
+# Actions that answer 400 without query params, and where to find valid ones in the seeded data
+ACTION_PARAMS = {
+	"attendance-class-attendance": lambda: _first(Attendance, class_id="school_class_id", date="date"),
+	"attendance-student-attendance": lambda: _first(Attendance, student_id="student_id"),
+	"attendance-percentages": lambda: _first(AttendanceBitmap, term="term_id"),
+	"fee-payment-student-payments": lambda: _first(FeePayment, student_id="student_id"),
+	"student-account-by-class": lambda: _first(Enrollment, school_class="school_class_id", academic_year="academic_year_id"),
+	"time-slot-by-day": lambda: _first(TimeSlot, day="day_of_week"),
+	"timetable-by-class": lambda: _first(Timetable, class_id="school_class_id"),
+	"timetable-by-teacher": lambda: _first(TeacherAssignment, teacher_id="teacher_id"),
+	"timetable-entry-by-timetable": lambda: _first(Timetable, timetable_id="pk"),
+	"timetable-entry-teacher-schedule": lambda: _first(TeacherAssignment, teacher_id="teacher_id"),
+}
+
+
+def iter_routes(patterns=None, namespace=None):
+	"""Yield ``(view_name, pattern)`` for every named URL pattern"""
+	if patterns is None:
+		patterns = get_resolver().url_patterns
+	for pattern in patterns:
+		if isinstance(pattern, URLResolver):
+			child = namespace
+			if pattern.namespace:
+				child = f"{namespace}:{pattern.namespace}" if namespace else pattern.namespace
+			yield from iter_routes(pattern.url_patterns, child)
+		elif pattern.name:
+			yield (f"{namespace}:{pattern.name}" if namespace else pattern.name), pattern
+
+
+def discover_endpoints():
+	"""
+	Return ``(endpoints, skipped)``: endpoints are ``(view_name, path)`` pairs
+	ready to GET; skipped maps view names to the reason they cannot be driven.
+	"""
+	endpoints, skipped, seen = [], {}, {}
+	for view_name, pattern in iter_routes():
+		callback = pattern.callback
+		view_class = getattr(callback, "cls", None)
+		arguments = set(pattern.pattern.regex.groupindex)
+		if view_class is None or "format" in arguments:
+			continue
+		if seen.setdefault(view_name, view_class) is not view_class:
+			# reverse() would send both routes to the same URL, so one of them would never be measured
+			skipped[view_name] = "URL name used by more than one view; give the routes distinct names"
+			endpoints = [endpoint for endpoint in endpoints if endpoint[0] != view_name]
+			continue
+		if any(endpoint[0] == view_name for endpoint in endpoints):
+			continue
+
+		actions = getattr(callback, "actions", None)
+		if actions is not None and "get" not in actions:
+			continue
+		if actions is None and not hasattr(view_class, "get"):
+			continue
+
+		kwargs = {}
+		if arguments:
+			if arguments != {"pk"}:
+				skipped[view_name] = f"unsupported URL arguments {sorted(arguments)}"
+				continue
+			model = _model_for(view_class)
+			pk = model._default_manager.order_by("pk").values_list("pk", flat=True).first() if model else None
+			if pk is None:
+				skipped[view_name] = "no object to retrieve"
+				continue
+			kwargs["pk"] = pk
+		path = reverse(view_name, kwargs=kwargs)
+		if view_name in ACTION_PARAMS:
+			params = ACTION_PARAMS[view_name]()
+			if params is None:
+				skipped[view_name] = "no data for its query parameters"
+				continue
+			path = f"{path}?{urlencode(params)}"
+		endpoints.append((view_name, path))
+	return endpoints, skipped
+
+
+def _model_for(view_class):
+	queryset = getattr(view_class, "queryset", None)
+	if queryset is not None:
+		return queryset.model
+	serializer_class = getattr(view_class, "serializer_class", None)
+	meta = getattr(serializer_class, "Meta", None)
+	return getattr(meta, "model", None)
+
+
+def percentile(values, fraction):
+	ordered = sorted(values)
+	return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def measure(client, path, runs=5, warmup=1, cold=True):
+	"""GET ``path`` ``warmup + runs`` times and summarise the measured runs"""
+	timings, queries, status = [], [], None
+	for run in range(warmup + runs):
+		if cold:
+			cache.clear()
+		recorder = QueryRecorder()
+		with connection.execute_wrapper(recorder):
+			start = time.perf_counter()
+			response = client.get(path)
+			elapsed = (time.perf_counter() - start) * 1000
+		status = response.status_code
+		if run >= warmup:
+			timings.append(elapsed)
+			queries.append(recorder.count)
+	return {
+		"path": path,
+		"status": status,
+		"p50_ms": round(statistics.median(timings), 2),
+		"p95_ms": round(percentile(timings, 0.95), 2),
+		"queries": max(queries),
+	}
+
+
+def run_benchmark(user, runs=5, warmup=1, cold=True, include=None, exclude=None, log=None):
+	# Broken endpoints are reported with their 500 status rather than aborting the run
+	client = APIClient(raise_request_exception=False)
+	client.force_authenticate(user)
+	endpoints, skipped = discover_endpoints()
+
+	results = {}
+	with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+		for view_name, path in endpoints:
+			if include and not re.search(include, view_name):
+				continue
+			if exclude and re.search(exclude, view_name):
+				continue
+			results[view_name] = measure(client, path, runs=runs, warmup=warmup, cold=cold)
+			if log:
+				log(view_name, results[view_name])
+	return {
+		"settings": {"runs": runs, "warmup": warmup, "cold_cache": cold},
+		"endpoints": results,
+		"skipped": skipped,
+	}
+
+
+def compare(baseline, current, latency_threshold=0.5, query_threshold=0):
+	"""
+	Return a list of regression messages: endpoints whose p95 grew by more than
+	``latency_threshold`` (a fraction, ignoring changes under LATENCY_FLOOR_MS)
+	or whose query count grew by more than ``query_threshold`` queries.
+	"""
+	regressions = []
+	for view_name, result in sorted(current["endpoints"].items()):
+		before = baseline["endpoints"].get(view_name)
+		if before is None:
+			continue
+		if result["status"] != before["status"]:
+			regressions.append(f"{view_name}: status {before['status']} -> {result['status']}")
+		if result["queries"] > before["queries"] + query_threshold:
+			regressions.append(f"{view_name}: queries {before['queries']} -> {result['queries']}")
+		limit = before["p95_ms"] * (1 + latency_threshold)
+		if result["p95_ms"] > limit and result["p95_ms"] - before["p95_ms"] > LATENCY_FLOOR_MS:
+			regressions.append(f"{view_name}: p95 {before['p95_ms']} ms -> {result['p95_ms']} ms")
+	return regressions
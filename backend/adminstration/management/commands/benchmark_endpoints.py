@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import User
+from adminstration.benchmark import run_benchmark, compare
+
+
+class Command(BaseCommand):
+	help = "Measure p50/p95 latency and SQL query counts of every DRF GET endpoint, optionally against a baseline"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--output", help="Write the results as a JSON baseline to this file")
+		parser.add_argument("--compare", metavar="BASELINE", help="Fail if endpoints regressed against this baseline")
+		parser.add_argument("--latency-threshold", type=float, default=0.5, help="Allowed relative p95 growth (default 0.5)")
+		parser.add_argument("--query-threshold", type=int, default=0, help="Allowed extra queries per endpoint (default 0)")
+		parser.add_argument("--runs", type=int, default=5, help="Measured requests per endpoint (default 5)")
+		parser.add_argument("--warmup", type=int, default=1, help="Unmeasured requests per endpoint (default 1)")
+		parser.add_argument("--warm-cache", action="store_true", help="Keep the cache between requests instead of clearing it")
+		parser.add_argument("--include", help="Only endpoints whose view name matches this regex")
+		parser.add_argument("--exclude", help="Skip endpoints whose view name matches this regex")
+		parser.add_argument("--user", help="Email of the user to authenticate as (default: first admin)")
+
+	def handle(self, *args, **options):
+		users = User.objects.filter(email=options["user"]) if options["user"] else User.objects.filter(role="admin")
+		user = users.order_by("pk").first()
+		if user is None:
+			raise CommandError("No user to authenticate as; run seed_school or pass --user.")
+
+		baseline = None
+		if options["compare"]:
+			with open(options["compare"]) as f:
+				baseline = json.load(f)
+
+		def log(view_name, result):
+			self.stdout.write(
+				f"{result['status']} {view_name:<45} p50 {result['p50_ms']:>9.2f} ms  "
+				f"p95 {result['p95_ms']:>9.2f} ms  {result['queries']:>5} queries"
+			)
+
+		results = run_benchmark(
+			user, runs=options["runs"], warmup=options["warmup"], cold=not options["warm_cache"],
+			include=options["include"], exclude=options["exclude"], log=log,
+		)
+		for view_name, reason in sorted(results["skipped"].items()):
+			self.stdout.write(f"skipped {view_name}: {reason}")
+
+		if options["output"]:
+			with open(options["output"], "w") as f:
+				json.dump(results, f, indent=2, sort_keys=True)
+			self.stdout.write(self.style.SUCCESS(f"Wrote {len(results['endpoints'])} endpoints to {options['output']}."))
+
+		if baseline is not None:
+			regressions = compare(
+				baseline, results,
+				latency_threshold=options["latency_threshold"], query_threshold=options["query_threshold"],
+			)
+			if regressions:
+				raise CommandError("Endpoint regressions:\n" + "\n".join(regressions))
+			self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,534 @@
+"""
+Synthetic school generator behind ``manage.py seed_school``.
+
+One unit of ``scale`` is a cohort of ``STUDENTS_PER_SCALE`` students spread
+over twelve grades, with sections, teachers and fees sized to match. Students
+move up a grade each academic year, so three years at scale 100 give roughly
+a million attendance rows. Every table is written with ``bulk_create`` from
+generators in ``batch_size`` chunks, and ids are read back by natural key, so
+memory stays flat whatever the scale. Model ``save()`` and signals are
+bypassed; derived tables (ledger and attendance rollups, attendance
+bitmaps, dashboard snapshots) are rebuilt once at the end.
+"""
+import math
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from users.models import User
+from admission.models import Guardian, AdmissionApplication
+from students.models import StudentProfile, Enrollment, TeacherAssignment
+from attendance.models import Attendance
+from attendance.bitmaps import rebuild_bitmaps
+from attendance.rollup import rebuild_attendance_rollup
+from exams.models import Exam, ExamResult
+from finance.models import FeeStructure, FeePayment, Invoice, InvoiceItem, InvoiceSequence, PaymentAllocation, Expense, Budget
+from finance.accounts import rebuild_student_accounts
+from finance.cube import rebuild_expense_cube
+from finance.ledger import rebuild_ledger
+from dashboards.signals import models_changed
+from staff.models import Department, StaffProfile, Leave, Payroll, Attendance as StaffAttendance
+from .models import AcademicYear, Term, SchoolClass, Section, Subject
+
+STUDENTS_PER_SCALE = 25
+GRADES = 12
+SECTION_SIZE = 35
+
+TERMS = (
+	# name, (month, day) start, (month, day) end, start in the second calendar year
+	("Term 1", (9, 1), (12, 15), False),
+	("Term 2", (1, 6), (4, 4), True),
+	("Term 3", (4, 21), (7, 31), True),
+)
+
+SUBJECTS = (
+	("Mathematics", "MAT", "Sciences"),
+	("English", "ENG", "Languages"),
+	("Kiswahili", "KIS", "Languages"),
+	("Biology", "BIO", "Sciences"),
+	("Chemistry", "CHE", "Sciences"),
+	("Physics", "PHY", "Sciences"),
+	("History", "HIS", "Humanities"),
+	("Geography", "GEO", "Humanities"),
+)
+
+DEPARTMENTS = (
+	("Sciences", "SCI"),
+	("Languages", "LAN"),
+	("Humanities", "HUM"),
+	("Administration", "ADM"),
+)
+
+FIRST_NAMES = ("Amina", "Brian", "Chloe", "David", "Esther", "Felix", "Grace", "Hassan", "Irene", "James", "Kevin", "Lucy", "Mercy", "Nathan", "Olivia", "Peter")
+LAST_NAMES = ("Achieng", "Barasa", "Chebet", "Deng", "Emuria", "Faraji", "Gatwech", "Haji", "Ismail", "Juma", "Kamau", "Lado", "Mwangi", "Njeri", "Okello", "Wani")
+
+PAYMENT_METHODS = ("cash", "bank_transfer", "mobile_money", "cheque", "card")
+EXPENSE_CATEGORIES = (("utilities", 600), ("maintenance", 400), ("supplies", 500), ("marketing", 150), ("other", 200))
+
+
+def batched(iterable, size):
+	iterator = iter(iterable)
+	while batch := list(islice(iterator, size)):
+		yield batch
+
+
+def school_days(start, end):
+	day = start
+	while day <= end:
+		if day.weekday() < 5:
+			yield day
+		day += timedelta(days=1)
+
+
+def grade_for(marks):
+	for threshold, grade in ((80, "A"), (70, "B"), (60, "C"), (50, "D"), (40, "E")):
+		if marks >= threshold:
+			return grade
+	return "F"
+
+
+class SchoolSeeder:
+	def __init__(self, scale=1, years=3, seed=0, batch_size=5000, password="password", today=None, log=None):
+		self.scale = scale
+		self.years_count = years
+		self.rng = random.Random(seed)
+		self.batch_size = batch_size
+		self.password = make_password(password)
+		self.today = today or date.today()
+		self.log = log or (lambda message: None)
+		self.counts = {}
+
+	def create(self, model, objects):
+		"""Write ``objects`` in streamed batches and return how many rows were created"""
+		created = 0
+		for batch in batched(objects, self.batch_size):
+			model.objects.bulk_create(batch)
+			created += len(batch)
+		label = model._meta.label
+		self.counts[label] = self.counts.get(label, 0) + created
+		return created
+
+	def run(self):
+		steps = (
+			self.seed_calendar, self.seed_classes, self.seed_staff, self.seed_students,
+			self.seed_attendance, self.seed_exams, self.seed_finance, self.seed_hr, self.seed_admissions,
+		)
+		with transaction.atomic():
+			for step in steps:
+				step()
+				self.log(f"{step.__name__} done")
+			rebuild_ledger()
+			rebuild_expense_cube()
+			rebuild_student_accounts()
+			rebuild_attendance_rollup()
+			rebuild_bitmaps()
+			models_changed(*(apps.get_model(label) for label in self.counts))
+		return self.counts
+
+	# Calendar and classes
+
+	def seed_calendar(self):
+		current = self.today.year if self.today.month >= 9 else self.today.year - 1
+		starts = [current - offset for offset in range(self.years_count - 1, -1, -1)]
+		self.create(AcademicYear, (
+			AcademicYear(
+				name=f"{year}/{year + 1}", start_date=date(year, 9, 1), end_date=date(year + 1, 8, 31),
+				is_active=year == current,
+			)
+			for year in starts
+		))
+		self.years = list(AcademicYear.objects.order_by("start_date"))
+
+		terms = []
+		for year in self.years:
+			for name, (start_month, start_day), (end_month, end_day), second_half in TERMS:
+				calendar_year = year.start_date.year + (1 if second_half else 0)
+				start = date(calendar_year, start_month, start_day)
+				end = date(calendar_year, end_month, end_day)
+				terms.append(Term(
+					academic_year=year, name=name, start_date=start, end_date=end,
+					is_active=start <= self.today <= end,
+				))
+		self.create(Term, terms)
+		self.terms = {year.pk: [] for year in self.years}
+		for term in Term.objects.order_by("start_date"):
+			self.terms[term.academic_year_id].append(term)
+
+	def seed_classes(self):
+		self.students_count = STUDENTS_PER_SCALE * self.scale
+		self.sections_per_class = max(1, math.ceil(self.students_count / (GRADES * SECTION_SIZE)))
+
+		self.create(SchoolClass, (
+			SchoolClass(name=f"Grade {level}", code=f"G{level:02d}", level=level)
+			for level in range(1, GRADES + 1)
+		))
+		self.classes = {c.level: c for c in SchoolClass.objects.all()}
+
+		self.create(Section, (
+			Section(school_class=school_class, name=chr(ord("A") + index % 26) + (str(index // 26) if index >= 26 else ""))
+			for school_class in self.classes.values()
+			for index in range(self.sections_per_class)
+		))
+		self.sections = {}
+		for section in Section.objects.order_by("school_class__level", "pk"):
+			self.sections.setdefault(section.school_class_id, []).append(section)
+
+		self.create(Subject, (Subject(name=name, code=code) for name, code, _ in SUBJECTS))
+		self.subjects = list(Subject.objects.order_by("pk"))
+		through = Subject.school_classes.through
+		self.create(through, (
+			through(subject_id=subject.pk, schoolclass_id=school_class.pk)
+			for subject in self.subjects
+			for school_class in self.classes.values()
+		))
+
+	# People
+
+	def person(self):
+		return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+	def seed_staff(self):
+		self.create(Department, (Department(name=name, code=code) for name, code in DEPARTMENTS))
+		departments = {d.name: d for d in Department.objects.all()}
+
+		teachers_count = max(len(SUBJECTS), GRADES * self.sections_per_class)
+		accounts = [("admin", "admin", "Administration", "Principal", True)]
+		accounts += [("accountant", f"accountant{n}", "Administration", "Accountant", False) for n in range(1, 3)]
+		accounts += [("hr", "hr", "Administration", "HR Officer", False)]
+		accounts += [
+			("teacher", f"teacher{n}", SUBJECTS[(n - 1) % len(SUBJECTS)][2], "Teacher", False)
+			for n in range(1, teachers_count + 1)
+		]
+
+		users = []
+		for role, handle, _, _, is_admin in accounts:
+			first_name, last_name = self.person()
+			users.append(User(
+				email=f"{handle}@seed.school.test", first_name=first_name, last_name=last_name, role=role,
+				password=self.password, is_verified=True, is_staff=is_admin, is_superuser=is_admin,
+			))
+		self.create(User, users)
+		by_email = dict(User.objects.filter(email__endswith="@seed.school.test").values_list("email", "pk"))
+
+		self.create(StaffProfile, (
+			StaffProfile(
+				user_id=by_email[f"{handle}@seed.school.test"],
+				employee_id=f"EMP{index:06d}",
+				date_of_birth=date(1970 + self.rng.randrange(30), self.rng.randint(1, 12), self.rng.randint(1, 28)),
+				gender=self.rng.choice(("male", "female")),
+				address=f"{index} School Road",
+				city="Juba",
+				emergency_contact_name=" ".join(self.person()),
+				emergency_contact_phone=f"+211900{index:06d}",
+				emergency_contact_relationship="Spouse",
+				department=departments[department],
+				position=position,
+				date_of_joining=self.years[0].start_date - timedelta(days=self.rng.randrange(2000)),
+				years_of_experience=self.rng.randrange(25),
+				basic_salary=Decimal(40000 + self.rng.randrange(0, 40000, 500)),
+			)
+			for index, (role, handle, department, position, _) in enumerate(accounts, start=1)
+		))
+
+		self.admin_id = by_email["admin@seed.school.test"]
+		self.accountant_id = by_email["accountant1@seed.school.test"]
+		self.hr_id = by_email["hr@seed.school.test"]
+		self.teacher_ids = [by_email[f"teacher{n}@seed.school.test"] for n in range(1, teachers_count + 1)]
+		self.staff = list(StaffProfile.objects.values_list("pk", "basic_salary"))
+
+		sections = [section for level in sorted(self.classes) for section in self.sections[self.classes[level].pk]]
+		for section, teacher_id in zip(sections, self.teacher_ids):
+			section.class_teacher_id = teacher_id
+		Section.objects.bulk_update(sections, ["class_teacher"], batch_size=self.batch_size)
+		self.class_teacher = {section.pk: section.class_teacher_id for section in sections}
+
+		self.create(TeacherAssignment, (
+			TeacherAssignment(
+				teacher_id=self.teacher_ids[(level + index) % len(self.teacher_ids)],
+				subject=subject, school_class=self.classes[level], academic_year=year,
+			)
+			for year in self.years
+			for level in self.classes
+			for index, subject in enumerate(self.subjects)
+		))
+
+	def seed_students(self):
+		self.create(Guardian, (
+			Guardian(
+				first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+				phone=f"+211920{n:06d}", relationship=self.rng.choice(("Mother", "Father", "Guardian")),
+			)
+			for n in range(1, self.students_count + 1)
+		))
+		guardians = dict(Guardian.objects.filter(phone__startswith="+211920").values_list("phone", "pk"))
+
+		first_start = self.years[0].start_date
+		self.create(StudentProfile, (
+			StudentProfile(
+				admission_number=f"ADM{n:06d}",
+				first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+				dob=date(first_start.year - 6 - (n % GRADES), self.rng.randint(1, 12), self.rng.randint(1, 28)),
+				gender=self.rng.choice(("male", "female")),
+				guardian_id=guardians[f"+211920{n:06d}"],
+			)
+			for n in range(1, self.students_count + 1)
+		))
+		students = dict(StudentProfile.objects.filter(admission_number__startswith="ADM").values_list("admission_number", "pk"))
+
+		# Each student is spread over the grades by the level they reach in the
+		# final year and moves up one grade per year; earlier years only hold
+		# the students who had already joined.
+		self.placements = {}
+		for n in range(1, self.students_count + 1):
+			self.placements[students[f"ADM{n:06d}"]] = ((n - 1) % GRADES + 1, (n - 1) // GRADES % self.sections_per_class)
+
+		def enrollments():
+			for index, year in enumerate(self.years):
+				for student_id, (final_level, section_index) in self.placements.items():
+					level = final_level - (len(self.years) - 1 - index)
+					if level >= 1:
+						school_class = self.classes[level]
+						yield Enrollment(
+							student_id=student_id, academic_year=year, school_class=school_class,
+							section=self.sections[school_class.pk][section_index],
+							is_active=year.is_active,
+						)
+		self.create(Enrollment, enrollments())
+
+		# Ability drives exam marks; absence rate drives attendance (a few
+		# chronic absentees keep at-risk reports interesting).
+		self.ability = {student_id: self.rng.gauss(62, 12) for student_id in self.placements}
+		self.absence = {
+			student_id: self.rng.choices((0.03, 0.1, 0.3), weights=(85, 10, 5))[0]
+			for student_id in self.placements
+		}
+
+	def enrolled(self, year):
+		return Enrollment.objects.filter(academic_year=year).order_by("pk").values_list(
+			"pk", "student_id", "school_class_id", "section_id"
+		)
+
+	# Attendance and exams
+
+	def attendance_status(self, student_id):
+		roll = self.rng.random()
+		rate = self.absence[student_id]
+		if roll < rate:
+			return "excused" if roll < rate * 0.15 else "absent"
+		if roll < rate + 0.04:
+			return "late"
+		return "present"
+
+	def seed_attendance(self):
+		def rows():
+			for year in self.years:
+				enrolled = list(self.enrolled(year))
+				for term in self.terms[year.pk]:
+					for day in school_days(term.start_date, min(term.end_date, self.today)):
+						for enrollment_id, student_id, class_id, section_id in enrolled:
+							yield Attendance(
+								student_id=student_id, enrollment_id=enrollment_id, academic_year_id=year.pk,
+								term_id=term.pk, school_class_id=class_id, section_id=section_id, date=day,
+								status=self.attendance_status(student_id), marked_by_id=self.class_teacher[section_id],
+							)
+		self.create(Attendance, rows())
+
+	def seed_exams(self):
+		self.create(Exam, (
+			Exam(
+				name=f"{term.name} Exam", academic_year=year, term=term, school_class=school_class,
+				subject=subject, date=term.end_date - timedelta(days=14 - index), total_marks=100,
+			)
+			for year in self.years
+			for term in self.terms[year.pk]
+			for school_class in self.classes.values()
+			for index, subject in enumerate(self.subjects)
+		))
+
+		def results():
+			for year in self.years:
+				by_class = {}
+				for _, student_id, class_id, _ in self.enrolled(year):
+					by_class.setdefault(class_id, []).append(student_id)
+				exams = Exam.objects.filter(academic_year=year, date__lte=self.today).values_list("pk", "school_class_id")
+				for exam_id, class_id in exams.iterator():
+					for student_id in by_class.get(class_id, ()):
+						marks = max(0, min(100, round(self.rng.gauss(self.ability[student_id], 8))))
+						yield ExamResult(
+							exam_id=exam_id, student_id=student_id,
+							marks_obtained=Decimal(marks), grade=grade_for(marks),
+						)
+		self.create(ExamResult, results())
+
+	# Finance
+
+	def seed_finance(self):
+		self.create(FeeStructure, (
+			fee
+			for year in self.years
+			for level, school_class in self.classes.items()
+			for fee in (
+				FeeStructure(
+					name="Tuition", school_class=school_class, academic_year=year,
+					amount=Decimal(15000 + 1000 * level), frequency="termly",
+				),
+				FeeStructure(
+					name="Activity", school_class=school_class, academic_year=year,
+					amount=Decimal(2500), frequency="termly", is_mandatory=False,
+				),
+			)
+		))
+		fees = {}
+		for fee in FeeStructure.objects.all():
+			fees.setdefault((fee.academic_year_id, fee.school_class_id), []).append(fee)
+
+		# 70% of families pay in full, 20% pay half, 10% pay nothing
+		payer = {student_id: self.rng.choices((1, Decimal("0.5"), 0), weights=(70, 20, 10))[0] for student_id in self.placements}
+		for year in self.years:
+			enrolled = list(self.enrolled(year))
+			for term in self.terms[year.pk]:
+				if term.start_date > self.today:
+					continue
+				issue_date, due_date = term.start_date, term.start_date + timedelta(days=30)
+
+				numbers = iter(InvoiceSequence.allocate(issue_date.year, len(enrolled)))
+
+				def invoices():
+					for _, student_id, class_id, _ in enrolled:
+						total = sum(fee.amount for fee in fees[(year.pk, class_id)])
+						paid = (total * payer[student_id]).quantize(Decimal("0.01"))
+						balance = total - paid
+						if balance <= 0:
+							status = "paid"
+						else:
+							status = "overdue" if due_date < self.today else "sent"
+						yield Invoice(
+							invoice_number=next(numbers), student_id=student_id,
+							academic_year=year, term=term, issue_date=issue_date, due_date=due_date,
+							total_amount=total, paid_amount=paid, balance=balance, status=status,
+							created_by_id=self.accountant_id,
+						)
+				self.create(Invoice, invoices())
+
+				classes = {student_id: class_id for _, student_id, class_id, _ in enrolled}
+				term_invoices = list(Invoice.objects.filter(term=term).values_list("pk", "student_id", "paid_amount"))
+				self.create(InvoiceItem, (
+					InvoiceItem(invoice_id=invoice_id, fee_structure=fee, description=fee.name, amount=fee.amount)
+					for invoice_id, student_id, _ in term_invoices
+					for fee in fees[(year.pk, classes[student_id])]
+				))
+				self.create(FeePayment, (
+					FeePayment(
+						student_id=student_id, fee_structure=fees[(year.pk, classes[student_id])][0], term=term,
+						amount_paid=paid, payment_date=min(issue_date + timedelta(days=self.rng.randrange(40)), self.today),
+						payment_method=self.rng.choice(PAYMENT_METHODS),
+						transaction_reference=f"SEED-{invoice_id:010d}", recorded_by_id=self.accountant_id,
+					)
+					for invoice_id, student_id, paid in term_invoices
+					if paid > 0
+				))
+				# Each seeded payment settles exactly the invoice its reference names
+				self.create(PaymentAllocation, (
+					PaymentAllocation(payment_id=payment_id, invoice_id=int(reference[len("SEED-"):]), amount=amount)
+					for payment_id, reference, amount in FeePayment.objects.filter(
+						term=term, transaction_reference__startswith="SEED-"
+					).values_list("pk", "transaction_reference", "amount_paid")
+				))
+
+		def expenses():
+			for month_start in self.months():
+				payroll = sum(salary for _, salary in self.staff)
+				yield Expense(
+					category="salaries", amount=payroll, description=f"Payroll {month_start:%B %Y}",
+					expense_date=month_start.replace(day=28), recorded_by_id=self.accountant_id,
+				)
+				for category, base in EXPENSE_CATEGORIES:
+					for _ in range(self.rng.randint(1, 4)):
+						yield Expense(
+							category=category,
+							amount=Decimal(base * self.scale * self.rng.randint(5, 20)),
+							description=f"{category.title()} {month_start:%B %Y}",
+							expense_date=month_start + timedelta(days=self.rng.randrange(27)),
+							recorded_by_id=self.accountant_id,
+						)
+		self.create(Expense, expenses())
+
+		self.create(Budget, (
+			Budget(
+				academic_year=year, created_by_id=self.admin_id,
+				total_budget=(sum(salary for _, salary in self.staff) * 12 * Decimal("1.4")).quantize(Decimal("1")),
+			)
+			for year in self.years
+		))
+
+	def months(self):
+		"""First day of every month from the first academic year up to today"""
+		month = self.years[0].start_date
+		while month <= self.today:
+			yield month
+			month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+	# HR and admissions
+
+	def seed_hr(self):
+		def staff_attendance():
+			for day in school_days(self.years[0].start_date, self.today):
+				for staff_id, _ in self.staff:
+					status = self.rng.choices(("present", "late", "absent", "on_leave"), weights=(90, 5, 3, 2))[0]
+					yield StaffAttendance(staff_id=staff_id, date=day, status=status, recorded_by_id=self.hr_id)
+		self.create(StaffAttendance, staff_attendance())
+
+		def leaves():
+			for year in self.years:
+				for staff_id, _ in self.staff:
+					for _ in range(self.rng.randint(0, 2)):
+						start = year.start_date + timedelta(days=self.rng.randrange(330))
+						status = "pending" if start > self.today else self.rng.choices(
+							("approved", "rejected", "cancelled"), weights=(80, 15, 5)
+						)[0]
+						yield Leave(
+							staff_id=staff_id, leave_type=self.rng.choice(("sick", "casual", "annual", "study")),
+							start_date=start, end_date=start + timedelta(days=self.rng.randrange(1, 10)),
+							reason="Seeded leave", status=status,
+							approved_by_id=self.hr_id if status == "approved" else None,
+						)
+		self.create(Leave, leaves())
+
+		def payrolls():
+			for year in self.years:
+				terms = self.terms[year.pk]
+				for month_start in self.months():
+					if not year.start_date <= month_start <= year.end_date:
+						continue
+					term = next((t for t in reversed(terms) if t.start_date <= month_start), terms[0])
+					for staff_id, salary in self.staff:
+						allowances = (salary * Decimal("0.1")).quantize(Decimal("0.01"))
+						deductions = (salary * Decimal("0.15")).quantize(Decimal("0.01"))
+						yield Payroll(
+							staff_id=staff_id, academic_year=year, term=term,
+							month=month_start.month, year=month_start.year, basic_salary=salary,
+							allowances=allowances, deductions=deductions,
+							net_salary=salary + allowances - deductions,
+							payment_date=month_start.replace(day=28), status="paid", processed_by_id=self.hr_id,
+						)
+		self.create(Payroll, payrolls())
+
+	def seed_admissions(self):
+		guardians = list(Guardian.objects.values_list("pk", flat=True)[:self.students_count])
+		statuses = [status for status, _ in AdmissionApplication.STATUS_CHOICES]
+		self.create(AdmissionApplication, (
+			AdmissionApplication(
+				first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+				dob=date(year.start_date.year - 6 - self.rng.randrange(GRADES), self.rng.randint(1, 12), self.rng.randint(1, 28)),
+				gender=self.rng.choice(("male", "female")),
+				preferred_class=self.classes[self.rng.randint(1, GRADES)], preferred_academic_year=year,
+				guardian_id=self.rng.choice(guardians), status=self.rng.choice(statuses),
+			)
+			for year in self.years
+			for _ in range(max(1, self.students_count // GRADES))
+		))
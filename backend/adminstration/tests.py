@@ -1,2 +1,86 @@
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
 from django.test import TestCase
 
+from users.models import User
+from students.models import StudentProfile, Enrollment
+from attendance.models import Attendance
+from finance.models import Invoice, LedgerDailyRollup
+from staff.models import Department, StaffProfile
+from .benchmark import compare, discover_endpoints, run_benchmark
+from .models import AcademicYear
+from .seed import SchoolSeeder, STUDENTS_PER_SCALE
+
+
+class SeedSchoolTests(TestCase):
+	def test_seeds_a_consistent_school(self):
+		counts = SchoolSeeder(scale=1, years=2, today=date(2025, 10, 15)).run()
+
+		self.assertEqual(AcademicYear.objects.count(), 2)
+		self.assertEqual(StudentProfile.objects.count(), STUDENTS_PER_SCALE)
+		self.assertEqual(counts["attendance.Attendance"], Attendance.objects.count())
+		self.assertFalse(Attendance.objects.filter(date__gt=date(2025, 10, 15)).exists())
+		self.assertFalse(Attendance.objects.exclude(enrollment__academic_year=F("academic_year")).exists())
+
+		# Three terms invoiced last year, only the first one so far this year
+		previous = Enrollment.objects.filter(academic_year__name="2024/2025").count()
+		current = Enrollment.objects.filter(academic_year__name="2025/2026").count()
+		self.assertEqual(Invoice.objects.count(), previous * 3 + current)
+		self.assertTrue(LedgerDailyRollup.objects.filter(kind="revenue").exists())
+
+	def test_command_refuses_a_populated_database(self):
+		call_command("seed_school", scale=1, years=1, stdout=StringIO())
+		with self.assertRaisesMessage(CommandError, "needs an empty database"):
+			call_command("seed_school", stdout=StringIO())
+
+
+class BenchmarkTests(TestCase):
+	def setUp(self):
+		self.admin = User.objects.create_user(
+			email="admin@example.com", first_name="A", last_name="D", role="admin", password="pw"
+		)
+
+	def add_department(self, code, staff):
+		department = Department.objects.create(name=code, code=code, head=self.admin)
+		for n in range(staff):
+			user = User.objects.create_user(
+				email=f"{code}{n}@example.com", first_name="T", last_name=str(n), role="teacher", password="pw"
+			)
+			StaffProfile.objects.create(
+				user=user, employee_id=f"{code}{n}", date_of_birth=date(1980, 1, 1), gender="female",
+				address="1 Road", city="Juba", emergency_contact_name="X", emergency_contact_phone="1",
+				emergency_contact_relationship="Spouse", department=department, position="Teacher",
+				date_of_joining=date(2020, 1, 1), basic_salary=1000,
+			)
+
+	def test_department_list_runs_a_constant_number_of_queries(self):
+		self.add_department("SCI", 2)
+		small = run_benchmark(self.admin, runs=1, warmup=0, include="^department-")
+		self.add_department("HUM", 3)
+		self.add_department("LAN", 1)
+		large = run_benchmark(self.admin, runs=1, warmup=0, include="^department-")
+
+		self.assertEqual(large["endpoints"]["department-list"]["status"], 200)
+		self.assertEqual(large["endpoints"]["department-list"]["queries"], 1)
+		self.assertEqual(compare(small, large, latency_threshold=100), [])
+
+	def test_compare_reports_query_and_latency_regressions(self):
+		baseline = {"endpoints": {"a": {"status": 200, "p95_ms": 10.0, "queries": 3}}}
+		current = {"endpoints": {"a": {"status": 200, "p95_ms": 40.0, "queries": 12}}}
+		self.assertEqual(compare(baseline, current), ["a: queries 3 -> 12", "a: p95 10.0 ms -> 40.0 ms"])
+		self.assertEqual(compare(baseline, current, latency_threshold=5, query_threshold=10), [])
+
+	def test_discovery_covers_both_attendance_apps_and_fills_action_params(self):
+		SchoolSeeder(scale=1, years=1, today=date(2025, 10, 15)).run()
+		endpoints, skipped = discover_endpoints()
+		paths = dict(endpoints)
+
+		self.assertEqual(paths["attendance-list"], "/api/attendance/attendances/")
+		self.assertEqual(paths["staff-attendance-list"], "/api/staff/attendance/")
+		self.assertNotIn("attendance-list", skipped)
+		self.assertRegex(paths["attendance-percentages"], r"\?term=\d+$")
+		self.assertRegex(paths["attendance-class-attendance"], r"\?class_id=\d+&date=\d{4}-\d{2}-\d{2}$")
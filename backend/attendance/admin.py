@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Attendance
+from .models import Attendance, AttendanceDailyRollup, AttendanceRiskFlag, AttendanceSyncRecord
 
 
 @admin.register(Attendance)
@@ -9,4 +9,32 @@ class AttendanceAdmin(admin.ModelAdmin):
     search_fields = ('student__first_name', 'student__last_name', 'student__admission_number')
     ordering = ('-date', 'student__first_name')
     date_hierarchy = 'date'
+    # Skip the unfiltered COUNT(*) over the whole table on every changelist page
+    show_full_result_count = False
 
+
+@admin.register(AttendanceDailyRollup)
+class AttendanceDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'school_class', 'section', 'status', 'count', 'term')
+    list_filter = ('status', 'academic_year', 'term', 'school_class')
+    ordering = ('-date', 'school_class', 'section', 'status')
+    date_hierarchy = 'date'
+    readonly_fields = ('updated_at',)
+
+
+
+@admin.register(AttendanceRiskFlag)
+class AttendanceRiskFlagAdmin(admin.ModelAdmin):
+    list_display = ('student', 'term', 'school_class', 'percentage', 'longest_absence_streak', 'monday_friday_absences')
+    list_filter = ('term', 'school_class')
+    search_fields = ('student__first_name', 'student__last_name', 'student__admission_number')
+    readonly_fields = ('flagged_at',)
+
+
+@admin.register(AttendanceSyncRecord)
+class AttendanceSyncRecordAdmin(admin.ModelAdmin):
+    list_display = ('student', 'date', 'status', 'previous_status', 'outcome', 'client_timestamp', 'device_id', 'synced_by')
+    list_filter = ('outcome', 'status')
+    search_fields = ('student__first_name', 'student__last_name', 'student__admission_number', 'device_id')
+    date_hierarchy = 'received_at'
+    readonly_fields = ('received_at',)
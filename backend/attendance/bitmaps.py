@@ -0,0 +1,179 @@
+"""
+Per-student attendance bitmaps.
+
+Each ``AttendanceBitmap`` stores a student's term as four bit-planes over the
+term's school days (Monday to Friday from the term start): ``marked``,
+``present``, ``absent`` and ``late``; excused days are marked days in none of
+the other planes. Planes are little-endian blobs decoded into Python ints, so
+percentages are popcounts and streaks are shift-and-AND run lengths over the
+whole term at once. A whole-school report reads one small row per student
+instead of every Attendance row. Marks on weekends are not represented.
+"""
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+
+from adminstration.models import Term
+from .models import Attendance, AttendanceBitmap
+
+PLANES = ('marked', 'present', 'absent', 'late')
+
+
+def school_day_index(start, day):
+    """Return how many weekdays lie in [start, day), or None if ``day`` is not a school day in range"""
+    if day < start or day.weekday() >= 5:
+        return None
+    weeks, rest = divmod((day - start).days, 7)
+    return weeks * 5 + sum(1 for offset in range(rest) if (start.weekday() + offset) % 7 < 5)
+
+
+def school_days_between(start, end):
+    index = school_day_index(start, end)
+    if index is not None:
+        return index + 1
+    # Step back to the last weekday on or before ``end``
+    while end >= start and end.weekday() >= 5:
+        end -= timedelta(days=1)
+    return school_day_index(start, end) + 1 if end >= start else 0
+
+
+def encode(value, days):
+    return value.to_bytes((days + 7) // 8 or 1, 'little')
+
+
+def decode(blob):
+    return int.from_bytes(bytes(blob), 'little')
+
+
+def build_planes(start, marks, days):
+    """Build ``{plane: int}`` from ``(date, status)`` marks of one student-term of ``days`` school days"""
+    planes = dict.fromkeys(PLANES, 0)
+    for day, status in marks:
+        index = school_day_index(start, day)
+        # Marks outside the term have no bit
+        if index is None or index >= days:
+            continue
+        bit = 1 << index
+        planes['marked'] |= bit
+        if status in planes:
+            planes[status] |= bit
+    return planes
+
+
+def _bitmap(student_id, term, marks):
+    days = school_days_between(term.start_date, term.end_date)
+    planes = build_planes(term.start_date, marks, days)
+    return AttendanceBitmap(
+        student_id=student_id, term_id=term.pk, start_date=term.start_date, days=days,
+        **{plane: encode(planes[plane], days) for plane in PLANES}
+    )
+
+
+def refresh_bitmaps(pairs):
+    """Recompute the bitmaps of the given ``(student_id, term_id)`` pairs from Attendance"""
+    pairs = {(student_id, term_id) for student_id, term_id in pairs if student_id and term_id}
+    if not pairs:
+        return
+
+    students = {student_id for student_id, _ in pairs}
+    terms = Term.objects.in_bulk({term_id for _, term_id in pairs})
+    marks = {pair: [] for pair in pairs}
+    rows = Attendance.objects.filter(student_id__in=students, term_id__in=terms).values_list(
+        'student_id', 'term_id', 'date', 'status'
+    )
+    for student_id, term_id, day, status in rows:
+        if (student_id, term_id) in marks:
+            marks[(student_id, term_id)].append((day, status))
+
+    bitmaps = [
+        _bitmap(student_id, terms[term_id], pair_marks)
+        for (student_id, term_id), pair_marks in marks.items()
+        if pair_marks and term_id in terms
+    ]
+    empty = [pair for pair, pair_marks in marks.items() if not pair_marks]
+
+    with transaction.atomic(savepoint=False):
+        if empty:
+            AttendanceBitmap.objects.filter(
+                reduce(or_, (Q(student_id=student_id, term_id=term_id) for student_id, term_id in empty))
+            ).delete()
+        if bitmaps:
+            AttendanceBitmap.objects.bulk_create(
+                bitmaps,
+                update_conflicts=True,
+                unique_fields=['student', 'term'],
+                update_fields=['start_date', 'days', *PLANES, 'updated_at'],
+            )
+
+
+def rebuild_bitmaps(batch_size=1000):
+    """Recompute every bitmap, streaming Attendance ordered by student and term"""
+    AttendanceBitmap.objects.all().delete()
+    terms = Term.objects.in_bulk()
+    rows = Attendance.objects.order_by('student_id', 'term_id').values_list('student_id', 'term_id', 'date', 'status')
+
+    created, batch, current, marks = 0, [], None, []
+    for student_id, term_id, day, status in rows.iterator(chunk_size=batch_size * 10):
+        if (student_id, term_id) != current:
+            if current is not None:
+                batch.append(_bitmap(current[0], terms[current[1]], marks))
+            current, marks = (student_id, term_id), []
+        marks.append((day, status))
+        if len(batch) >= batch_size:
+            created += len(AttendanceBitmap.objects.bulk_create(batch))
+            batch = []
+    if current is not None:
+        batch.append(_bitmap(current[0], terms[current[1]], marks))
+    if batch:
+        created += len(AttendanceBitmap.objects.bulk_create(batch))
+    return created
+
+
+def longest_run(bits):
+    """Length of the longest run of consecutive set bits"""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+def window_mask(start, until, days):
+    """Mask of the last ``days`` school days up to and including ``until``"""
+    end = school_days_between(start, until)
+    begin = max(0, end - days)
+    return ((1 << end) - 1) ^ ((1 << begin) - 1)
+
+
+def bitmap_stats(bitmap, last=None, until=None):
+    """
+    Summarise one bitmap row: day counts per status, attendance percentage
+    (present or late over marked days), the longest absence streak in school
+    days and, with ``last``, absences in the last ``last`` school days up to
+    ``until``.
+    """
+    marked, present, absent, late = (decode(getattr(bitmap, plane)) for plane in PLANES)
+    marked_days = marked.bit_count()
+    attended = (present | late).bit_count()
+    stats = {
+        'student': bitmap.student_id,
+        'term': bitmap.term_id,
+        'marked_days': marked_days,
+        'present': present.bit_count(),
+        'absent': absent.bit_count(),
+        'late': late.bit_count(),
+        'excused': (marked & ~(present | absent | late)).bit_count(),
+        'percentage': round(100 * attended / marked_days, 2) if marked_days else None,
+        'longest_absence_streak': longest_run(absent),
+    }
+    if last:
+        mask = window_mask(bitmap.start_date, until, last)
+        stats['recent'] = {
+            'days': last,
+            'marked': (marked & mask).bit_count(),
+            'absent': (absent & mask).bit_count(),
+        }
+    return stats
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from adminstration.models import Term
+from attendance.risk import flag_at_risk_students
+
+
+class Command(BaseCommand):
+    help = "Flag chronically absent students for a term (default: the term covering today); run nightly"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--term", type=int, help="Term id (default: the term covering today)")
+        parser.add_argument("--min-percentage", type=float, help="Flag attendance below this percentage")
+        parser.add_argument("--max-absence-streak", type=int, help="Flag this many consecutive absences")
+        parser.add_argument("--monday-friday-absences", type=int, help="Flag this many Monday/Friday absences")
+        parser.add_argument("--min-marked-days", type=int, help="Skip students with fewer marked days")
+
+    def handle(self, *args, **options):
+        if options["term"]:
+            term = Term.objects.filter(pk=options["term"]).first()
+        else:
+            today = timezone.localdate()
+            term = Term.objects.filter(start_date__lte=today, end_date__gte=today).first()
+        if term is None:
+            raise CommandError("No such term, and no term covers today.")
+
+        flags = flag_at_risk_students(
+            term,
+            min_percentage=options["min_percentage"],
+            max_absence_streak=options["max_absence_streak"],
+            monday_friday_absences=options["monday_friday_absences"],
+            min_marked_days=options["min_marked_days"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Flagged {len(flags)} students at risk in {term}."))
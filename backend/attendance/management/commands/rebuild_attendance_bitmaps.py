@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from attendance.bitmaps import rebuild_bitmaps
+from attendance.models import AttendanceBitmap
+from dashboards.signals import models_changed
+
+
+class Command(BaseCommand):
+    help = "Recompute every per-student, per-term attendance bitmap from Attendance"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild_bitmaps()
+            models_changed(AttendanceBitmap)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} attendance bitmaps."))
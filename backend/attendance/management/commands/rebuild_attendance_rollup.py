@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from attendance.rollup import rebuild_attendance_rollup
+from attendance.models import Attendance, AttendanceDailyRollup
+from dashboards.signals import models_changed
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily attendance rollup from Attendance"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild_attendance_rollup()
+            # Cached responses are keyed on the source tables the derived rows come from
+            models_changed(AttendanceDailyRollup, Attendance)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} attendance rollup rows."))
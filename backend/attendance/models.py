@@ -62,6 +62,9 @@ class Attendance(models.Model):
         limit_choices_to={'role__in': ['teacher', 'admin']},
         db_index=True
     )
+    # When the mark was taken: the device clock for offline syncs, otherwise
+    # the server clock. Last-writer-wins conflict resolution compares these.
+    marked_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -72,8 +75,186 @@ class Attendance(models.Model):
             models.Index(fields=['date', 'status']),
             models.Index(fields=['school_class', 'date']),
             models.Index(fields=['academic_year', 'term', 'date']),
+            models.Index(fields=['school_class', 'updated_at']),
         ]
 
     def __str__(self):
         return f"{self.student} - {self.date} - {self.status}"
 
+
+
+class AttendanceDailyRollup(models.Model):
+    """Attendance counts per class, section, day and status, maintained from Attendance writes"""
+    school_class = models.ForeignKey(
+        SchoolClass,
+        on_delete=models.CASCADE,
+        related_name='attendance_rollups'
+    )
+    section = models.ForeignKey(
+        Section,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='attendance_rollups'
+    )
+    # The section id, 0 without one: a NOT NULL stand-in so upserts conflict on section-less groups too
+    section_key = models.PositiveIntegerField(default=0)
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Attendance.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    academic_year = models.ForeignKey(
+        AcademicYear,
+        on_delete=models.CASCADE,
+        related_name='attendance_rollups'
+    )
+    term = models.ForeignKey(
+        Term,
+        on_delete=models.CASCADE,
+        related_name='attendance_rollups'
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date', 'school_class', 'section', 'status']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['school_class', 'section_key', 'date', 'status'],
+                name='unique_attendance_rollup_per_group'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['date', 'status']),
+            models.Index(fields=['academic_year', 'term', 'school_class']),
+        ]
+
+    def __str__(self):
+        return f"{self.school_class} {self.date} {self.status}: {self.count}"
+
+
+class AttendanceBitmap(models.Model):
+    """
+    One student's attendance in one term as bit-planes over the term's school
+    days (bit i is the i-th weekday from the term start). Maintained from
+    Attendance writes; see attendance/bitmaps.py.
+    """
+    student = models.ForeignKey(
+        StudentProfile,
+        on_delete=models.CASCADE,
+        related_name='attendance_bitmaps'
+    )
+    term = models.ForeignKey(
+        Term,
+        on_delete=models.CASCADE,
+        related_name='attendance_bitmaps'
+    )
+    start_date = models.DateField()
+    days = models.PositiveIntegerField()
+    marked = models.BinaryField()
+    present = models.BinaryField()
+    absent = models.BinaryField()
+    late = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['student', 'term'],
+                name='unique_attendance_bitmap_per_student_term'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.student} {self.term}"
+
+
+class AttendanceRiskFlag(models.Model):
+    """A student flagged by the chronic-absenteeism job for a term; see attendance/risk.py"""
+    student = models.ForeignKey(
+        StudentProfile,
+        on_delete=models.CASCADE,
+        related_name='attendance_risk_flags'
+    )
+    term = models.ForeignKey(
+        Term,
+        on_delete=models.CASCADE,
+        related_name='attendance_risk_flags'
+    )
+    school_class = models.ForeignKey(
+        SchoolClass,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='attendance_risk_flags'
+    )
+    section = models.ForeignKey(
+        Section,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='attendance_risk_flags'
+    )
+    reasons = models.JSONField(default=list)
+    percentage = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    marked_days = models.PositiveIntegerField(default=0)
+    absences = models.PositiveIntegerField(default=0)
+    longest_absence_streak = models.PositiveIntegerField(default=0)
+    monday_friday_absences = models.PositiveIntegerField(default=0)
+    flagged_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['percentage', '-longest_absence_streak']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['student', 'term'],
+                name='unique_attendance_risk_flag_per_student_term'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.student} {self.term}: {', '.join(self.reasons)}"
+
+
+class AttendanceSyncRecord(models.Model):
+    """Audit trail of offline attendance mutations and how each was resolved"""
+    OUTCOME_CHOICES = (
+        ('applied', 'Applied'),
+        ('unchanged', 'Unchanged'),
+        ('stale', 'Stale'),
+        ('superseded', 'Superseded'),
+    )
+
+    attendance = models.ForeignKey(
+        Attendance,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='sync_records'
+    )
+    student = models.ForeignKey(
+        StudentProfile,
+        on_delete=models.CASCADE,
+        related_name='attendance_sync_records'
+    )
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Attendance.STATUS_CHOICES)
+    remarks = models.TextField(blank=True, null=True)
+    previous_status = models.CharField(max_length=20, choices=Attendance.STATUS_CHOICES, blank=True, null=True)
+    client_timestamp = models.DateTimeField()
+    device_id = models.CharField(max_length=100, blank=True)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+    synced_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='attendance_sync_records'
+    )
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['student', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.student} {self.date} {self.status} ({self.outcome})"
@@ -0,0 +1,103 @@
+"""
+Chronic-absenteeism detection.
+
+``flag_at_risk_students`` loads a term's attendance bitmaps in one query (one
+row of bits per student, one bit per school day), scores every student with
+popcounts, run lengths and weekday masks over those bit rows, and replaces the
+term's ``AttendanceRiskFlag`` rows with the students that break a rule:
+
+* ``min_percentage``: present-or-late days below this share of marked days;
+* ``max_absence_streak``: this many consecutive school days absent;
+* ``monday_friday_absences``: this many absences on Mondays or Fridays.
+
+Rules default to ``settings.ATTENDANCE_RISK_RULES``; students with fewer than
+``min_marked_days`` marked days are not scored yet.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from dashboards.signals import models_changed
+from students.models import Enrollment
+from .bitmaps import PLANES, decode, longest_run, school_day_index
+from .models import AttendanceBitmap, AttendanceRiskFlag
+
+DEFAULT_RULES = {
+    'min_percentage': 85,
+    'max_absence_streak': 3,
+    'monday_friday_absences': 4,
+    'min_marked_days': 10,
+}
+
+
+def risk_rules(**overrides):
+    rules = {**DEFAULT_RULES, **getattr(settings, 'ATTENDANCE_RISK_RULES', {})}
+    rules.update({key: value for key, value in overrides.items() if value is not None})
+    return rules
+
+
+def weekday_mask(term, weekdays):
+    """Bits of the term's school days falling on the given weekdays (0 = Monday)"""
+    mask = 0
+    day = term.start_date
+    while day <= term.end_date:
+        if day.weekday() in weekdays:
+            mask |= 1 << school_day_index(term.start_date, day)
+        day += timedelta(days=1)
+    return mask
+
+
+def score(planes, rules, edge_days):
+    """Return ``(metrics, reasons)`` for one student's decoded planes"""
+    marked, present, absent, late = planes
+    marked_days = marked.bit_count()
+    attended = (present | late).bit_count()
+    metrics = {
+        'marked_days': marked_days,
+        'absences': absent.bit_count(),
+        'percentage': Decimal(100 * attended / marked_days).quantize(Decimal('0.01')) if marked_days else None,
+        'longest_absence_streak': longest_run(absent),
+        'monday_friday_absences': (absent & edge_days).bit_count(),
+    }
+    if marked_days < rules['min_marked_days']:
+        return metrics, []
+
+    reasons = []
+    if metrics['percentage'] < rules['min_percentage']:
+        reasons.append('low_attendance')
+    if metrics['longest_absence_streak'] >= rules['max_absence_streak']:
+        reasons.append('absence_streak')
+    if metrics['monday_friday_absences'] >= rules['monday_friday_absences']:
+        reasons.append('monday_friday_absences')
+    return metrics, reasons
+
+
+def flag_at_risk_students(term, **rules):
+    """Score every student with a bitmap in ``term`` and persist the flags; returns them"""
+    rules = risk_rules(**rules)
+    edge_days = weekday_mask(term, {0, 4})
+    placements = {
+        student_id: (class_id, section_id)
+        for student_id, class_id, section_id in Enrollment.objects.filter(
+            academic_year_id=term.academic_year_id
+        ).values_list('student_id', 'school_class_id', 'section_id')
+    }
+
+    flags = []
+    rows = AttendanceBitmap.objects.filter(term=term).values_list('student_id', *PLANES)
+    for student_id, *blobs in rows.iterator():
+        metrics, reasons = score([decode(blob) for blob in blobs], rules, edge_days)
+        if reasons:
+            class_id, section_id = placements.get(student_id, (None, None))
+            flags.append(AttendanceRiskFlag(
+                student_id=student_id, term=term, school_class_id=class_id, section_id=section_id,
+                reasons=reasons, **metrics
+            ))
+
+    with transaction.atomic():
+        AttendanceRiskFlag.objects.filter(term=term).delete()
+        AttendanceRiskFlag.objects.bulk_create(flags, batch_size=1000)
+        models_changed(AttendanceRiskFlag)
+    return flags
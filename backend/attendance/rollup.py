@@ -0,0 +1,77 @@
+"""
+Daily attendance rollup.
+
+``AttendanceDailyRollup`` holds one row per (class, section, day, status).
+Attendance writes recompute only the (class, day) groups they touch (see
+``signals.py`` and ``services.upsert_attendance``), upserting their rows and
+deleting the ones that vanished, so summaries and dashboards sum a few rows
+per class-day instead of scanning every mark.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from .models import Attendance, AttendanceDailyRollup
+
+GROUP_FIELDS = ('school_class_id', 'section_id', 'date', 'status')
+
+
+def _rollup_rows(attendances):
+    totals = attendances.values(*GROUP_FIELDS).annotate(
+        total=Count('id'), year=Max('academic_year_id'), term_id=Max('term_id')
+    ).order_by()
+    for row in totals.iterator():
+        yield AttendanceDailyRollup(
+            school_class_id=row['school_class_id'], section_id=row['section_id'],
+            section_key=row['section_id'] or 0, date=row['date'],
+            status=row['status'], count=row['total'], academic_year_id=row['year'], term_id=row['term_id'],
+        )
+
+
+def refresh_attendance_days(groups):
+    """Recompute the rollup rows of the given ``(school_class_id, date)`` groups"""
+    groups = {(class_id, date) for class_id, date in groups if class_id is not None and date is not None}
+    if not groups:
+        return
+
+    by_date = {}
+    for class_id, date in groups:
+        by_date.setdefault(date, set()).add(class_id)
+    condition = reduce(or_, (Q(date=date, school_class_id__in=classes) for date, classes in by_date.items()))
+
+    rows = list(_rollup_rows(Attendance.objects.filter(condition)))
+    fresh = {(row.school_class_id, row.section_key, row.date, row.status) for row in rows}
+    with transaction.atomic(savepoint=False):
+        # Upsert rather than delete and re-insert, so concurrent writers to one class-day cannot collide
+        if rows:
+            AttendanceDailyRollup.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['school_class', 'section_key', 'date', 'status'],
+                update_fields=['count', 'academic_year', 'term', 'updated_at'],
+            )
+        stale = [
+            pk for pk, *key in AttendanceDailyRollup.objects.filter(condition).values_list(
+                'pk', 'school_class_id', 'section_key', 'date', 'status'
+            )
+            if tuple(key) not in fresh
+        ]
+        if stale:
+            AttendanceDailyRollup.objects.filter(pk__in=stale).delete()
+
+
+def rebuild_attendance_rollup(batch_size=1000):
+    """Recompute the whole rollup table from Attendance"""
+    AttendanceDailyRollup.objects.all().delete()
+    created = 0
+    rows = []
+    for row in _rollup_rows(Attendance.objects.all()):
+        rows.append(row)
+        if len(rows) >= batch_size:
+            created += len(AttendanceDailyRollup.objects.bulk_create(rows))
+            rows = []
+    if rows:
+        created += len(AttendanceDailyRollup.objects.bulk_create(rows))
+    return created
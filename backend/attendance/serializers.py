@@ -1,5 +1,6 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Attendance
+from .models import Attendance, AttendanceRiskFlag
 
 
 class AttendanceSerializer(serializers.ModelSerializer):
@@ -14,9 +15,9 @@ class AttendanceSerializer(serializers.ModelSerializer):
             'id', 'student', 'student_name', 'enrollment', 'academic_year',
             'term', 'school_class', 'class_name', 'section', 'section_name',
             'date', 'status', 'remarks', 'marked_by', 'marked_by_name',
-            'created_at', 'updated_at'
+            'marked_at', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at', 'marked_by']
+        read_only_fields = ['created_at', 'updated_at', 'marked_by', 'marked_at']
 
     def get_student_name(self, obj):
         return f"{obj.student.first_name} {obj.student.last_name}"
@@ -26,6 +27,80 @@ class AttendanceSerializer(serializers.ModelSerializer):
             return f"{obj.marked_by.first_name} {obj.marked_by.last_name}"
         return None
 
+    def validate(self, attrs):
+        term = attrs.get('term', getattr(self.instance, 'term', None))
+        day = attrs.get('date', getattr(self.instance, 'date', None))
+        if term is not None and day is not None and not term.start_date <= day <= term.end_date:
+            raise serializers.ValidationError({'date': 'Date is outside the term.'})
+        return attrs
+
     def create(self, validated_data):
         validated_data['marked_by'] = self.context['request'].user
-        return super().create(validated_data)
\ No newline at end of file
+        validated_data['marked_at'] = timezone.now()
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        validated_data['marked_at'] = timezone.now()
+        return super().update(instance, validated_data)
+
+
+class AttendanceMarkSerializer(serializers.Serializer):
+    """One row of a bulk mark; references are checked set-wise in services.mark_attendance"""
+    student = serializers.IntegerField()
+    enrollment = serializers.IntegerField()
+    academic_year = serializers.IntegerField()
+    term = serializers.IntegerField()
+    school_class = serializers.IntegerField()
+    section = serializers.IntegerField(required=False, allow_null=True)
+    date = serializers.DateField()
+    status = serializers.ChoiceField(choices=Attendance.STATUS_CHOICES)
+    remarks = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class RegisterExceptionSerializer(serializers.Serializer):
+    student = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=[c for c in Attendance.STATUS_CHOICES if c[0] != 'present'])
+    remarks = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class AttendanceRegisterSerializer(serializers.Serializer):
+    """A class register: everyone on the roster is present except the listed students"""
+    class_id = serializers.IntegerField()
+    section_id = serializers.IntegerField(required=False, allow_null=True)
+    date = serializers.DateField()
+    exceptions = RegisterExceptionSerializer(many=True, required=False, default=list)
+
+
+class AttendanceRiskFlagSerializer(serializers.ModelSerializer):
+    student_name = serializers.SerializerMethodField()
+    admission_number = serializers.CharField(source='student.admission_number', read_only=True)
+    class_name = serializers.CharField(source='school_class.name', read_only=True, default=None)
+    section_name = serializers.CharField(source='section.name', read_only=True, default=None)
+
+    class Meta:
+        model = AttendanceRiskFlag
+        fields = [
+            'id', 'student', 'student_name', 'admission_number', 'term', 'school_class',
+            'class_name', 'section', 'section_name', 'reasons', 'percentage', 'marked_days',
+            'absences', 'longest_absence_streak', 'monday_friday_absences', 'flagged_at'
+        ]
+
+    def get_student_name(self, obj):
+        return f"{obj.student.first_name} {obj.student.last_name}"
+
+
+class AttendanceSyncMutationSerializer(serializers.Serializer):
+    """One offline mark, timestamped by the device that took it"""
+    student = serializers.IntegerField()
+    date = serializers.DateField()
+    status = serializers.ChoiceField(choices=Attendance.STATUS_CHOICES)
+    remarks = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    client_timestamp = serializers.DateTimeField()
+
+
+class AttendanceSyncSerializer(serializers.Serializer):
+    class_id = serializers.IntegerField()
+    section_id = serializers.IntegerField(required=False, allow_null=True)
+    token = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    device_id = serializers.CharField(required=False, allow_blank=True, default='', max_length=100)
+    mutations = AttendanceSyncMutationSerializer(many=True, required=False, default=list)
@@ -0,0 +1,247 @@
+"""
+Set-based attendance writes.
+
+``mark_attendance`` validates a whole batch with one query per referenced
+table and upserts it in a single transaction on the ``(student, date)``
+unique constraint, instead of one serializer round trip per row.
+``take_register`` builds the batch itself from a class roster, so a teacher
+only sends the students who are not present.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from adminstration.models import Term, Section
+from students.models import Enrollment
+from dashboards.signals import models_changed
+from .bitmaps import refresh_bitmaps
+from .models import Attendance
+from .rollup import refresh_attendance_days
+from .serializers import AttendanceMarkSerializer
+
+UPSERT_FIELDS = [
+    'enrollment', 'academic_year', 'term', 'school_class', 'section',
+    'status', 'remarks', 'marked_by', 'marked_at', 'updated_at',
+]
+
+
+def _reference_errors(row, enrollments, terms, sections):
+    """
+    Check a row's references against the prefetched rows. The student,
+    academic year and class are verified through the enrollment, so they
+    need no queries of their own.
+    """
+    errors = {}
+    enrollment = enrollments.get(row['enrollment'])
+    if enrollment is None:
+        errors['enrollment'] = ['Enrollment does not exist.']
+    else:
+        student_id, academic_year_id, school_class_id = enrollment
+        if student_id != row['student']:
+            errors['enrollment'] = ['Enrollment does not belong to this student.']
+        elif academic_year_id != row['academic_year']:
+            errors['academic_year'] = ["Academic year does not match the student's enrollment."]
+        elif school_class_id != row['school_class']:
+            errors['school_class'] = ["Class does not match the student's enrollment."]
+
+    term = terms.get(row['term'])
+    if term is None:
+        errors['term'] = ['Term does not exist.']
+    elif term[0] != row['academic_year']:
+        errors['term'] = ['Term does not belong to this academic year.']
+    elif not term[1] <= row['date'] <= term[2]:
+        errors['date'] = ['Date is outside the term.']
+
+    if row.get('section') is not None:
+        section = sections.get(row['section'])
+        if section is None:
+            errors['section'] = ['Section does not exist.']
+        elif section != row['school_class']:
+            errors['section'] = ['Section does not belong to this class.']
+    return errors
+
+
+def _error_results(row_errors):
+    return [
+        {'index': index, 'errors': errors} if errors else {'index': index, 'result': 'not_saved'}
+        for index, errors in enumerate(row_errors)
+    ]
+
+
+def mark_attendance(rows, marked_by):
+    """
+    Validate and upsert attendance ``rows`` as one batch.
+
+    Returns ``(ok, results)`` with one result per input row, in order. When
+    any row is invalid nothing is written and the invalid rows carry their
+    ``errors``; otherwise every row reports whether it was ``created`` or
+    ``updated`` and the attendance ``id``.
+    """
+    serializer = AttendanceMarkSerializer(data=rows, many=True)
+    if not serializer.is_valid():
+        # Field errors first; references are only checked on a well-formed batch
+        return False, _error_results(serializer.errors)
+    parsed = serializer.validated_data
+
+    enrollments = {
+        pk: (student_id, academic_year_id, school_class_id)
+        for pk, student_id, academic_year_id, school_class_id in Enrollment.objects.filter(
+            pk__in={row['enrollment'] for row in parsed}
+        ).values_list('pk', 'student_id', 'academic_year_id', 'school_class_id')
+    }
+    terms = {
+        pk: (academic_year_id, start_date, end_date)
+        for pk, academic_year_id, start_date, end_date in Term.objects.filter(
+            pk__in={row['term'] for row in parsed}
+        ).values_list('pk', 'academic_year_id', 'start_date', 'end_date')
+    }
+    section_ids = {row['section'] for row in parsed if row.get('section') is not None}
+    sections = dict(Section.objects.filter(pk__in=section_ids).values_list('pk', 'school_class_id')) if section_ids else {}
+
+    row_errors, seen = [], set()
+    for row in parsed:
+        errors = _reference_errors(row, enrollments, terms, sections)
+        key = (row['student'], row['date'])
+        if key in seen:
+            errors['non_field_errors'] = ['Student is marked more than once for this date.']
+        seen.add(key)
+        row_errors.append(errors)
+
+    if any(row_errors):
+        return False, _error_results(row_errors)
+
+    objects = [
+        Attendance(
+            student_id=row['student'],
+            enrollment_id=row['enrollment'],
+            academic_year_id=row['academic_year'],
+            term_id=row['term'],
+            school_class_id=row['school_class'],
+            section_id=row.get('section'),
+            date=row['date'],
+            status=row['status'],
+            remarks=row.get('remarks'),
+            marked_by=marked_by,
+        )
+        for row in parsed
+    ]
+    return True, upsert_attendance(objects)
+
+
+def upsert_attendance(objects):
+    """
+    Insert or update ``objects`` on (student, date) in one transaction and
+    return a result per object, in order.
+    """
+    students = {obj.student_id for obj in objects}
+    dates = {obj.date for obj in objects}
+    now = timezone.now()
+    for obj in objects:
+        if obj.marked_at is None:
+            obj.marked_at = now
+
+    with transaction.atomic():
+        previous = Attendance.objects.filter(student_id__in=students, date__in=dates).values_list(
+            'student_id', 'date', 'school_class_id', 'term_id'
+        )
+        existing = {(student_id, date): (class_id, term_id) for student_id, date, class_id, term_id in previous}
+        Attendance.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=['student', 'date'],
+            update_fields=UPSERT_FIELDS,
+        )
+        if any(obj.pk is None for obj in objects):
+            # Backends that cannot return ids from an upsert
+            ids = {
+                (student_id, date): pk
+                for pk, student_id, date in Attendance.objects.filter(
+                    student_id__in=students, date__in=dates
+                ).values_list('pk', 'student_id', 'date')
+            }
+            for obj in objects:
+                obj.pk = ids[(obj.student_id, obj.date)]
+        refresh_attendance_days(
+            {(obj.school_class_id, obj.date) for obj in objects}
+            | {(class_id, date) for (_, date), (class_id, _) in existing.items()}
+        )
+        refresh_bitmaps(
+            {(obj.student_id, obj.term_id) for obj in objects}
+            | {(student_id, term_id) for (student_id, _), (_, term_id) in existing.items()}
+        )
+        models_changed(Attendance)
+
+    return [
+        {
+            'index': index,
+            'id': obj.pk,
+            'student': obj.student_id,
+            'date': obj.date,
+            'result': 'updated' if (obj.student_id, obj.date) in existing else 'created',
+        }
+        for index, obj in enumerate(objects)
+    ]
+
+
+def take_register(school_class_id, date, exceptions, marked_by, section_id=None):
+    """
+    Mark a whole class (or one section) for ``date``: every active enrollment
+    is present unless listed in ``exceptions`` (``{student, status, remarks}``
+    dicts). The academic year and term are derived from the date.
+
+    Returns ``(ok, payload)``; on failure ``payload`` is an error dict.
+    """
+    term = Term.objects.filter(start_date__lte=date, end_date__gte=date).order_by('start_date').first()
+    if term is None:
+        return False, {'date': ['No term covers this date.']}
+
+    roster = Enrollment.objects.filter(
+        academic_year_id=term.academic_year_id, school_class_id=school_class_id, is_active=True
+    )
+    if section_id is not None:
+        roster = roster.filter(section_id=section_id)
+    roster = list(roster.order_by('pk').values_list('pk', 'student_id', 'section_id'))
+    if not roster:
+        return False, {'class_id': ['No active enrollments for this class in the term covering this date.']}
+
+    marked = {}
+    on_roster = {student_id for _, student_id, _ in roster}
+    errors = {}
+    for index, exception in enumerate(exceptions):
+        student_id = exception['student']
+        if student_id not in on_roster:
+            errors[index] = {'student': ['Student is not enrolled in this class.']}
+        elif student_id in marked:
+            errors[index] = {'student': ['Student is listed more than once.']}
+        marked[student_id] = exception
+    if errors:
+        return False, {'exceptions': errors}
+
+    objects = [
+        Attendance(
+            student_id=student_id,
+            enrollment_id=enrollment_id,
+            academic_year_id=term.academic_year_id,
+            term=term,
+            school_class_id=school_class_id,
+            section_id=enrollment_section_id,
+            date=date,
+            status=marked[student_id]['status'] if student_id in marked else 'present',
+            remarks=marked[student_id].get('remarks') if student_id in marked else None,
+            marked_by=marked_by,
+        )
+        for enrollment_id, student_id, enrollment_section_id in roster
+    ]
+    results = upsert_attendance(objects)
+
+    by_status = {status: 0 for status, _ in Attendance.STATUS_CHOICES}
+    for obj in objects:
+        by_status[obj.status] += 1
+    return True, {
+        'date': date,
+        'academic_year': term.academic_year_id,
+        'term': term.pk,
+        'students': len(objects),
+        'by_status': by_status,
+        'created': sum(1 for r in results if r['result'] == 'created'),
+        'updated': sum(1 for r in results if r['result'] == 'updated'),
+    }
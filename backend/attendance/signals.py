@@ -0,0 +1,32 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .bitmaps import refresh_bitmaps
+from .models import Attendance
+from .rollup import refresh_attendance_days
+
+
+@receiver(pre_save, sender=Attendance)
+def remember_previous_mark(sender, instance, raw=False, **kwargs):
+    """Keep the previously stored keys so moving a mark refreshes both the old and new rollup group and bitmap"""
+    instance._previous_mark = None
+    if instance.pk and not raw:
+        instance._previous_mark = sender.objects.filter(pk=instance.pk).values_list(
+            'school_class_id', 'date', 'student_id', 'term_id'
+        ).first()
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def refresh_attendance_derivatives(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    groups = {(instance.school_class_id, instance.date)}
+    pairs = {(instance.student_id, instance.term_id)}
+    previous = getattr(instance, '_previous_mark', None)
+    if previous:
+        school_class_id, date, student_id, term_id = previous
+        groups.add((school_class_id, date))
+        pairs.add((student_id, term_id))
+    refresh_attendance_days(groups)
+    refresh_bitmaps(pairs)
@@ -0,0 +1,239 @@
+"""
+Offline attendance sync for teacher devices.
+
+A device marks attendance offline and later POSTs its queued mutations with
+the time each mark was taken. ``sync_attendance`` resolves every mutation on
+``(student, date)`` by last-writer-wins against the stored ``marked_at``:
+newer marks are upserted, older ones are kept out as ``stale`` and the
+server's mark is sent back instead. Every resolved mutation leaves an
+``AttendanceSyncRecord`` whatever its outcome, including marks ``superseded``
+by a later mark of the same key in the batch. Device clocks ahead of the
+server are clamped to the time the batch was received, so a skewed tablet
+cannot win every future conflict.
+
+The response is a delta for the class (or section) since the opaque signed
+``token`` the device got last time: attendance rows changed since then, and
+the roster only when it differs from the one the device already has. Rows
+deleted on the server are not tracked and do not appear in deltas.
+"""
+import hashlib
+from datetime import datetime, timedelta
+
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+
+from adminstration.models import Term
+from students.models import Enrollment
+from .models import Attendance, AttendanceSyncRecord
+from .services import upsert_attendance
+
+TOKEN_SALT = 'attendance.sync'
+# Re-send rows touched just before the previous token, in case their
+# transaction committed after the delta was read
+TOKEN_OVERLAP = timedelta(seconds=5)
+
+ROSTER_COLUMNS = ['enrollment', 'student', 'section', 'admission_number', 'first_name', 'last_name']
+ATTENDANCE_COLUMNS = ['id', 'student', 'date', 'status', 'remarks', 'marked_at']
+
+
+class SyncError(Exception):
+    """The request cannot be synced; carries the error payload"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def read_token(token, school_class_id, section_id):
+    if not token:
+        return None
+    try:
+        state = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        raise SyncError({'token': ['Invalid sync token; sync again without one.']})
+    if state['c'] != school_class_id or state['s'] != section_id:
+        raise SyncError({'token': ['This sync token belongs to another class.']})
+    return state
+
+
+def terms_by_date(dates):
+    """Map each date to the term covering it, with one query"""
+    if not dates:
+        return {}
+    terms = list(Term.objects.filter(start_date__lte=max(dates), end_date__gte=min(dates)).order_by('start_date'))
+    covering = {}
+    for day in dates:
+        for term in terms:
+            if term.start_date <= day <= term.end_date:
+                covering[day] = term
+                break
+    return covering
+
+
+def apply_mutations(mutations, school_class_id, section_id, user, device_id):
+    """Resolve ``mutations`` by last-writer-wins; returns a result per mutation, in order"""
+    received_at = timezone.now()
+    terms = terms_by_date({mutation['date'] for mutation in mutations})
+    roster = Enrollment.objects.filter(
+        academic_year_id__in={term.academic_year_id for term in terms.values()},
+        school_class_id=school_class_id,
+        is_active=True,
+    )
+    if section_id is not None:
+        roster = roster.filter(section_id=section_id)
+    enrollments = {
+        (student_id, academic_year_id): (pk, enrollment_section_id)
+        for pk, student_id, academic_year_id, enrollment_section_id in roster.values_list(
+            'pk', 'student_id', 'academic_year_id', 'section_id'
+        )
+    }
+
+    results, accepted, superseded = [None] * len(mutations), {}, []
+    for index, mutation in enumerate(mutations):
+        term = terms.get(mutation['date'])
+        if term is None:
+            results[index] = {'index': index, 'errors': {'date': ['No term covers this date.']}}
+        elif (mutation['student'], term.academic_year_id) not in enrollments:
+            results[index] = {'index': index, 'errors': {'student': ['Student is not enrolled in this class.']}}
+        else:
+            key = (mutation['student'], mutation['date'])
+            mutation = {**mutation, 'client_timestamp': min(mutation['client_timestamp'], received_at)}
+            # Within one batch the latest mark of a key wins too
+            if key in accepted and accepted[key][1]['client_timestamp'] > mutation['client_timestamp']:
+                results[index] = {'index': index, 'result': 'superseded'}
+                superseded.append((key, mutation))
+                continue
+            if key in accepted:
+                results[accepted[key][0]] = {'index': accepted[key][0], 'result': 'superseded'}
+                superseded.append((key, accepted[key][1]))
+            accepted[key] = (index, mutation, term)
+    if not accepted:
+        return results
+
+    with transaction.atomic():
+        current = {
+            (row.student_id, row.date): row
+            for row in Attendance.objects.select_for_update().filter(
+                student_id__in={student_id for student_id, _ in accepted},
+                date__in={day for _, day in accepted},
+            ).only('pk', 'student_id', 'date', 'status', 'remarks', 'marked_at', 'updated_at')
+        }
+
+        def record(mutation, existing, outcome):
+            return AttendanceSyncRecord(
+                attendance_id=existing.pk if existing else None,
+                student_id=mutation['student'],
+                date=mutation['date'],
+                status=mutation['status'],
+                remarks=mutation.get('remarks'),
+                previous_status=existing.status if existing else None,
+                client_timestamp=mutation['client_timestamp'],
+                device_id=device_id,
+                outcome=outcome,
+                synced_by=user,
+            )
+
+        writes = []
+        records = [record(mutation, current.get(key), 'superseded') for key, mutation in superseded]
+        for key, (index, mutation, term) in accepted.items():
+            existing = current.get(key)
+            if existing is None:
+                outcome = 'applied'
+            else:
+                marked_at = existing.marked_at or existing.updated_at
+                if mutation['client_timestamp'] > marked_at:
+                    outcome = 'applied'
+                elif mutation['client_timestamp'] == marked_at:
+                    outcome = 'unchanged'
+                else:
+                    outcome = 'stale'
+            if outcome == 'applied':
+                enrollment_id, enrollment_section_id = enrollments[(mutation['student'], term.academic_year_id)]
+                writes.append((index, Attendance(
+                    student_id=mutation['student'],
+                    enrollment_id=enrollment_id,
+                    academic_year_id=term.academic_year_id,
+                    term=term,
+                    school_class_id=school_class_id,
+                    section_id=enrollment_section_id,
+                    date=mutation['date'],
+                    status=mutation['status'],
+                    remarks=mutation.get('remarks'),
+                    marked_by=user,
+                    marked_at=mutation['client_timestamp'],
+                )))
+            results[index] = {'index': index, 'result': outcome, 'id': existing.pk if existing else None}
+            records.append(record(mutation, existing, outcome))
+
+        if writes:
+            upserted = upsert_attendance([obj for _, obj in writes])
+            for (index, _), result in zip(writes, upserted):
+                results[index]['id'] = result['id']
+            ids = {(obj.student_id, obj.date): obj.pk for _, obj in writes}
+            for record in records:
+                record.attendance_id = record.attendance_id or ids.get((record.student_id, record.date))
+        AttendanceSyncRecord.objects.bulk_create(records)
+    return results
+
+
+def roster_rows(school_class_id, section_id, today):
+    term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+    if term is None:
+        return None, []
+    roster = Enrollment.objects.filter(
+        academic_year_id=term.academic_year_id, school_class_id=school_class_id, is_active=True
+    )
+    if section_id is not None:
+        roster = roster.filter(section_id=section_id)
+    return term, [list(row) for row in roster.order_by('pk').values_list(
+        'pk', 'student_id', 'section_id', 'student__admission_number', 'student__first_name', 'student__last_name'
+    )]
+
+
+def sync_attendance(school_class_id, mutations, user, section_id=None, token=None, device_id=''):
+    """
+    Apply ``mutations`` and return the delta payload: per-mutation
+    ``results``, changed ``attendance`` rows, the ``roster`` when it changed
+    (otherwise None) and the next ``token``. Raises SyncError on a bad token.
+    """
+    state = read_token(token, school_class_id, section_id)
+    results = apply_mutations(mutations, school_class_id, section_id, user, device_id)
+
+    now = timezone.now()
+    term, roster = roster_rows(school_class_id, section_id, timezone.localdate())
+    fingerprint = hashlib.sha1(repr(roster).encode()).hexdigest()
+
+    rows = Attendance.objects.filter(school_class_id=school_class_id)
+    if section_id is not None:
+        rows = rows.filter(section_id=section_id)
+    if state is not None:
+        rows = rows.filter(updated_at__gt=datetime.fromisoformat(state['t']) - TOKEN_OVERLAP)
+    elif term is not None:
+        rows = rows.filter(date__gte=term.start_date)
+    else:
+        rows = rows.none()
+    # Stale mutations lost to the server's mark; make sure the device gets it
+    stale = [
+        (mutations[result['index']]['student'], mutations[result['index']]['date'])
+        for result in results if result.get('result') == 'stale'
+    ]
+    changed = [list(row) for row in rows.order_by('date', 'student_id').values_list(*ATTENDANCE_COLUMNS)]
+    sent = {(row[1], row[2]) for row in changed}
+    missing = [key for key in stale if key not in sent]
+    if missing:
+        changed += [list(row) for row in Attendance.objects.filter(
+            student_id__in={student_id for student_id, _ in missing}, date__in={day for _, day in missing}
+        ).values_list(*ATTENDANCE_COLUMNS) if (row[1], row[2]) in missing]
+
+    return {
+        'token': signing.dumps(
+            {'c': school_class_id, 's': section_id, 't': now.isoformat(), 'r': fingerprint}, salt=TOKEN_SALT
+        ),
+        'full': state is None,
+        'results': results,
+        'roster': None if state is not None and state['r'] == fingerprint else {
+            'term': term.pk if term else None, 'columns': ROSTER_COLUMNS, 'rows': roster,
+        },
+        'attendance': {'columns': ATTENDANCE_COLUMNS, 'rows': changed},
+    }
@@ -1,2 +1,400 @@
+import csv
+import importlib.util
+import io
+from datetime import date, timedelta
+from unittest import mock, skipIf
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from users.models import User
+from adminstration.models import AcademicYear, Term, SchoolClass, Section
+from students.models import StudentProfile, Enrollment
+from .bitmaps import bitmap_stats, longest_run, rebuild_bitmaps, school_day_index
+from .models import Attendance, AttendanceBitmap, AttendanceDailyRollup, AttendanceRiskFlag, AttendanceSyncRecord
+from .risk import flag_at_risk_students
+from .rollup import rebuild_attendance_rollup
+
+
+class AttendanceTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(
+            email='admin@example.com', first_name='A', last_name='D', role='admin', password='pw'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.year = AcademicYear.objects.create(
+            name='2025/2026', start_date=date(2025, 9, 1), end_date=date(2026, 8, 31), is_active=True
+        )
+        self.term = Term.objects.create(
+            academic_year=self.year, name='Term 1', start_date=date(2025, 9, 1), end_date=date(2025, 12, 15)
+        )
+        self.school_class = SchoolClass.objects.create(name='Grade 1', code='G01', level=1)
+        self.section = Section.objects.create(school_class=self.school_class, name='A')
+
+    def enroll(self, count):
+        enrollments = []
+        start = StudentProfile.objects.count()
+        for n in range(start, start + count):
+            student = StudentProfile.objects.create(
+                admission_number=f'ADM{n:04d}', first_name='S', last_name=str(n), dob=date(2018, 1, 1), gender='female'
+            )
+            enrollments.append(Enrollment.objects.create(
+                student=student, academic_year=self.year, school_class=self.school_class, section=self.section
+            ))
+        return enrollments
+
+    def row(self, enrollment, status='present', day=date(2025, 10, 6)):
+        return {
+            'student': enrollment.student_id, 'enrollment': enrollment.pk, 'academic_year': self.year.pk,
+            'term': self.term.pk, 'school_class': self.school_class.pk, 'section': self.section.pk,
+            'date': day.isoformat(), 'status': status,
+        }
+
+
+class BulkMarkTests(AttendanceTestMixin, TestCase):
+    def test_marks_a_class_in_a_constant_number_of_queries(self):
+        enrollments = self.enroll(60)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                '/api/attendance/attendances/bulk_mark/',
+                {'attendances': [self.row(e) for e in enrollments]}, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 60)
+        self.assertEqual(Attendance.objects.count(), 60)
+        self.assertLessEqual(len(ctx.captured_queries), 13)
+
+    def test_remarking_updates_existing_rows(self):
+        first, second = self.enroll(2)
+        self.client.post('/api/attendance/attendances/bulk_mark/', {'attendances': [self.row(first)]}, format='json')
+        response = self.client.post(
+            '/api/attendance/attendances/bulk_mark/',
+            {'attendances': [self.row(first, 'absent'), self.row(second)]}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([r['result'] for r in response.data['results']], ['updated', 'created'])
+        self.assertEqual(Attendance.objects.get(student_id=first.student_id).status, 'absent')
+        self.assertEqual(Attendance.objects.count(), 2)
+
+    def test_an_invalid_row_saves_nothing(self):
+        first, second = self.enroll(2)
+        bad = self.row(second)
+        bad['enrollment'] = first.pk
+        response = self.client.post(
+            '/api/attendance/attendances/bulk_mark/', {'attendances': [self.row(first), bad]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['results'][0], {'index': 0, 'result': 'not_saved'})
+        self.assertIn('enrollment', response.data['results'][1]['errors'])
+        self.assertFalse(Attendance.objects.exists())
+
+
+class AttendanceRegisterTests(AttendanceTestMixin, TestCase):
+    def test_register_expands_the_roster_in_a_few_queries(self):
+        enrollments = self.enroll(40)
+        absent, late = enrollments[3].student_id, enrollments[7].student_id
+        payload = {
+            'class_id': self.school_class.pk,
+            'date': '2025-10-06',
+            'exceptions': [{'student': absent, 'status': 'absent'}, {'student': late, 'status': 'late'}],
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/attendance/register/', payload, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['term'], self.term.pk)
+        self.assertEqual(response.data['by_status']['present'], 38)
+        self.assertEqual(Attendance.objects.filter(status='present').count(), 38)
+        self.assertEqual(Attendance.objects.get(student_id=absent).status, 'absent')
+        self.assertLessEqual(len(ctx.captured_queries), 12)
+
+    def test_date_outside_every_term_is_rejected(self):
+        self.enroll(1)
+        response = self.client.post(
+            '/api/attendance/register/', {'class_id': self.school_class.pk, 'date': '2026-01-02'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.data)
+
+    def test_teachers_only_register_their_own_classes(self):
+        self.enroll(1)
+        teacher = User.objects.create_user(
+            email='t@example.com', first_name='T', last_name='R', role='teacher', password='pw'
+        )
+        self.client.force_authenticate(teacher)
+        payload = {'class_id': self.school_class.pk, 'section_id': self.section.pk, 'date': '2025-10-06'}
+        self.assertEqual(self.client.post('/api/attendance/register/', payload, format='json').status_code, 403)
+
+        self.section.class_teacher = teacher
+        self.section.save()
+        self.assertEqual(self.client.post('/api/attendance/register/', payload, format='json').status_code, 201)
+
+
+class AttendanceRollupTests(AttendanceTestMixin, TestCase):
+    def rollup(self):
+        return {
+            (r.school_class_id, r.section_id, r.date, r.status): r.count
+            for r in AttendanceDailyRollup.objects.all()
+        }
+
+    def test_writes_keep_the_rollup_in_step(self):
+        first, second, third = self.enroll(3)
+        self.client.post('/api/attendance/register/', {
+            'class_id': self.school_class.pk, 'date': '2025-10-06',
+            'exceptions': [{'student': first.student_id, 'status': 'absent'}],
+        }, format='json')
+        day = date(2025, 10, 6)
+        self.assertEqual(self.rollup(), {
+            (self.school_class.pk, self.section.pk, day, 'present'): 2,
+            (self.school_class.pk, self.section.pk, day, 'absent'): 1,
+        })
+
+        self.client.post('/api/attendance/attendances/bulk_mark/', {
+            'attendances': [self.row(second, 'late')]
+        }, format='json')
+        mark = Attendance.objects.get(student_id=third.student_id)
+        mark.status = 'excused'
+        mark.save()
+        Attendance.objects.get(student_id=first.student_id).delete()
+        self.assertEqual(self.rollup(), {
+            (self.school_class.pk, self.section.pk, day, 'late'): 1,
+            (self.school_class.pk, self.section.pk, day, 'excused'): 1,
+        })
+
+        incremental = self.rollup()
+        rebuild_attendance_rollup()
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_section_less_groups_are_updated_in_place(self):
+        student = self.enroll(1)[0]
+        row = {**self.row(student), 'section': None}
+        for status in ('present', 'absent', 'absent'):
+            self.client.post('/api/attendance/attendances/bulk_mark/', {
+                'attendances': [{**row, 'status': status}]
+            }, format='json')
+        self.assertEqual(self.rollup(), {(self.school_class.pk, None, date(2025, 10, 6), 'absent'): 1})
+        self.assertEqual(AttendanceDailyRollup.objects.count(), 1)
+
+    def test_summary_reads_the_rollup(self):
+        self.enroll(4)
+        for day in ('2025-10-06', '2025-10-07'):
+            self.client.post('/api/attendance/register/', {'class_id': self.school_class.pk, 'date': day}, format='json')
+        Attendance.objects.all().update(status='late')  # bypasses the rollup on purpose
+
+        response = self.client.get('/api/attendance/attendances/attendance_summary/', {'term': self.term.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_students'], 4)
+        self.assertEqual(response.data['total_days'], 2)
+        self.assertEqual(response.data['by_status'], [{'status': 'present', 'count': 8}])
+
+
+class AttendanceBitmapTests(AttendanceTestMixin, TestCase):
+    def test_school_day_index_skips_weekends(self):
+        start = date(2025, 9, 1)  # Monday
+        self.assertEqual(school_day_index(start, date(2025, 9, 5)), 4)
+        self.assertEqual(school_day_index(start, date(2025, 9, 8)), 5)
+        self.assertIsNone(school_day_index(start, date(2025, 9, 6)))
+        self.assertEqual(longest_run(0b0111011), 3)
+
+    def test_percentages_and_streaks_follow_writes(self):
+        student = self.enroll(1)[0]
+        # Absent Thu, Fri and the following Mon: a three school-day streak
+        marks = {
+            date(2025, 10, 1): 'present', date(2025, 10, 2): 'absent', date(2025, 10, 3): 'absent',
+            date(2025, 10, 6): 'absent', date(2025, 10, 7): 'late', date(2025, 10, 8): 'excused',
+        }
+        self.client.post('/api/attendance/attendances/bulk_mark/', {
+            'attendances': [self.row(student, status, day) for day, status in marks.items()]
+        }, format='json')
+
+        response = self.client.get('/api/attendance/attendances/percentages/', {
+            'term': self.term.pk, 'class': self.school_class.pk, 'last': 3, 'until': '2025-10-08',
+        })
+        self.assertEqual(response.status_code, 200)
+        stats = response.data['results'][0]
+        self.assertEqual(
+            (stats['marked_days'], stats['present'], stats['absent'], stats['late'], stats['excused']),
+            (6, 1, 3, 1, 1)
+        )
+        self.assertEqual(stats['percentage'], 33.33)
+        self.assertEqual(stats['longest_absence_streak'], 3)
+        self.assertEqual(stats['recent'], {'days': 3, 'marked': 3, 'absent': 1})
+
+        Attendance.objects.get(student_id=student.student_id, date=date(2025, 10, 3)).delete()
+        bitmap = AttendanceBitmap.objects.get(student_id=student.student_id, term=self.term)
+        self.assertEqual(bitmap_stats(bitmap)['longest_absence_streak'], 1)
+
+        incremental = bitmap_stats(bitmap)
+        rebuild_bitmaps()
+        self.assertEqual(bitmap_stats(AttendanceBitmap.objects.get()), incremental)
+
+    def test_marks_outside_the_term_are_rejected_or_skipped(self):
+        student = self.enroll(1)[0]
+        late_row = self.row(student, day=date(2026, 1, 12))
+        response = self.client.post('/api/attendance/attendances/bulk_mark/', {'attendances': [late_row]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.data['results'][0]['errors'])
+        response = self.client.post('/api/attendance/attendances/', late_row, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.data)
+
+        # Rows already stored outside their term have no bit and do not break the bitmap
+        Attendance.objects.create(
+            student_id=student.student_id, enrollment=student, academic_year=self.year, term=self.term,
+            school_class=self.school_class, date=date(2026, 1, 12), status='absent',
+        )
+        self.assertEqual(rebuild_bitmaps(), 1)
+        self.assertEqual(bitmap_stats(AttendanceBitmap.objects.get())['marked_days'], 0)
+
+        response = self.client.get('/api/attendance/attendances/percentages/', {'term': self.term.pk, 'last': -1})
+        self.assertEqual(response.status_code, 400)
+
+
+class AtRiskStudentTests(AttendanceTestMixin, TestCase):
+    def mark_weeks(self, enrollment, statuses, weeks=3):
+        """Mark Mon..Fri statuses for ``weeks`` weeks from 2025-09-01"""
+        rows = [
+            self.row(enrollment, statuses[weekday], date(2025, 9, 1) + timedelta(weeks=week, days=weekday))
+            for week in range(weeks) for weekday in range(5)
+        ]
+        self.client.post('/api/attendance/attendances/bulk_mark/', {'attendances': rows}, format='json')
+
+    def test_flags_each_rule_and_lists_them(self):
+        regular, streak, edges, newcomer = self.enroll(4)
+        self.mark_weeks(regular, ['present'] * 5)
+        self.mark_weeks(edges, ['present'] * 5, weeks=4)
+        self.mark_weeks(streak, ['present'] * 5)
+        self.client.post('/api/attendance/attendances/bulk_mark/', {'attendances': [
+            self.row(streak, 'absent', day) for day in (date(2025, 9, 2), date(2025, 9, 3), date(2025, 9, 4))
+        ] + [
+            self.row(edges, 'absent', day)
+            for day in (date(2025, 9, 1), date(2025, 9, 5), date(2025, 9, 8), date(2025, 9, 12))
+        ]}, format='json')
+        self.mark_weeks(newcomer, ['absent'] * 5, weeks=1)
+
+        flags = {
+            flag.student_id: flag
+            for flag in flag_at_risk_students(self.term, min_percentage=75, monday_friday_absences=4)
+        }
+        self.assertEqual(set(flags), {streak.student_id, edges.student_id})
+        self.assertEqual(flags[streak.student_id].reasons, ['absence_streak'])
+        self.assertEqual(flags[streak.student_id].longest_absence_streak, 3)
+        self.assertEqual(flags[edges.student_id].reasons, ['monday_friday_absences'])
+        self.assertEqual(flags[edges.student_id].monday_friday_absences, 4)
+
+        # Stricter percentage catches both; re-running replaces the term's flags
+        flag_at_risk_students(self.term, min_percentage=90)
+        self.assertEqual(AttendanceRiskFlag.objects.filter(term=self.term).count(), 2)
+
+        response = self.client.get(
+            '/api/attendance/at-risk/', {'term': self.term.pk, 'reason': 'absence_streak', 'count': 'true'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['student'], streak.student_id)
+        self.assertEqual(response.data['results'][0]['class_name'], 'Grade 1')
+
+    def test_scoring_reads_the_term_in_one_query(self):
+        for enrollment in self.enroll(20):
+            self.mark_weeks(enrollment, ['absent', 'present', 'present', 'present', 'present'])
+        with CaptureQueriesContext(connection) as ctx:
+            flags = flag_at_risk_students(self.term, monday_friday_absences=3)
+        self.assertEqual(len(flags), 20)
+        self.assertLessEqual(len(ctx.captured_queries), 6)
+
+
+class AttendanceExportTests(AttendanceTestMixin, TestCase):
+    def test_export_streams_the_filtered_rows_as_csv(self):
+        enrollments = self.enroll(3)
+        self.client.post('/api/attendance/attendances/bulk_mark/', {'attendances': [
+            self.row(enrollments[0], 'absent'), self.row(enrollments[1]), self.row(enrollments[2], 'absent'),
+        ]}, format='json')
+
+        response = self.client.get('/api/attendance/attendances/export/', {'status': 'absent', 'ordering': 'date'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="attendance-', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][:3], ['Date', 'Admission number', 'First name'])
+        self.assertEqual(sorted(row[1] for row in rows[1:]), ['ADM0000', 'ADM0002'])
+        self.assertEqual({row[7] for row in rows[1:]}, {'absent'})
+
+    @skipIf(importlib.util.find_spec('openpyxl'), 'openpyxl is installed')
+    def test_xlsx_without_openpyxl_is_rejected(self):
+        response = self.client.get('/api/attendance/attendances/export/', {'file_format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+
+@mock.patch('attendance.sync.timezone.localdate', return_value=date(2025, 10, 8))
+class AttendanceSyncTests(AttendanceTestMixin, TestCase):
+    def sync(self, mutations=(), token=None):
+        response = self.client.post('/api/attendance/sync/', {
+            'class_id': self.school_class.pk, 'token': token, 'device_id': 'tablet-1', 'mutations': [
+                {'student': student, 'date': day, 'status': status, 'client_timestamp': stamp}
+                for student, day, status, stamp in mutations
+            ],
+        }, format='json', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200, response.content)
+        # gzip_page keeps a body as is when compressing would not shrink it,
+        # so check the response went through it rather than its encoding
+        self.assertIn('Accept-Encoding', response['Vary'])
+        return response.data
+
+    def test_last_writer_wins_and_the_loser_gets_the_server_mark(self, localdate):
+        first, second = self.enroll(2)
+        self.client.post('/api/attendance/attendances/bulk_mark/', {
+            'attendances': [self.row(first, 'present', date(2025, 10, 7))]
+        }, format='json')
+
+        payload = self.sync([
+            # Taken offline before the online mark above: loses
+            (first.student_id, '2025-10-07', 'absent', '2025-10-07T08:00:00Z'),
+            (second.student_id, '2025-10-07', 'late', '2025-10-07T08:05:00Z'),
+            (second.student_id, '2025-10-07', 'absent', '2025-10-07T08:01:00Z'),
+        ])
+        self.assertEqual(
+            [result['result'] for result in payload['results']], ['stale', 'applied', 'superseded']
+        )
+        self.assertEqual(Attendance.objects.get(student_id=first.student_id).status, 'present')
+        self.assertEqual(Attendance.objects.get(student_id=second.student_id).status, 'late')
+        self.assertEqual(
+            sorted(AttendanceSyncRecord.objects.values_list('outcome', 'previous_status')),
+            [('applied', None), ('stale', 'present'), ('superseded', None)]
+        )
+        # The losing in-batch mark is audited with its device, time and value, against the row that won
+        superseded = AttendanceSyncRecord.objects.get(outcome='superseded')
+        self.assertEqual(
+            (superseded.device_id, superseded.status, superseded.client_timestamp.isoformat()),
+            ('tablet-1', 'absent', '2025-10-07T08:01:00+00:00')
+        )
+        self.assertEqual(superseded.attendance, Attendance.objects.get(student_id=second.student_id))
+
+        self.assertTrue(payload['full'])
+        self.assertEqual(len(payload['roster']['rows']), 2)
+        rows = {tuple(row[1:4]) for row in payload['attendance']['rows']}
+        self.assertEqual(
+            rows, {(first.student_id, date(2025, 10, 7), 'present'), (second.student_id, date(2025, 10, 7), 'late')}
+        )
+
+        # A newer offline mark beats the stored one
+        payload = self.sync([(first.student_id, '2025-10-07', 'excused', '2099-01-01T00:00:00Z')], payload['token'])
+        self.assertEqual(payload['results'][0]['result'], 'applied')
+        self.assertEqual(Attendance.objects.get(student_id=first.student_id).status, 'excused')
+
+    @mock.patch('attendance.sync.TOKEN_OVERLAP', timedelta(0))
+    def test_token_deltas_only_carry_changes(self, localdate):
+        first, = self.enroll(1)
+        token = self.sync([(first.student_id, '2025-10-06', 'absent', '2025-10-06T08:00:00Z')])['token']
+
+        payload = self.sync(token=token)
+        self.assertFalse(payload['full'])
+        self.assertIsNone(payload['roster'])
+        self.assertEqual(payload['attendance']['rows'], [])
 
+        self.enroll(2)  # roster grows; the next delta carries it
+        self.assertEqual(len(self.sync(token=payload['token'])['roster']['rows']), 3)
@@ -1,10 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AttendanceViewSet
+from .views import AttendanceViewSet, at_risk_students, attendance_register, attendance_sync
 
 router = DefaultRouter()
 router.register(r'attendances', AttendanceViewSet)
 
 urlpatterns = [
+    path('register/', attendance_register, name='attendance-register'),
+    path('sync/', attendance_sync, name='attendance-sync'),
+    path('at-risk/', at_risk_students, name='attendance-at-risk'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
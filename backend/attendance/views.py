@@ -1,14 +1,30 @@
 from rest_framework import viewsets, status, filters
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Count, Q
-from .models import Attendance
-from .serializers import AttendanceSerializer
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.views.decorators.gzip import gzip_page
+from datetime import date
+from adminstration.models import Section, Term
+from students.models import Enrollment, TeacherAssignment
+from .bitmaps import bitmap_stats
+from .models import Attendance, AttendanceBitmap, AttendanceDailyRollup, AttendanceRiskFlag
+from .serializers import (
+    AttendanceSerializer,
+    AttendanceRegisterSerializer,
+    AttendanceRiskFlagSerializer,
+    AttendanceSyncSerializer
+)
+from .services import mark_attendance, take_register
+from .sync import SyncError, sync_attendance
 from users.permissions import IsAdmin, IsTeacher, IsAdminOrTeacher
+from dashboards.cache import cached_response
+from server.exports import ExportMixin
+from server.pagination import KeysetPagination, paginated_response
 
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Attendance.objects.select_related(
         'student', 'enrollment', 'academic_year', 'term',
         'school_class', 'section', 'marked_by'
@@ -16,7 +32,7 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     serializer_class = AttendanceSerializer
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'percentages', 'export']:
             return [IsAdminOrTeacher()]
         return [IsAdmin()]
 
@@ -31,6 +47,20 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     ]
     ordering_fields = ['date', 'student__first_name', 'status', 'created_at']
     ordering = ['-date']
+    # A whole grade's register for one day fits in a page
+    max_page_size = 500
+    export_filename = 'attendance'
+    export_columns = [
+        ('Date', 'date'),
+        ('Admission number', 'student__admission_number'),
+        ('First name', 'student__first_name'),
+        ('Last name', 'student__last_name'),
+        ('Class', 'school_class__name'),
+        ('Section', 'section__name'),
+        ('Term', 'term__name'),
+        ('Status', 'status'),
+        ('Remarks', 'remarks'),
+    ]
 
     @action(detail=False, methods=['get'])
     def class_attendance(self, request):
@@ -47,8 +77,7 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             school_class_id=class_id,
             date=date
         )
-        serializer = self.get_serializer(attendances, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, attendances)
 
     @action(detail=False, methods=['get'])
     def student_attendance(self, request):
@@ -61,30 +90,37 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             )
 
         attendances = self.queryset.filter(student_id=student_id)
-        serializer = self.get_serializer(attendances, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, attendances)
 
     @action(detail=False, methods=['get'])
+    @cached_response('attendance.summary', [Attendance, Enrollment])
     def attendance_summary(self, request):
-        """Get attendance summary statistics"""
+        """
+        Get attendance summary statistics from the daily rollup.
+        total_students counts the students enrolled in the matching year/class.
+        """
         academic_year_id = request.query_params.get('academic_year')
         term_id = request.query_params.get('term')
         class_id = request.query_params.get('class')
 
         filters = Q()
+        enrolled = Q()
         if academic_year_id:
             filters &= Q(academic_year_id=academic_year_id)
+            enrolled &= Q(academic_year_id=academic_year_id)
         if term_id:
             filters &= Q(term_id=term_id)
+            enrolled &= Q(academic_year__terms=term_id)
         if class_id:
             filters &= Q(school_class_id=class_id)
+            enrolled &= Q(school_class_id=class_id)
 
-        attendances = self.queryset.filter(filters)
+        rollups = AttendanceDailyRollup.objects.filter(filters)
 
-        summary = attendances.values('status').annotate(count=Count('id'))
+        summary = rollups.values('status').annotate(count=Sum('count')).order_by('status')
 
-        total_students = attendances.values('student').distinct().count()
-        total_days = attendances.values('date').distinct().count()
+        total_students = Enrollment.objects.filter(enrolled).values('student').distinct().count()
+        total_days = rollups.values('date').distinct().count()
 
         return Response({
             'total_students': total_students,
@@ -92,27 +128,178 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             'by_status': list(summary)
         })
 
+    @action(detail=False, methods=['get'])
+    def percentages(self, request):
+        """
+        Per-student attendance percentage, status counts and longest absence
+        streak for a term, from the attendance bitmaps. Optional filters:
+        class, section, student; ``last=N`` adds absences in the last N school
+        days up to ``until`` (default: today or the term end).
+        """
+        term_id = request.query_params.get('term')
+        term = Term.objects.filter(pk=term_id).first() if term_id and term_id.isdigit() else None
+        if term is None:
+            return Response(
+                {'error': 'a valid term parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            last = int(request.query_params.get('last', 0))
+            until = date.fromisoformat(request.query_params['until']) if 'until' in request.query_params else None
+            if last < 0:
+                raise ValueError(last)
+        except ValueError:
+            return Response(
+                {'error': 'last must be a non-negative integer and until a YYYY-MM-DD date'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        until = until or min(timezone.localdate(), term.end_date)
+
+        bitmaps = AttendanceBitmap.objects.filter(term=term)
+        class_id = request.query_params.get('class')
+        section_id = request.query_params.get('section')
+        if class_id or section_id:
+            enrollments = Enrollment.objects.filter(academic_year_id=term.academic_year_id)
+            if class_id:
+                enrollments = enrollments.filter(school_class_id=class_id)
+            if section_id:
+                enrollments = enrollments.filter(section_id=section_id)
+            bitmaps = bitmaps.filter(student__in=enrollments.values('student_id'))
+        if request.query_params.get('student'):
+            bitmaps = bitmaps.filter(student_id=request.query_params['student'])
+
+        page = self.paginator.paginate_queryset(bitmaps, request, view=self, ordering=['student'])
+        students = [bitmap_stats(bitmap, last=last, until=until) for bitmap in page]
+        response = self.get_paginated_response(students)
+        response.data = {'term': term.pk, 'until': until, **response.data}
+        return response
+
     @action(detail=False, methods=['post'])
     def bulk_mark(self, request):
-        """Bulk mark attendance for a class"""
+        """
+        Bulk mark attendance for a class. Rows are validated together and
+        upserted on (student, date) in one transaction; if any row is invalid
+        nothing is saved. Returns a result per row.
+        """
         attendances_data = request.data.get('attendances', [])
-        if not attendances_data:
+        if not attendances_data or not isinstance(attendances_data, list):
             return Response(
                 {'error': 'attendances data is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        created_attendances = []
-        for attendance_data in attendances_data:
-            serializer = self.get_serializer(data=attendance_data)
-            if serializer.is_valid():
-                attendance = serializer.save()
-                created_attendances.append(attendance)
-            else:
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        ok, results = mark_attendance(attendances_data, request.user)
+        if not ok:
+            return Response(
+                {'error': 'No attendance was saved; some rows are invalid', 'results': results},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'created': sum(1 for r in results if r['result'] == 'created'),
+            'updated': sum(1 for r in results if r['result'] == 'updated'),
+            'results': results,
+        }, status=status.HTTP_201_CREATED)
 
+
+def _teaches_class(user, class_id, section_id):
+    """Teachers may take the register of sections they lead or classes they are assigned to"""
+    sections = Section.objects.filter(school_class_id=class_id, class_teacher=user)
+    if section_id is not None:
+        sections = sections.filter(pk=section_id)
+    return sections.exists() or TeacherAssignment.objects.filter(teacher=user, school_class_id=class_id).exists()
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminOrTeacher])
+def attendance_register(request):
+    """
+    Take a class register for a date. Only absent/late/excused students are
+    sent; everyone else actively enrolled in the class (or section) is marked
+    present. Year and term are derived from the date.
+    """
+    serializer = AttendanceRegisterSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+
+    if request.user.role == 'teacher' and not _teaches_class(request.user, data['class_id'], data.get('section_id')):
+        return Response(
+            {'error': 'You do not teach this class'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    ok, payload = take_register(
+        data['class_id'], data['date'], data['exceptions'], request.user, section_id=data.get('section_id')
+    )
+    if not ok:
+        return Response(payload, status=status.HTTP_400_BAD_REQUEST)
+    return Response(payload, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminOrTeacher])
+def at_risk_students(request):
+    """
+    Students flagged by the nightly ``flag_at_risk_students`` job for a term
+    (default: the term covering today), lowest attendance first and keyset
+    paginated. Optional filters: class, section and reason (low_attendance,
+    absence_streak, monday_friday_absences).
+    """
+    term_id = request.query_params.get('term')
+    if term_id:
+        term = Term.objects.filter(pk=term_id).first() if term_id.isdigit() else None
+    else:
+        today = timezone.localdate()
+        term = Term.objects.filter(start_date__lte=today, end_date__gte=today).first()
+    if term is None:
         return Response(
-            self.get_serializer(created_attendances, many=True).data,
-            status=status.HTTP_201_CREATED
+            {'error': 'a valid term parameter is required'},
+            status=status.HTTP_400_BAD_REQUEST
         )
 
+    flags = AttendanceRiskFlag.objects.filter(term=term).select_related('student', 'school_class', 'section')
+    if request.query_params.get('class'):
+        flags = flags.filter(school_class_id=request.query_params['class'])
+    if request.query_params.get('section'):
+        flags = flags.filter(section_id=request.query_params['section'])
+    reason = request.query_params.get('reason')
+    if reason:
+        # JSON containment is not available on SQLite; match the quoted code in the list
+        flags = flags.filter(reasons__icontains=f'"{reason}"')
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(flags, request, ordering=['percentage'])
+    response = paginator.get_paginated_response(AttendanceRiskFlagSerializer(page, many=True).data)
+    response.data = {'term': term.pk, **response.data}
+    return response
+
+
+@gzip_page
+@api_view(['POST'])
+@permission_classes([IsAdminOrTeacher])
+def attendance_sync(request):
+    """
+    Offline sync for a class register. Applies the device's queued
+    ``mutations`` (``{student, date, status, remarks, client_timestamp}``)
+    by last-writer-wins on (student, date) and returns what changed since
+    ``token``: attendance rows, the roster if it changed, and a new token.
+    Responses are gzip-compressed for clients that accept it.
+    """
+    serializer = AttendanceSyncSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+
+    if request.user.role == 'teacher' and not _teaches_class(request.user, data['class_id'], data.get('section_id')):
+        return Response(
+            {'error': 'You do not teach this class'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        payload = sync_attendance(
+            data['class_id'], data['mutations'], request.user,
+            section_id=data.get('section_id'), token=data.get('token'), device_id=data['device_id'],
+        )
+    except SyncError as error:
+        return Response(error.errors, status=status.HTTP_400_BAD_REQUEST)
+    return Response(payload)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Dashboard, DashboardWidget
+from .models import Dashboard, DashboardWidget, MetricSnapshot
 
 
 @admin.register(Dashboard)
@@ -17,3 +17,10 @@ class DashboardWidgetAdmin(admin.ModelAdmin):
     search_fields = ('title', 'data_source')
     ordering = ('dashboard', 'position')
 
+
+@admin.register(MetricSnapshot)
+class MetricSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('key', 'value', 'computed_at')
+    search_fields = ('key',)
+    ordering = ('key',)
+    readonly_fields = ('key', 'value', 'computed_at')
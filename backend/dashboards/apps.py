@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DashboardsConfig(AppConfig):
     name = "dashboards"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,122 @@
+"""
+Write-invalidated response cache for dashboard and statistics endpoints.
+
+Every model has a version counter in the cache, bumped from model signals
+(see ``signals.py``) after each committed write. A cached response is keyed
+by endpoint, user role, query params, the current date and the versions of
+the models the endpoint reads, so a write to ``FeePayment`` only invalidates
+entries that declared a dependency on it. Only plain ``get``/``set``/``incr``
+calls are used, which keeps it working on the LocMem and file-based backends.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+PREFIX = 'dashboards:cache'
+
+ENDPOINTS = {}
+
+
+def _version_key(label):
+    return f'{PREFIX}:version:{label}'
+
+
+def _stats_key(endpoint, outcome):
+    return f'{PREFIX}:stats:{endpoint}:{outcome}'
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def model_versions(labels):
+    """Return the current version of each model label, initialising missing counters"""
+    keys = {label: _version_key(label) for label in labels}
+    stored = cache.get_many(list(keys.values()))
+    versions = {}
+    for label, key in keys.items():
+        if key not in stored:
+            # Seed from the clock so a counter lost to eviction never reuses an old version
+            cache.add(key, time.time_ns(), timeout=None)
+            stored[key] = cache.get(key)
+        versions[label] = stored[key]
+    return versions
+
+
+def bump_versions(*models):
+    """Invalidate every cached response that depends on any of ``models``"""
+    for model in models:
+        key = _version_key(model._meta.label_lower)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def response_cache_key(endpoint, request, labels):
+    versions = model_versions(labels)
+    role = getattr(request.user, 'role', None) or 'anonymous'
+    params = sorted((key, request.query_params.getlist(key)) for key in request.query_params)
+    raw = repr((endpoint, role, params, timezone.localdate().isoformat(), sorted(versions.items())))
+    return f'{PREFIX}:response:{endpoint}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def cached_response(endpoint, models, timeout=None):
+    """
+    Cache the ``Response.data`` of a function view (below ``@api_view``) or a
+    ViewSet action for as long as none of ``models`` is written.
+    """
+    labels = sorted({model._meta.label_lower for model in models})
+    ENDPOINTS[endpoint] = labels
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, Request))
+            key = response_cache_key(endpoint, request, labels)
+            data = cache.get(key)
+            if data is not None:
+                _incr(_stats_key(endpoint, 'hits'))
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _incr(_stats_key(endpoint, 'misses'))
+            response = view_func(*args, **kwargs)
+            if response.status_code == 200:
+                ttl = timeout if timeout is not None else getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+                cache.set(key, response.data, timeout=ttl)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_stats():
+    """Return hit/miss counters per cached endpoint and in total"""
+    keys = [_stats_key(endpoint, outcome) for endpoint in ENDPOINTS for outcome in ('hits', 'misses')]
+    stored = cache.get_many(keys)
+
+    endpoints = {}
+    for endpoint in sorted(ENDPOINTS):
+        hits = stored.get(_stats_key(endpoint, 'hits'), 0)
+        misses = stored.get(_stats_key(endpoint, 'misses'), 0)
+        endpoints[endpoint] = {'hits': hits, 'misses': misses, 'depends_on': ENDPOINTS[endpoint]}
+
+    hits = sum(e['hits'] for e in endpoints.values())
+    misses = sum(e['misses'] for e in endpoints.values())
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        'endpoints': endpoints,
+    }
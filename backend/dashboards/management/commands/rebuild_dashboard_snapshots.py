@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from dashboards.cache import bump_versions
+from dashboards.snapshots import METRICS, rebuild_snapshots
+
+
+class Command(BaseCommand):
+    help = "Recompute every overview dashboard KPI snapshot from the source tables"
+
+    def handle(self, *args, **options):
+        snapshots = rebuild_snapshots()
+        # The overview response is cached on the versions of the models its metrics read
+        bump_versions(*{model for metric in METRICS.values() for model in metric.depends_on})
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(snapshots)} dashboard snapshots."))
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class Dashboard(models.Model):
@@ -70,3 +71,16 @@ class DashboardWidget(models.Model):
     def __str__(self):
         return f"{self.dashboard.name} - {self.title}"
 
+
+
+class MetricSnapshot(models.Model):
+    """Persisted value of a single dashboard KPI, kept fresh by model signals"""
+    key = models.CharField(max_length=100, unique=True)  # e.g., 'users.total', 'finance.total_revenue'
+    value = models.JSONField(encoder=DjangoJSONEncoder, blank=True, null=True)
+    computed_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['key']
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
@@ -0,0 +1,68 @@
+"""
+Conditional-aggregation query planner for dashboard metrics.
+
+Metrics are declared as specs (model, aggregate function, field, filter) and
+``evaluate`` merges every spec that targets the same model into a single
+``aggregate()`` call, turning each filter into a conditional aggregate::
+
+    evaluate([
+        count_of('invoices.total', Invoice),
+        count_of('invoices.paid', Invoice, Q(status='paid')),
+        sum_of('invoices.outstanding', Invoice, 'balance', Q(balance__gt=0)),
+    ])
+
+runs one query against the invoice table. Filters that span multi-valued
+relations join extra rows into the merged query, so every spec on such a
+model should set ``distinct=True``.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Avg, Count, Sum
+
+MetricSpec = namedtuple('MetricSpec', ['name', 'model', 'function', 'field', 'filter', 'distinct', 'default'])
+
+AGGREGATES = {
+    'count': Count,
+    'sum': Sum,
+    'avg': Avg,
+}
+
+
+def count_of(name, model, filter=None, field='id', distinct=False):
+    return MetricSpec(name, model, 'count', field, filter, distinct, 0)
+
+
+def sum_of(name, model, field, filter=None, default=Decimal('0')):
+    return MetricSpec(name, model, 'sum', field, filter, False, default)
+
+
+def avg_of(name, model, field, filter=None, default=0):
+    return MetricSpec(name, model, 'avg', field, filter, False, default)
+
+
+def plan(specs):
+    """Group specs by model, preserving declaration order"""
+    groups = {}
+    for spec in specs:
+        groups.setdefault(spec.model, []).append(spec)
+    return groups
+
+
+def evaluate(specs):
+    """Evaluate metric specs with one aggregate query per model, returning {name: value}"""
+    results = {}
+    for model, group in plan(specs).items():
+        aggregates = {}
+        for index, spec in enumerate(group):
+            function = AGGREGATES[spec.function]
+            options = {'filter': spec.filter} if spec.filter is not None else {}
+            if spec.distinct:
+                options['distinct'] = True
+            aggregates[f'm{index}'] = function(spec.field, **options)
+
+        row = model._default_manager.aggregate(**aggregates)
+        for index, spec in enumerate(group):
+            value = row[f'm{index}']
+            results[spec.name] = value if value is not None else spec.default
+    return results
@@ -0,0 +1,287 @@
+"""
+Data-source registry behind ``DashboardWidget.data_source``.
+
+Two kinds of providers are registered against a data source string:
+
+* metric providers return a planner ``MetricSpec``; all metric widgets of a
+  dashboard are evaluated together, so every metric reading the same table
+  shares one aggregate query;
+* data providers return chart/table data directly and receive the widget's
+  ``configuration``.
+
+``render_widgets`` evaluates a set of widgets, caching each result for the
+``cache_ttl`` seconds set in its configuration. ``check_configuration``
+validates a configuration for its data source; widgets are checked when saved
+and again when rendered, where a bad one only fails its own widget.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from users.models import User
+from adminstration.models import SchoolClass, Subject
+from admission.models import AdmissionApplication
+from students.models import StudentProfile, Enrollment
+from exams.models import Exam, ExamResult
+from finance.models import Invoice, ExpenseCube, LedgerDailyRollup
+from finance.ledger import BUCKETS, MAX_DAY_BUCKETS, ledger_trends, month_start
+from staff.models import StaffProfile, Leave, Attendance as StaffAttendance
+from attendance.models import AttendanceDailyRollup
+from .planner import evaluate, count_of, sum_of, avg_of
+
+Provider = namedtuple('Provider', ['data_source', 'kind', 'build', 'check'], defaults=[None])
+
+PROVIDERS = {}
+
+DEFAULT_CACHE_TTL = 60
+MAX_TREND_MONTHS = 60
+
+
+def metric_provider(data_source):
+    """Register a function returning the MetricSpec for ``data_source``"""
+    def decorator(func):
+        PROVIDERS[data_source] = Provider(data_source, 'metric', func)
+        return func
+    return decorator
+
+
+def data_provider(data_source, check=None):
+    """
+    Register a function returning the data for ``data_source`` given a widget
+    configuration; ``check`` raises ValueError for a configuration it cannot use.
+    """
+    def decorator(func):
+        PROVIDERS[data_source] = Provider(data_source, 'data', func, check)
+        return func
+    return decorator
+
+
+def check_configuration(data_source, configuration):
+    """Return a widget's ``configuration`` (``{}`` when unset) or raise ValueError explaining what is wrong"""
+    configuration = configuration or {}
+    if not isinstance(configuration, dict):
+        raise ValueError('configuration must be an object')
+    ttl = configuration.get('cache_ttl', DEFAULT_CACHE_TTL)
+    if isinstance(ttl, bool) or not isinstance(ttl, int) or ttl < 0:
+        raise ValueError('cache_ttl must be a whole number of seconds')
+    provider = PROVIDERS.get(data_source)
+    if provider is not None and provider.check is not None:
+        provider.check(configuration)
+    return configuration
+
+
+@metric_provider('users.total')
+def users_total():
+    return count_of('users.total', User)
+
+
+@metric_provider('users.active')
+def users_active():
+    return count_of('users.active', User, Q(is_active=True))
+
+
+@data_provider('users.by_role')
+def users_by_role(configuration):
+    return list(User.objects.values('role').annotate(count=Count('id')).order_by('role'))
+
+
+@metric_provider('students.total')
+def students_total():
+    return count_of('students.total', StudentProfile)
+
+
+@metric_provider('students.active_enrollments')
+def students_active_enrollments():
+    return count_of('students.active_enrollments', Enrollment, Q(is_active=True))
+
+
+@data_provider('students.by_class')
+def students_by_class(configuration):
+    return list(
+        Enrollment.objects.filter(is_active=True).values('school_class__name')
+        .annotate(count=Count('id')).order_by('-count')
+    )
+
+
+@data_provider('students.by_gender')
+def students_by_gender(configuration):
+    return list(StudentProfile.objects.values('gender').annotate(count=Count('id')).order_by('gender'))
+
+
+@metric_provider('staff.total')
+def staff_total():
+    return count_of('staff.total', StaffProfile, Q(is_active=True))
+
+
+@data_provider('staff.by_department')
+def staff_by_department(configuration):
+    return list(
+        StaffProfile.objects.filter(is_active=True).values('department__name')
+        .annotate(count=Count('id')).order_by('department__name')
+    )
+
+
+@metric_provider('admissions.pending')
+def admissions_pending():
+    return count_of('admissions.pending', AdmissionApplication, Q(status='pending'))
+
+
+@metric_provider('academic.classes')
+def academic_classes():
+    return count_of('academic.classes', SchoolClass, Q(is_active=True))
+
+
+@metric_provider('academic.subjects')
+def academic_subjects():
+    return count_of('academic.subjects', Subject, Q(is_active=True))
+
+
+@metric_provider('exams.upcoming')
+def exams_upcoming():
+    return count_of('exams.upcoming', Exam, Q(date__gte=timezone.localdate()))
+
+
+@metric_provider('exams.average_score')
+def exams_average_score():
+    return avg_of('exams.average_score', ExamResult, 'marks_obtained')
+
+
+@metric_provider('finance.revenue')
+def finance_revenue():
+    return sum_of('finance.revenue', LedgerDailyRollup, 'amount', Q(kind='revenue'))
+
+
+@metric_provider('finance.expenses')
+def finance_expenses():
+    return sum_of('finance.expenses', LedgerDailyRollup, 'amount', Q(kind='expense'))
+
+
+@metric_provider('finance.outstanding')
+def finance_outstanding():
+    return sum_of('finance.outstanding', Invoice, 'balance', Q(balance__gt=0))
+
+
+@metric_provider('finance.overdue_invoices')
+def finance_overdue_invoices():
+    return count_of('finance.overdue_invoices', Invoice, Q(status='overdue'))
+
+
+@data_provider('finance.expenses_by_category')
+def finance_expenses_by_category(configuration):
+    return list(ExpenseCube.objects.values('category').annotate(total=Sum('amount')).order_by('category'))
+
+
+def check_trends(configuration):
+    try:
+        months = int(configuration.get('months', 6))
+    except (TypeError, ValueError):
+        months = 0
+    if not 1 <= months <= MAX_TREND_MONTHS:
+        raise ValueError(f'months must be a whole number from 1 to {MAX_TREND_MONTHS}')
+    if configuration.get('bucket', 'month') not in BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+    today = timezone.localdate()
+    days = (today - month_start(today, months_back=months - 1)).days + 1
+    if configuration.get('bucket') == 'day' and days > MAX_DAY_BUCKETS:
+        raise ValueError(f'bucket=day covers at most {MAX_DAY_BUCKETS} days')
+
+
+@data_provider('finance.trends', check=check_trends)
+def finance_trends(configuration):
+    """Configuration: ``months`` (default 6) and ``bucket`` (default 'month')"""
+    today = timezone.localdate()
+    months = int(configuration.get('months', 6))
+    return ledger_trends(month_start(today, months_back=months - 1), today, configuration.get('bucket', 'month'))
+
+
+@metric_provider('attendance.today_present')
+def attendance_today_present():
+    return sum_of(
+        'attendance.today_present', AttendanceDailyRollup, 'count', Q(date=timezone.localdate(), status='present'), default=0
+    )
+
+
+@metric_provider('attendance.today_absent')
+def attendance_today_absent():
+    return sum_of(
+        'attendance.today_absent', AttendanceDailyRollup, 'count', Q(date=timezone.localdate(), status='absent'), default=0
+    )
+
+
+@metric_provider('hr.pending_leaves')
+def hr_pending_leaves():
+    return count_of('hr.pending_leaves', Leave, Q(status='pending'))
+
+
+@metric_provider('hr.today_present')
+def hr_today_present():
+    return count_of('hr.today_present', StaffAttendance, Q(date=timezone.localdate(), status='present'))
+
+
+def widget_cache_key(widget):
+    return f"dashboards:widget:{widget.pk}:{widget.data_source}:{widget.updated_at.timestamp()}"
+
+
+def evaluate_sources(widgets):
+    """
+    Evaluate the data sources of ``widgets``, batching every metric provider
+    into one planner run. Returns ``(results, errors)`` keyed by widget; a
+    widget with an unusable configuration has an error instead of a result.
+    """
+    specs = []
+    results, errors = {}, {}
+    for widget in widgets:
+        provider = PROVIDERS[widget.data_source]
+        try:
+            configuration = check_configuration(widget.data_source, widget.configuration)
+        except ValueError as error:
+            errors[widget.pk] = str(error)
+            continue
+        if provider.kind == 'metric':
+            specs.append(provider.build())
+        else:
+            results[widget.pk] = provider.build(configuration)
+
+    metrics = evaluate(specs)
+    for widget in widgets:
+        if widget.pk not in results and widget.pk not in errors:
+            results[widget.pk] = metrics[widget.data_source]
+    return results, errors
+
+
+def render_widgets(widgets):
+    """
+    Return ``{widget.pk: (data, cached, error)}`` for ``widgets``. Unknown data
+    sources and unusable configurations are reported with ``data=None`` and
+    the error.
+    """
+    widgets = list(widgets)
+    keys = {widget.pk: widget_cache_key(widget) for widget in widgets}
+    hits = cache.get_many(list(keys.values()))
+
+    rendered = {}
+    pending = []
+    for widget in widgets:
+        if keys[widget.pk] in hits:
+            rendered[widget.pk] = (hits[keys[widget.pk]], True, None)
+        elif widget.data_source not in PROVIDERS:
+            rendered[widget.pk] = (None, False, 'Unknown data source')
+        else:
+            pending.append(widget)
+
+    if pending:
+        results, errors = evaluate_sources(pending)
+        by_ttl = {}
+        for widget in pending:
+            if widget.pk in errors:
+                rendered[widget.pk] = (None, False, errors[widget.pk])
+                continue
+            rendered[widget.pk] = (results[widget.pk], False, None)
+            ttl = (widget.configuration or {}).get('cache_ttl', DEFAULT_CACHE_TTL)
+            by_ttl.setdefault(ttl, {})[keys[widget.pk]] = results[widget.pk]
+        for ttl, values in by_ttl.items():
+            if ttl:
+                cache.set_many(values, timeout=ttl)
+    return rendered
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Dashboard, DashboardWidget
+from .registry import check_configuration
 
 
 class DashboardWidgetSerializer(serializers.ModelSerializer):
@@ -11,6 +12,15 @@ class DashboardWidgetSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
+    def validate(self, attrs):
+        data_source = attrs.get('data_source', getattr(self.instance, 'data_source', None))
+        configuration = attrs.get('configuration', getattr(self.instance, 'configuration', None))
+        try:
+            check_configuration(data_source, configuration)
+        except ValueError as error:
+            raise serializers.ValidationError({'configuration': str(error)})
+        return attrs
+
 
 class DashboardSerializer(serializers.ModelSerializer):
     widgets = DashboardWidgetSerializer(many=True, read_only=True)
@@ -0,0 +1,53 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_versions
+from .snapshots import keys_for_model, refresh_snapshots
+from .stream import broker
+
+
+_pending = threading.local()
+
+
+def models_changed(*models):
+    """
+    Refresh derived snapshots, push them to live dashboard streams and
+    invalidate cached responses for ``models`` once the current transaction
+    commits. Bulk writers that bypass model signals (``update()``,
+    ``bulk_create()``) call this directly.
+
+    Changes are coalesced per thread until the commit: a transaction that
+    writes a hundred rows recomputes each affected snapshot once, not a
+    hundred times. Snapshots are still recomputed from their full source
+    tables rather than adjusted by deltas.
+    """
+    pending = getattr(_pending, 'models', None)
+    if pending is None:
+        pending = _pending.models = set()
+    pending.update(models)
+    # Every call registers a callback, so the set is flushed even if an
+    # earlier transaction that registered one rolled back; later ones no-op
+    transaction.on_commit(_flush_changes)
+
+
+def _flush_changes():
+    models, _pending.models = getattr(_pending, 'models', None), None
+    if not models:
+        return
+    keys = {key for model in models for key in keys_for_model(model)}
+    if keys:
+        snapshots = refresh_snapshots(keys)
+        broker.publish({key: snapshot.value for key, snapshot in snapshots.items()})
+    bump_versions(*models)
+
+
+@receiver([post_save, post_delete])
+def refresh_dependent_snapshots(sender, **kwargs):
+    """Recompute the overview snapshots and cache versions derived from the model that was written"""
+    if kwargs.get('raw'):
+        return
+
+    models_changed(sender)
@@ -0,0 +1,242 @@
+"""
+Materialized KPI snapshots for the overview dashboard.
+
+Every metric is registered together with the models it is derived from.
+Model signals (see ``signals.py``) recompute only the metrics that depend on
+the model that changed, and ``rebuild_snapshots`` recomputes everything so a
+periodic job can catch any drift. Metrics flagged as ``daily`` depend on the
+current date and are recomputed on read once their snapshot is from a
+previous day.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from users.models import User
+from adminstration.models import AcademicYear, Term, SchoolClass, Subject
+from admission.models import AdmissionApplication
+from students.models import StudentProfile, Enrollment
+from exams.models import Exam
+from finance.models import FeePayment, Invoice, Expense, ExpenseCube
+from finance.ledger import month_start
+from timetable.models import Timetable
+from staff.models import StaffProfile, Leave, Attendance as StaffAttendance
+from .models import MetricSnapshot
+
+SnapshotMetric = namedtuple('SnapshotMetric', ['key', 'compute', 'depends_on', 'daily'])
+
+METRICS = {}
+
+
+def metric(key, depends_on, daily=False):
+    """Register a snapshot metric computed by the decorated function"""
+    def decorator(func):
+        METRICS[key] = SnapshotMetric(key, func, tuple(depends_on), daily)
+        return func
+    return decorator
+
+
+def _sum(queryset, field):
+    return queryset.aggregate(total=Sum(field))['total'] or Decimal('0')
+
+
+def month_range(day, months_back=0):
+    """Return the [start, end) dates of the calendar month ``months_back`` months before ``day``"""
+    start = month_start(day, months_back)
+    return start, month_start(start, months_back=-1)
+
+
+@metric('users.total', [User])
+def users_total():
+    return User.objects.count()
+
+
+@metric('users.active', [User])
+def users_active():
+    return User.objects.filter(is_active=True).count()
+
+
+@metric('users.by_role', [User])
+def users_by_role():
+    return list(User.objects.values('role').annotate(count=Count('id')).order_by('role'))
+
+
+@metric('students.total', [StudentProfile])
+def students_total():
+    return StudentProfile.objects.count()
+
+
+@metric('students.active_enrollments', [Enrollment])
+def students_active_enrollments():
+    return Enrollment.objects.filter(is_active=True).count()
+
+
+@metric('students.by_class', [Enrollment, SchoolClass])
+def students_by_class():
+    return list(
+        Enrollment.objects.filter(is_active=True).values('school_class__name')
+        .annotate(count=Count('id')).order_by('school_class__name')
+    )
+
+
+@metric('staff.total', [StaffProfile])
+def staff_total():
+    return StaffProfile.objects.filter(is_active=True).count()
+
+
+@metric('staff.by_role', [StaffProfile, User])
+def staff_by_role():
+    return list(
+        StaffProfile.objects.filter(is_active=True).values('user__role')
+        .annotate(count=Count('id')).order_by('user__role')
+    )
+
+
+@metric('admissions.total', [AdmissionApplication])
+def admissions_total():
+    return AdmissionApplication.objects.count()
+
+
+@metric('admissions.pending', [AdmissionApplication])
+def admissions_pending():
+    return AdmissionApplication.objects.filter(status='pending').count()
+
+
+@metric('admissions.accepted', [AdmissionApplication])
+def admissions_accepted():
+    return AdmissionApplication.objects.filter(status='accepted').count()
+
+
+@metric('academic.active_years', [AcademicYear])
+def academic_active_years():
+    return AcademicYear.objects.filter(is_active=True).count()
+
+
+@metric('academic.active_terms', [Term])
+def academic_active_terms():
+    return Term.objects.filter(is_active=True).count()
+
+
+@metric('academic.classes', [SchoolClass])
+def academic_classes():
+    return SchoolClass.objects.filter(is_active=True).count()
+
+
+@metric('academic.subjects', [Subject])
+def academic_subjects():
+    return Subject.objects.filter(is_active=True).count()
+
+
+@metric('academic.active_timetables', [Timetable])
+def academic_active_timetables():
+    return Timetable.objects.filter(is_active=True).count()
+
+
+@metric('finance.total_revenue', [FeePayment])
+def finance_total_revenue():
+    return _sum(FeePayment.objects.filter(status='completed'), 'amount_paid')
+
+
+@metric('finance.total_expenses', [Expense])
+def finance_total_expenses():
+    return _sum(ExpenseCube.objects.all(), 'amount')
+
+
+@metric('finance.outstanding', [Invoice])
+def finance_outstanding():
+    return _sum(Invoice.objects.filter(balance__gt=0), 'balance')
+
+
+@metric('finance.month_revenue', [FeePayment], daily=True)
+def finance_month_revenue():
+    start, end = month_range(timezone.localdate())
+    return _sum(
+        FeePayment.objects.filter(status='completed', payment_date__gte=start, payment_date__lt=end),
+        'amount_paid'
+    )
+
+
+@metric('finance.month_expenses', [Expense], daily=True)
+def finance_month_expenses():
+    start, end = month_range(timezone.localdate())
+    return _sum(ExpenseCube.objects.filter(month=start), 'amount')
+
+
+@metric('exams.total', [Exam])
+def exams_total():
+    return Exam.objects.count()
+
+
+@metric('exams.upcoming', [Exam], daily=True)
+def exams_upcoming():
+    return Exam.objects.filter(date__gte=timezone.localdate()).count()
+
+
+@metric('hr.pending_leaves', [Leave])
+def hr_pending_leaves():
+    return Leave.objects.filter(status='pending').count()
+
+
+@metric('hr.today_attendance', [StaffAttendance], daily=True)
+def hr_today_attendance():
+    return StaffAttendance.objects.filter(date=timezone.localdate()).count()
+
+
+@metric('hr.today_present', [StaffAttendance], daily=True)
+def hr_today_present():
+    return StaffAttendance.objects.filter(date=timezone.localdate(), status='present').count()
+
+
+def keys_for_model(model):
+    """Return the snapshot keys derived from ``model``"""
+    return [m.key for m in METRICS.values() if model in m.depends_on]
+
+
+def refresh_snapshots(keys=None):
+    """Recompute the given snapshot keys (all of them by default) and persist them"""
+    keys = list(METRICS) if keys is None else list(keys)
+    now = timezone.now()
+    snapshots = [
+        MetricSnapshot(key=key, value=METRICS[key].compute(), computed_at=now)
+        for key in keys
+    ]
+    MetricSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['value', 'computed_at'],
+    )
+    return {s.key: s for s in snapshots}
+
+
+def refresh_snapshots_for(*models):
+    """Recompute every snapshot derived from any of ``models``"""
+    keys = {key for model in models for key in keys_for_model(model)}
+    if keys:
+        return refresh_snapshots(keys)
+    return {}
+
+
+def rebuild_snapshots():
+    """Recompute every registered metric and drop snapshots that are no longer registered"""
+    MetricSnapshot.objects.exclude(key__in=list(METRICS)).delete()
+    return refresh_snapshots()
+
+
+def load_snapshots():
+    """
+    Read every snapshot in one query, computing any that are missing or whose
+    date-dependent value is from a previous day.
+    """
+    snapshots = {s.key: s for s in MetricSnapshot.objects.filter(key__in=list(METRICS))}
+    today = timezone.localdate()
+    stale = [
+        key for key, m in METRICS.items()
+        if key not in snapshots
+        or (m.daily and timezone.localdate(snapshots[key].computed_at) != today)
+    ]
+    if stale:
+        snapshots.update(refresh_snapshots(stale))
+    return snapshots
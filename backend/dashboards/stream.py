@@ -0,0 +1,79 @@
+"""
+In-process pub/sub for live overview dashboard updates.
+
+``models_changed`` publishes the snapshot values it recomputed. The broker
+coalesces bursts of writes for ``DASHBOARD_STREAM_COALESCE_SECONDS``, drops
+values that did not actually change, encodes the delta once and hands the
+same payload to every subscriber queue, so fifty open screens cost about the
+same as one. Subscribers live in the ASGI event loop; publishing happens in
+worker threads, hence ``call_soon_threadsafe``.
+
+The broker is per process: with several ASGI workers each one fans out the
+writes it sees itself.
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class SnapshotBroker:
+    def __init__(self, window=None):
+        self.window = window
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._pending = {}
+        self._last_sent = {}
+        self._timer = None
+
+    def subscribe(self):
+        """Register a queue in the running event loop and return it"""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers = {(loop, q) for loop, q in self._subscribers if q is not queue}
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, changes):
+        """Queue ``{key: value}`` changes, flushing them after the coalescing window"""
+        if not changes:
+            return
+        window = self.window
+        if window is None:
+            window = getattr(settings, 'DASHBOARD_STREAM_COALESCE_SECONDS', 1.0)
+
+        with self._lock:
+            self._pending.update(changes)
+            if self._timer is None:
+                self._timer = threading.Timer(window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Send the pending changes that differ from what subscribers last received"""
+        with self._lock:
+            pending, self._pending, self._timer = self._pending, {}, None
+            delta = {key: value for key, value in pending.items() if self._last_sent.get(key) != value}
+            self._last_sent.update(delta)
+            subscribers = list(self._subscribers)
+
+        if not delta or not subscribers:
+            return 0
+
+        payload = json.dumps(delta, cls=DjangoJSONEncoder)
+        for loop, queue in subscribers:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, payload)
+        return len(subscribers)
+
+
+broker = SnapshotBroker()
@@ -1,2 +1,224 @@
+import asyncio
+import json
+from decimal import Decimal
+from datetime import date
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import User
+from finance.models import Expense
+from .models import Dashboard, DashboardWidget, MetricSnapshot
+from .planner import evaluate, count_of, sum_of
+from .snapshots import METRICS, rebuild_snapshots, refresh_snapshots
+from .stream import SnapshotBroker
+
+
+class OverviewSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(
+            email='admin@example.com', first_name='A', last_name='D', role='admin', password='pw'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_rebuild_persists_every_metric(self):
+        rebuild_snapshots()
+        self.assertEqual(MetricSnapshot.objects.count(), len(METRICS))
+        self.assertEqual(MetricSnapshot.objects.get(key='users.total').value, 1)
+
+    def test_overview_reads_snapshots_in_one_query(self):
+        rebuild_snapshots()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/dashboard/overview/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(response.data['users']['total'], 1)
+        self.assertIn('as_of', response.data)
+
+    def test_write_refreshes_dependent_snapshots(self):
+        rebuild_snapshots()
+        with self.captureOnCommitCallbacks(execute=True):
+            Expense.objects.create(
+                category='supplies', amount=Decimal('150.00'),
+                description='Chalk', expense_date=date.today()
+            )
+        response = self.client.get('/api/dashboard/overview/')
+        self.assertEqual(response.data['finance']['total_expenses'], Decimal('150.00'))
+        self.assertEqual(response.data['finance']['net_balance'], Decimal('-150.00'))
+
+    def test_writes_in_one_transaction_refresh_snapshots_once(self):
+        with mock.patch('dashboards.signals.refresh_snapshots', wraps=refresh_snapshots) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                for n in range(5):
+                    Expense.objects.create(
+                        category='supplies', amount=Decimal('10.00'), description=f'Chalk {n}', expense_date=date.today()
+                    )
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(Decimal(MetricSnapshot.objects.get(key='finance.total_expenses').value), Decimal('50.00'))
+
+
+class DashboardQueryPlannerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(
+            email='admin@example.com', first_name='A', last_name='D', role='admin', password='pw'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_metrics_on_one_model_share_a_query(self):
+        Expense.objects.create(category='supplies', amount=Decimal('10.00'), description='Pens', expense_date=date.today())
+        Expense.objects.create(category='utilities', amount=Decimal('25.00'), description='Power', expense_date=date.today())
+
+        with self.assertNumQueries(1):
+            metrics = evaluate([
+                count_of('expenses.count', Expense),
+                count_of('expenses.supplies', Expense, Q(category='supplies')),
+                sum_of('expenses.total', Expense, 'amount'),
+                sum_of('expenses.marketing', Expense, 'amount', Q(category='marketing')),
+            ])
+
+        self.assertEqual(metrics['expenses.count'], 2)
+        self.assertEqual(metrics['expenses.supplies'], 1)
+        self.assertEqual(metrics['expenses.total'], Decimal('35.00'))
+        self.assertEqual(metrics['expenses.marketing'], Decimal('0'))
+
+    def test_dashboard_query_counts(self):
+        expected = {
+            '/api/dashboard/students/': 6,
+            '/api/dashboard/finance/': 6,
+            '/api/dashboard/staff/': 8,
+            '/api/dashboard/academic/': 10,
+        }
+        for url, queries in expected.items():
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+
+class DashboardRenderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(
+            email='admin@example.com', first_name='A', last_name='D', role='admin', password='pw'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.dashboard = Dashboard.objects.create(name='Main', type='overview')
+        for position, source in enumerate(['users.total', 'users.active', 'finance.revenue', 'nope.unknown']):
+            DashboardWidget.objects.create(dashboard=self.dashboard, title=source, data_source=source, position=position)
+        DashboardWidget.objects.create(
+            dashboard=self.dashboard, title='Hidden', data_source='finance.expenses', is_active=False
+        )
+
+    def test_render_batches_active_widgets_and_caches(self):
+        url = f'/api/dashboard/dashboards/{self.dashboard.pk}/render/'
+        # dashboard + widgets, then one aggregate per table (users, ledger rollup)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        widgets = {w['data_source']: w for w in response.data['widgets']}
+        self.assertEqual(set(widgets), {'users.total', 'users.active', 'finance.revenue', 'nope.unknown'})
+        self.assertEqual(widgets['users.total']['data'], 1)
+        self.assertEqual(widgets['nope.unknown']['error'], 'Unknown data source')
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertTrue(all(w['cached'] for w in response.data['widgets'] if w['data_source'] != 'nope.unknown'))
+
+    def test_bad_configuration_fails_only_its_widget(self):
+        DashboardWidget.objects.create(
+            dashboard=self.dashboard, title='Trends', data_source='finance.trends', configuration={'months': 'six'}
+        )
+        DashboardWidget.objects.create(
+            dashboard=self.dashboard, title='Slow', data_source='students.total', configuration={'cache_ttl': 'soon'}
+        )
+        response = self.client.get(f'/api/dashboard/dashboards/{self.dashboard.pk}/render/')
+        self.assertEqual(response.status_code, 200)
+        errors = {w['title']: w['error'] for w in response.data['widgets']}
+        self.assertIn('months', errors['Trends'])
+        self.assertIn('cache_ttl', errors['Slow'])
+        self.assertIsNone(errors['users.total'])
+
+        other = Dashboard.objects.create(name='Finance', type='finance')
+        response = self.client.post('/api/dashboard/widgets/', {
+            'dashboard': other.pk, 'title': 'Trends', 'widget_type': 'chart', 'data_source': 'finance.trends',
+            'configuration': {'bucket': 'fortnight'},
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('bucket', str(response.data['configuration']))
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(
+            email='admin@example.com', first_name='A', last_name='D', role='admin', password='pw'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_write_invalidates_only_dependent_entries(self):
+        self.assertEqual(self.client.get('/api/dashboard/finance/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/dashboard/staff/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/dashboard/finance/')['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Expense.objects.create(
+                category='supplies', amount=Decimal('20.00'), description='Paper', expense_date=date.today()
+            )
+
+        response = self.client.get('/api/dashboard/finance/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['expenses']['total'], Decimal('20.00'))
+        self.assertEqual(self.client.get('/api/dashboard/staff/')['X-Cache'], 'HIT')
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get('/api/finance/trends/', {'bucket': 'month'})
+        self.assertEqual(self.client.get('/api/finance/trends/', {'bucket': 'day'})['X-Cache'], 'MISS')
+
+    def test_stats_report_hits_and_misses(self):
+        self.client.get('/api/dashboard/academic/')
+        self.client.get('/api/dashboard/academic/')
+        stats = self.client.get('/api/dashboard/cache-stats/').data
+        self.assertEqual(stats['endpoints']['dashboard.academic']['hits'], 1)
+        self.assertEqual(stats['endpoints']['dashboard.academic']['misses'], 1)
+
+
+class OverviewStreamTests(TestCase):
+    async def test_broker_coalesces_bursts_into_one_delta(self):
+        broker = SnapshotBroker(window=60)
+        first, second = broker.subscribe(), broker.subscribe()
+        broker.publish({'users.total': 1})
+        broker.publish({'users.total': 2, 'exams.total': 0})
+        self.assertEqual(broker.flush(), 2)
+        broker.publish({'exams.total': 0})
+        self.assertEqual(broker.flush(), 0)
+
+        for queue in (first, second):
+            payload = await asyncio.wait_for(queue.get(), timeout=1)
+            self.assertEqual(json.loads(payload), {'users.total': 2, 'exams.total': 0})
+            self.assertTrue(queue.empty())
+
+    async def test_stream_requires_token(self):
+        response = await self.async_client.get('/api/dashboard/overview/stream/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/api/dashboard/overview/stream/', headers={'Authorization': 'Bearer'})
+        self.assertEqual(response.status_code, 401)
 
+    async def test_stream_starts_with_full_snapshot(self):
+        admin = await User.objects.acreate(email='admin@example.com', first_name='A', last_name='D', role='admin')
+        token = str(AccessToken.for_user(admin))
+        response = await self.async_client.get('/api/dashboard/overview/stream/', {'token': token})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunk = await anext(aiter(response.streaming_content))
+        self.assertTrue(chunk.startswith(b'event: snapshot\n'))
+        self.assertIn(b'"users.total": 1', chunk)
@@ -2,10 +2,12 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     overview_dashboard,
+    overview_stream,
     student_dashboard,
     finance_dashboard,
     staff_dashboard,
     academic_dashboard,
+    response_cache_stats,
     DashboardViewSet,
     DashboardWidgetViewSet
 )
@@ -16,9 +18,11 @@ router.register(r'widgets', DashboardWidgetViewSet)
 
 urlpatterns = [
     path('overview/', overview_dashboard, name='overview-dashboard'),
+    path('overview/stream/', overview_stream, name='overview-stream'),
     path('students/', student_dashboard, name='student-dashboard'),
     path('finance/', finance_dashboard, name='finance-dashboard'),
     path('staff/', staff_dashboard, name='staff-dashboard'),
     path('academic/', academic_dashboard, name='academic-dashboard'),
+    path('cache-stats/', response_cache_stats, name='response-cache-stats'),
     path('', include(router.urls)),
 ]
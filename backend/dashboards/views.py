@@ -1,21 +1,35 @@
+import asyncio
+import json
 from decimal import Decimal
 
+from asgiref.sync import sync_to_async
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count, Sum, Avg, Q
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Sum, Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.views.decorators.http import require_GET
 from datetime import timedelta
 
-from users.models import User
-from adminstration.models import AcademicYear, Term, SchoolClass, Section, Subject
-from admission.models import AdmissionApplication, Guardian
+from adminstration.models import AcademicYear, SchoolClass, Section, Subject
+from admission.models import Guardian
 from students.models import StudentProfile, Enrollment, TeacherAssignment
 from exams.models import Exam, ExamResult
-from finance.models import FeeStructure, FeePayment, Invoice, Expense, Budget
-from timetable.models import Timetable, TimeSlot, TimetableEntry
+from finance.models import FeePayment, Invoice, Expense, ExpenseCube, Budget, LedgerDailyRollup
+from timetable.models import Timetable, TimetableEntry
 from staff.models import StaffProfile, Leave, Attendance as StaffAttendance, Payroll, Department
-from attendance.models import Attendance as StudentAttendance
+from attendance.models import Attendance as StudentAttendance, AttendanceDailyRollup
+from users.permissions import IsAdmin
+from .planner import evaluate, count_of, sum_of, avg_of
+from .cache import cached_response, cache_stats
+from .snapshots import METRICS, load_snapshots, month_range
+from .stream import broker
 
 ZERO_DECIMAL = Decimal('0')
 
@@ -26,100 +40,57 @@ def decimal_or_zero(value):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response('dashboard.overview', {model for m in METRICS.values() for model in m.depends_on})
 def overview_dashboard(request):
     """
-    Comprehensive overview dashboard with metrics from all apps
+    Comprehensive overview dashboard with metrics from all apps.
+    Served from the persisted KPI snapshots in a single read.
     """
-    now = timezone.now()
-    current_year = now.year
-    current_month = now.month
-    
-    total_users = User.objects.count()
-    users_by_role = User.objects.values('role').annotate(count=Count('id'))
-    active_users = User.objects.filter(is_active=True).count()
-    
-    total_students = StudentProfile.objects.count()
-    active_enrollments = Enrollment.objects.filter(is_active=True).count()
-    students_by_class = Enrollment.objects.filter(is_active=True).values('school_class__name').annotate(count=Count('id'))
-    
-    total_staff = StaffProfile.objects.filter(is_active=True).count()
-    staff_by_role = StaffProfile.objects.filter(is_active=True).values('user__role').annotate(count=Count('id'))
-    
-    total_applications = AdmissionApplication.objects.count()
-    pending_admissions = AdmissionApplication.objects.filter(status='pending').count()
-    accepted_admissions = AdmissionApplication.objects.filter(status='accepted').count()
-    
-    active_academic_years = AcademicYear.objects.filter(is_active=True).count()
-    active_terms = Term.objects.filter(is_active=True).count()
-    total_classes = SchoolClass.objects.filter(is_active=True).count()
-    total_subjects = Subject.objects.filter(is_active=True).count()
-    
-    total_fee_structures = FeeStructure.objects.filter(is_active=True).count()
-    total_revenue = decimal_or_zero(
-        FeePayment.objects.filter(status='completed').aggregate(total=Sum('amount_paid'))['total']
-    )
-    total_expenses = decimal_or_zero(Expense.objects.aggregate(total=Sum('amount'))['total'])
-    outstanding_invoices = decimal_or_zero(
-        Invoice.objects.filter(balance__gt=0).aggregate(total=Sum('balance'))['total']
-    )
+    snapshots = load_snapshots()
 
-    month_revenue = decimal_or_zero(
-        FeePayment.objects.filter(
-            status='completed',
-            payment_date__month=current_month,
-            payment_date__year=current_year
-        ).aggregate(total=Sum('amount_paid'))['total']
-    )
+    def value(key):
+        return snapshots[key].value
+
+    def amount(key):
+        return Decimal(str(snapshots[key].value))
+
+    total_revenue = amount('finance.total_revenue')
+    total_expenses = amount('finance.total_expenses')
+    month_revenue = amount('finance.month_revenue')
+    month_expenses = amount('finance.month_expenses')
 
-    month_expenses = decimal_or_zero(
-        Expense.objects.filter(
-            expense_date__month=current_month,
-            expense_date__year=current_year
-        ).aggregate(total=Sum('amount'))['total']
-    )
-    
-    total_exams = Exam.objects.count()
-    upcoming_exams = Exam.objects.filter(date__gte=now.date()).count()
-    
-    active_timetables = Timetable.objects.filter(is_active=True).count()
-    total_time_slots = TimeSlot.objects.filter(is_active=True).count()
-    
-    pending_leaves = Leave.objects.filter(status='pending').count()
-    today_attendance = StaffAttendance.objects.filter(date=now.date()).count()
-    today_present = StaffAttendance.objects.filter(date=now.date(), status='present').count()
-    
     return Response({
         'users': {
-            'total': total_users,
-            'active': active_users,
-            'by_role': list(users_by_role)
+            'total': value('users.total'),
+            'active': value('users.active'),
+            'by_role': value('users.by_role')
         },
         'students': {
-            'total': total_students,
-            'active_enrollments': active_enrollments,
-            'by_class': list(students_by_class)
+            'total': value('students.total'),
+            'active_enrollments': value('students.active_enrollments'),
+            'by_class': value('students.by_class')
         },
         'staff': {
-            'total': total_staff,
-            'by_role': list(staff_by_role)
+            'total': value('staff.total'),
+            'by_role': value('staff.by_role')
         },
         'admissions': {
-            'total': total_applications,
-            'pending': pending_admissions,
-            'accepted': accepted_admissions
+            'total': value('admissions.total'),
+            'pending': value('admissions.pending'),
+            'accepted': value('admissions.accepted')
         },
         'academic': {
-            'active_years': active_academic_years,
-            'active_terms': active_terms,
-            'classes': total_classes,
-            'subjects': total_subjects,
-            'active_timetables': active_timetables
+            'active_years': value('academic.active_years'),
+            'active_terms': value('academic.active_terms'),
+            'classes': value('academic.classes'),
+            'subjects': value('academic.subjects'),
+            'active_timetables': value('academic.active_timetables')
         },
         'finance': {
             'total_revenue': total_revenue,
             'total_expenses': total_expenses,
             'net_balance': total_revenue - total_expenses,
-            'outstanding': outstanding_invoices,
+            'outstanding': amount('finance.outstanding'),
             'this_month': {
                 'revenue': month_revenue,
                 'expenses': month_expenses,
@@ -127,61 +98,65 @@ def overview_dashboard(request):
             }
         },
         'exams': {
-            'total': total_exams,
-            'upcoming': upcoming_exams
+            'total': value('exams.total'),
+            'upcoming': value('exams.upcoming')
         },
         'hr': {
-            'pending_leaves': pending_leaves,
-            'today_attendance': today_attendance,
-            'today_present': today_present
-        }
+            'pending_leaves': value('hr.pending_leaves'),
+            'today_attendance': value('hr.today_attendance'),
+            'today_present': value('hr.today_present')
+        },
+        'as_of': min(s.computed_at for s in snapshots.values())
     })
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response('dashboard.students', [StudentProfile, Enrollment, SchoolClass, StudentAttendance])
 def student_dashboard(request):
     """
     Dashboard focused on student-related metrics
     """
-    total_students = StudentProfile.objects.count()
-    active_students = StudentProfile.objects.filter(enrollments__is_active=True).distinct().count()
-    
+    now = timezone.now()
+    today = now.date()
+    month_start, month_end = month_range(today)
+    thirty_days_ago = now - timedelta(days=30)
+    this_month = Q(date__gte=month_start, date__lt=month_end)
+
+    metrics = evaluate([
+        count_of('students.total', StudentProfile, distinct=True),
+        count_of('students.active', StudentProfile, Q(enrollments__is_active=True), distinct=True),
+        count_of('enrollments.recent', Enrollment, Q(enrolled_on__gte=thirty_days_ago)),
+        sum_of('attendance.today', AttendanceDailyRollup, 'count', Q(date=today), default=0),
+        sum_of('attendance.today_present', AttendanceDailyRollup, 'count', Q(date=today, status='present'), default=0),
+        sum_of('attendance.today_absent', AttendanceDailyRollup, 'count', Q(date=today, status='absent'), default=0),
+        sum_of('attendance.this_month', AttendanceDailyRollup, 'count', this_month, default=0),
+    ])
+
     enrollments_by_class = Enrollment.objects.filter(is_active=True).values(
         'school_class__name'
     ).annotate(count=Count('id')).order_by('-count')
-    
+
     students_by_gender = StudentProfile.objects.values('gender').annotate(count=Count('id'))
-    
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    recent_enrollments = Enrollment.objects.filter(enrolled_on__gte=thirty_days_ago).count()
-    
-    # Student attendance metrics
-    now = timezone.now()
-    today_student_attendance = StudentAttendance.objects.filter(date=now.date())
-    today_students_present = today_student_attendance.filter(status='present').count()
-    today_students_absent = today_student_attendance.filter(status='absent').count()
-    
-    this_month_attendance = StudentAttendance.objects.filter(
-        date__month=now.month,
-        date__year=now.year
-    )
-    attendance_by_status = this_month_attendance.values('status').annotate(count=Count('id'))
-    
+
+    attendance_by_status = AttendanceDailyRollup.objects.filter(this_month).values(
+        'status'
+    ).annotate(count=Sum('count')).order_by('status')
+
     return Response({
-        'total_students': total_students,
-        'active_students': active_students,
+        'total_students': metrics['students.total'],
+        'active_students': metrics['students.active'],
         'by_class': list(enrollments_by_class),
         'by_gender': list(students_by_gender),
-        'recent_enrollments': recent_enrollments,
+        'recent_enrollments': metrics['enrollments.recent'],
         'attendance': {
             'today': {
-                'total': today_student_attendance.count(),
-                'present': today_students_present,
-                'absent': today_students_absent
+                'total': metrics['attendance.today'],
+                'present': metrics['attendance.today_present'],
+                'absent': metrics['attendance.today_absent']
             },
             'this_month': {
-                'total': this_month_attendance.count(),
+                'total': metrics['attendance.this_month'],
                 'by_status': list(attendance_by_status)
             }
         }
@@ -190,61 +165,57 @@ def student_dashboard(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response('dashboard.finance', [FeePayment, Expense, Invoice, Budget, AcademicYear])
 def finance_dashboard(request):
     """
     Dashboard focused on financial metrics
     """
-    total_revenue = decimal_or_zero(
-        FeePayment.objects.filter(status='completed').aggregate(total=Sum('amount_paid'))['total']
-    )
+    today = timezone.now().date()
+    months = [month_range(today, months_back=i) for i in range(5, -1, -1)]
+
+    metrics = evaluate([
+        sum_of('revenue.total', LedgerDailyRollup, 'amount', Q(kind='revenue')),
+        sum_of('expenses.total', ExpenseCube, 'amount'),
+        sum_of('expenses.budgeted', ExpenseCube, 'amount', Q(academic_year__budget__isnull=False)),
+        count_of('invoices.total', Invoice),
+        count_of('invoices.paid', Invoice, Q(status='paid')),
+        count_of('invoices.overdue', Invoice, Q(status='overdue')),
+        sum_of('invoices.outstanding', Invoice, 'balance', Q(balance__gt=0)),
+        sum_of('budgets.total', Budget, 'total_budget'),
+    ] + [
+        sum_of(
+            f'revenue.{start:%Y-%m}', LedgerDailyRollup, 'amount', Q(kind='revenue', date__gte=start, date__lt=end)
+        )
+        for start, end in months
+    ] + [
+        sum_of(f'expense.{start:%Y-%m}', ExpenseCube, 'amount', Q(month=start))
+        for start, _end in months
+    ])
+
     revenue_by_method = FeePayment.objects.filter(status='completed').values('payment_method').annotate(total=Sum('amount_paid'))
-    
-    total_expenses = decimal_or_zero(Expense.objects.aggregate(total=Sum('amount'))['total'])
-    expenses_by_category = Expense.objects.values('category').annotate(total=Sum('amount'))
-    
-    total_invoices = Invoice.objects.count()
-    paid_invoices = Invoice.objects.filter(status='paid').count()
-    overdue_invoices = Invoice.objects.filter(status='overdue').count()
-    total_outstanding = decimal_or_zero(
-        Invoice.objects.filter(balance__gt=0).aggregate(total=Sum('balance'))['total']
-    )
-    
-    active_budgets = Budget.objects.all()
-    total_budget = decimal_or_zero(active_budgets.aggregate(total=Sum('total_budget'))['total'])
-    total_spent = decimal_or_zero(active_budgets.aggregate(total=Sum('total_budget'))['total'])
+    expenses_by_category = ExpenseCube.objects.values('category').annotate(total=Sum('amount')).order_by('category')
+
+    total_budget = metrics['budgets.total']
+    total_spent = metrics['expenses.budgeted']
     if total_budget > ZERO_DECIMAL:
         budget_utilization = (total_spent / total_budget * Decimal('100')).quantize(Decimal('0.01'))
     else:
         budget_utilization = ZERO_DECIMAL
-    
+
     monthly_trends = []
-    for i in range(6):
-        month_date = timezone.now() - timedelta(days=30*i)
-        month_revenue = decimal_or_zero(
-            FeePayment.objects.filter(
-                status='completed',
-                payment_date__month=month_date.month,
-                payment_date__year=month_date.year
-            ).aggregate(total=Sum('amount_paid'))['total']
-        )
-        
-        month_expenses = decimal_or_zero(
-            Expense.objects.filter(
-                expense_date__month=month_date.month,
-                expense_date__year=month_date.year
-            ).aggregate(total=Sum('amount'))['total']
-        )
-        
+    for start, _end in months:
+        month_revenue = metrics[f'revenue.{start:%Y-%m}']
+        month_expenses = metrics[f'expense.{start:%Y-%m}']
         monthly_trends.append({
-            'month': month_date.strftime('%B %Y'),
+            'month': start.strftime('%B %Y'),
             'revenue': month_revenue,
             'expenses': month_expenses,
             'net': month_revenue - month_expenses
         })
-    
+
     return Response({
         'revenue': {
-            'total': total_revenue,
+            'total': metrics['revenue.total'],
             'by_payment_method': [
                 {
                     'method': r['payment_method'],
@@ -254,7 +225,7 @@ def finance_dashboard(request):
             ]
         },
         'expenses': {
-            'total': total_expenses,
+            'total': metrics['expenses.total'],
             'by_category': [
                 {
                     'category': e['category'],
@@ -264,168 +235,274 @@ def finance_dashboard(request):
             ]
         },
         'invoices': {
-            'total': total_invoices,
-            'paid': paid_invoices,
-            'overdue': overdue_invoices,
-            'outstanding': total_outstanding
+            'total': metrics['invoices.total'],
+            'paid': metrics['invoices.paid'],
+            'overdue': metrics['invoices.overdue'],
+            'outstanding': metrics['invoices.outstanding']
         },
         'budgets': {
             'total_allocated': total_budget,
             'total_spent': total_spent,
             'utilization_percentage': budget_utilization
         },
-        'monthly_trends': monthly_trends[::-1]  # Reverse to show oldest first
+        'monthly_trends': monthly_trends  # Oldest month first
     })
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response('dashboard.staff', [StaffProfile, Department, Leave, StaffAttendance, Payroll])
 def staff_dashboard(request):
     """
     Dashboard focused on staff and HR metrics
     """
-    total_staff = StaffProfile.objects.filter(is_active=True).count()
+    now = timezone.now()
+    today = now.date()
+    month_start, month_end = month_range(today)
+    this_month = Q(date__gte=month_start, date__lt=month_end)
+    current_month_payroll = Q(month=now.month, year=now.year)
+
+    metrics = evaluate([
+        count_of('staff.total', StaffProfile, Q(is_active=True)),
+        count_of('leaves.total', Leave),
+        count_of('leaves.pending', Leave, Q(status='pending')),
+        count_of('leaves.approved', Leave, Q(status='approved')),
+        count_of('attendance.this_month', StaffAttendance, this_month),
+        count_of('attendance.today', StaffAttendance, Q(date=today)),
+        count_of('attendance.today_present', StaffAttendance, Q(date=today, status='present')),
+        count_of('attendance.today_absent', StaffAttendance, Q(date=today, status='absent')),
+        count_of('attendance.today_late', StaffAttendance, Q(date=today, status='late')),
+        count_of('payroll.processed', Payroll, current_month_payroll & Q(status__in=['processed', 'paid'])),
+        sum_of('payroll.total', Payroll, 'net_salary', current_month_payroll),
+    ])
+
     staff_by_department = StaffProfile.objects.filter(is_active=True).values(
         'department__name'
     ).annotate(count=Count('id'))
-    
+
     staff_by_employment = StaffProfile.objects.filter(is_active=True).values(
         'employment_type'
     ).annotate(count=Count('id'))
-    
-    total_leaves = Leave.objects.count()
-    pending_leaves = Leave.objects.filter(status='pending').count()
-    approved_leaves = Leave.objects.filter(status='approved').count()
+
     leaves_by_type = Leave.objects.values('leave_type').annotate(count=Count('id'))
-    
-    now = timezone.now()
-    this_month_attendance = StaffAttendance.objects.filter(
-        date__month=now.month,
-        date__year=now.year
-    )
-    attendance_by_status = this_month_attendance.values('status').annotate(count=Count('id'))
-    
-    today_attendance = StaffAttendance.objects.filter(date=now.date())
-    today_present = today_attendance.filter(status='present').count()
-    today_absent = today_attendance.filter(status='absent').count()
-    today_late = today_attendance.filter(status='late').count()
-    
-    current_month_payroll = Payroll.objects.filter(month=now.month, year=now.year)
-    payroll_processed = current_month_payroll.filter(status__in=['processed', 'paid']).count()
-    total_payroll_amount = decimal_or_zero(
-        current_month_payroll.aggregate(total=Sum('net_salary'))['total']
-    )
-    
+
+    attendance_by_status = StaffAttendance.objects.filter(this_month).values(
+        'status'
+    ).annotate(count=Count('id')).order_by('status')
+
     return Response({
         'staff': {
-            'total': total_staff,
+            'total': metrics['staff.total'],
             'by_department': list(staff_by_department),
             'by_employment_type': list(staff_by_employment)
         },
         'leaves': {
-            'total': total_leaves,
-            'pending': pending_leaves,
-            'approved': approved_leaves,
+            'total': metrics['leaves.total'],
+            'pending': metrics['leaves.pending'],
+            'approved': metrics['leaves.approved'],
             'by_type': list(leaves_by_type)
         },
         'attendance': {
             'this_month': {
-                'total': this_month_attendance.count(),
+                'total': metrics['attendance.this_month'],
                 'by_status': list(attendance_by_status)
             },
             'today': {
-                'total': today_attendance.count(),
-                'present': today_present,
-                'absent': today_absent,
-                'late': today_late
+                'total': metrics['attendance.today'],
+                'present': metrics['attendance.today_present'],
+                'absent': metrics['attendance.today_absent'],
+                'late': metrics['attendance.today_late']
             }
         },
         'payroll': {
-            'current_month_processed': payroll_processed,
-            'current_month_total': total_payroll_amount
+            'current_month_processed': metrics['payroll.processed'],
+            'current_month_total': metrics['payroll.total']
         }
     })
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response('dashboard.academic', [SchoolClass, Section, Subject, Enrollment, TeacherAssignment, Timetable, Exam, ExamResult])
 def academic_dashboard(request):
-    now = timezone.now()  # ✅ add this
+    today = timezone.now().date()
 
-    total_classes = SchoolClass.objects.filter(is_active=True).count()
-    total_sections = Section.objects.filter(is_active=True).count()
-    total_subjects = Subject.objects.filter(is_active=True).count()
+    metrics = evaluate([
+        count_of('classes.total', SchoolClass, Q(is_active=True)),
+        count_of('sections.total', Section, Q(is_active=True)),
+        count_of('subjects.total', Subject, Q(is_active=True)),
+        count_of('assignments.total', TeacherAssignment),
+        count_of('timetables.active', Timetable, Q(is_active=True)),
+        count_of('exams.total', Exam),
+        count_of('exams.upcoming', Exam, Q(date__gte=today)),
+        count_of('exams.completed', Exam, Q(date__lt=today)),
+        count_of('results.total', ExamResult),
+        avg_of('results.average', ExamResult, 'marks_obtained'),
+    ])
 
     students_per_class = Enrollment.objects.filter(is_active=True).values(
         'school_class__name'
     ).annotate(count=Count('id')).order_by('-count')
 
-    total_assignments = TeacherAssignment.objects.count()
     assignments_by_subject = TeacherAssignment.objects.values(
         'subject__name'
     ).annotate(count=Count('id')).order_by('-count')[:10]
 
-    active_timetables = Timetable.objects.filter(is_active=True).count()
     timetables_by_class = Timetable.objects.filter(is_active=True).values(
         'school_class__name'
     ).annotate(count=Count('id'))
 
-    total_exams = Exam.objects.count()
-    upcoming_exams = Exam.objects.filter(date__gte=now.date()).count()
-    completed_exams = Exam.objects.filter(date__lt=now.date()).count()
-
-    total_results = ExamResult.objects.count()
-    average_score = ExamResult.objects.aggregate(avg=Avg('marks_obtained'))['avg'] or 0
-
     return Response({
         'structure': {
-            'classes': total_classes,
-            'sections': total_sections,
-            'subjects': total_subjects
+            'classes': metrics['classes.total'],
+            'sections': metrics['sections.total'],
+            'subjects': metrics['subjects.total']
         },
         'enrollment': {
             'by_class': list(students_per_class)
         },
         'teachers': {
-            'total_assignments': total_assignments,
+            'total_assignments': metrics['assignments.total'],
             'top_subjects': list(assignments_by_subject)
         },
         'timetables': {
-            'active': active_timetables,
+            'active': metrics['timetables.active'],
             'by_class': list(timetables_by_class)
         },
         'exams': {
-            'total': total_exams,
-            'upcoming': upcoming_exams,
-            'completed': completed_exams
+            'total': metrics['exams.total'],
+            'upcoming': metrics['exams.upcoming'],
+            'completed': metrics['exams.completed']
         },
         'results': {
-            'total': total_results,
-            'average_score': round(average_score, 2)
+            'total': metrics['results.total'],
+            'average_score': round(metrics['results.average'], 2)
         }
     })
 
 
+async def _stream_user(request):
+    """Authenticate a stream request from the Authorization header or a ``token`` query param"""
+    authenticator = JWTAuthentication()
+    try:
+        # A malformed header (``Bearer`` with no token) fails like a bad token
+        header = authenticator.get_header(request)
+        raw_token = authenticator.get_raw_token(header) if header else None
+        raw_token = raw_token or request.GET.get('token')
+        if not raw_token:
+            return None
+        validated_token = authenticator.get_validated_token(raw_token)
+        return await sync_to_async(authenticator.get_user)(validated_token)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def _overview_events():
+    queue = broker.subscribe()
+    keepalive = getattr(settings, 'DASHBOARD_STREAM_KEEPALIVE_SECONDS', 15)
+    try:
+        snapshots = await sync_to_async(load_snapshots)()
+        state = {key: snapshot.value for key, snapshot in snapshots.items()}
+        yield _sse('snapshot', json.dumps(state, cls=DjangoJSONEncoder))
+        while True:
+            try:
+                payload = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield _sse('delta', payload)
+    finally:
+        broker.unsubscribe(queue)
+
+
+@require_GET
+async def overview_stream(request):
+    """
+    Server-Sent-Events stream of the overview metrics (needs an ASGI server).
+    Sends a full ``snapshot`` event, then ``delta`` events holding only the
+    metrics that changed. EventSource cannot set headers, so the JWT access
+    token may be passed as ``?token=``.
+    """
+    user = await _stream_user(request)
+    if user is None or not user.is_active:
+        return JsonResponse(
+            {'detail': 'Authentication credentials were not provided or are invalid.'},
+            status=401
+        )
+
+    return StreamingHttpResponse(
+        _overview_events(),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def response_cache_stats(request):
+    """
+    Hit/miss counters of the dashboard and statistics response cache
+    """
+    return Response(cache_stats())
+
+
 # Dashboard Configuration ViewSets
 
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from .models import Dashboard, DashboardWidget
+from .registry import render_widgets
 from .serializers import DashboardSerializer, DashboardWidgetSerializer
-from users.permissions import IsAdmin
 
 
 class DashboardViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing dashboard configurations.
-    Only admins can manage dashboards.
+    Only admins can manage dashboards; any authenticated user can render one.
     """
     queryset = Dashboard.objects.select_related('created_by')
     serializer_class = DashboardSerializer
-    permission_classes = [IsAdmin]
     filterset_fields = ['type', 'is_active']
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'type', 'created_at']
     ordering = ['-created_at']
 
+    def get_permissions(self):
+        if self.action == 'render_widgets':
+            return [IsAuthenticated()]
+        return [IsAdmin()]
+
+    @action(detail=True, methods=['get'], url_path='render')
+    def render_widgets(self, request, pk=None):
+        """Evaluate every active widget of a dashboard in one batched request"""
+        dashboard = self.get_object()
+        widgets = list(dashboard.widgets.filter(is_active=True))
+        rendered = render_widgets(widgets)
+
+        return Response({
+            'id': dashboard.id,
+            'name': dashboard.name,
+            'type': dashboard.type,
+            'widgets': [
+                {
+                    'id': widget.id,
+                    'title': widget.title,
+                    'widget_type': widget.widget_type,
+                    'chart_type': widget.chart_type,
+                    'data_source': widget.data_source,
+                    'configuration': widget.configuration,
+                    'position': widget.position,
+                    'data': rendered[widget.id][0],
+                    'cached': rendered[widget.id][1],
+                    'error': rendered[widget.id][2],
+                }
+                for widget in widgets
+            ]
+        })
+
 
 class DashboardWidgetViewSet(viewsets.ModelViewSet):
     """
@@ -1,6 +1,7 @@
 
 from rest_framework import viewsets, filters
 from django_filters.rest_framework import DjangoFilterBackend
+from server.exports import ExportMixin
 from .models import Exam, ExamResult
 from .serializers import ExamSerializer, ExamResultSerializer
 
@@ -12,10 +13,22 @@ class ExamViewSet(viewsets.ModelViewSet):
 	search_fields = ['name']
 	ordering_fields = ['date', 'total_marks']
 
-class ExamResultViewSet(viewsets.ModelViewSet):
+class ExamResultViewSet(ExportMixin, viewsets.ModelViewSet):
 	queryset = ExamResult.objects.select_related('exam', 'student').all()
 	serializer_class = ExamResultSerializer
 	filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
 	filterset_fields = ['exam', 'student', 'grade']
 	search_fields = ['student__first_name', 'student__last_name']
 	ordering_fields = ['marks_obtained']
+	export_filename = 'exam-results'
+	export_columns = [
+		('Exam', 'exam__name'),
+		('Subject', 'exam__subject__name'),
+		('Class', 'exam__school_class__name'),
+		('Exam date', 'exam__date'),
+		('Admission number', 'student__admission_number'),
+		('First name', 'student__first_name'),
+		('Last name', 'student__last_name'),
+		('Marks', 'marks_obtained'),
+		('Grade', 'grade'),
+	]
@@ -0,0 +1,72 @@
+"""
+Per-student fee accounts.
+
+``StudentAccount`` holds one row per student: what they were billed (issued,
+uncancelled invoices), what they paid (completed payments, including credit
+not yet allocated), the balance between the two and the due date of their
+oldest unpaid invoice. Invoice and FeePayment writes refresh the accounts of
+the students they touch in the same transaction (see ``signals.py``; bulk
+writers call ``refresh_student_accounts`` themselves), so "does this student
+owe money?" is a primary-key lookup for one student or a whole class.
+"""
+from decimal import Decimal
+
+from django.db.models import Min, Sum
+
+from .models import FeePayment, Invoice, StudentAccount
+
+BILLED_STATUSES = ('sent', 'overdue', 'paid')
+UNPAID_STATUSES = ('sent', 'overdue')
+
+
+def account_rows(student_ids=None):
+    """Build StudentAccount rows from the source tables, for ``student_ids`` or everyone with fee activity"""
+    invoices = Invoice.objects.filter(status__in=BILLED_STATUSES)
+    payments = FeePayment.objects.filter(status='completed')
+    unpaid = Invoice.objects.filter(status__in=UNPAID_STATUSES, balance__gt=0)
+    if student_ids is not None:
+        invoices = invoices.filter(student_id__in=student_ids)
+        payments = payments.filter(student_id__in=student_ids)
+        unpaid = unpaid.filter(student_id__in=student_ids)
+
+    billed = dict(invoices.order_by().values_list('student_id').annotate(total=Sum('total_amount')))
+    paid = dict(payments.order_by().values_list('student_id').annotate(total=Sum('amount_paid')))
+    oldest = dict(unpaid.order_by().values_list('student_id').annotate(due=Min('due_date')))
+
+    rows = []
+    for student_id in set(billed) | set(paid) | set(oldest) | set(student_ids or ()):
+        total_billed = billed.get(student_id, Decimal('0.00'))
+        total_paid = paid.get(student_id, Decimal('0.00'))
+        rows.append(StudentAccount(
+            student_id=student_id,
+            total_billed=total_billed,
+            total_paid=total_paid,
+            balance=total_billed - total_paid,
+            oldest_unpaid_due_date=oldest.get(student_id),
+        ))
+    return rows
+
+
+def save_accounts(rows, batch_size=1000):
+    StudentAccount.objects.bulk_create(
+        rows,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['student'],
+        update_fields=['total_billed', 'total_paid', 'balance', 'oldest_unpaid_due_date', 'updated_at'],
+    )
+
+
+def refresh_student_accounts(student_ids):
+    """Recompute the accounts of the given students from their invoices and payments"""
+    student_ids = {student_id for student_id in student_ids if student_id is not None}
+    if student_ids:
+        save_accounts(account_rows(student_ids))
+
+
+def rebuild_student_accounts():
+    """Recompute every account; returns how many rows were written"""
+    StudentAccount.objects.all().delete()
+    rows = account_rows()
+    save_accounts(rows)
+    return len(rows)
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import FeeStructure, FeePayment, Invoice, Expense, Budget
+from .models import (
+    FeeStructure, FeePayment, Invoice, InvoiceSequence, PaymentAllocation, StudentAccount, OverdueSweep,
+    DunningReminder, Expense, Budget, LedgerDailyRollup, ExpenseCube
+)
 
 
 @admin.register(FeeStructure)
@@ -19,6 +22,12 @@ class FeePaymentAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
 
 
+@admin.register(InvoiceSequence)
+class InvoiceSequenceAdmin(admin.ModelAdmin):
+    list_display = ['year', 'next_number', 'updated_at']
+    readonly_fields = ['updated_at']
+
+
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
     list_display = ['invoice_number', 'student', 'total_amount', 'paid_amount', 'balance', 'status', 'due_date']
@@ -28,6 +37,37 @@ class InvoiceAdmin(admin.ModelAdmin):
     readonly_fields = ['invoice_number', 'balance', 'created_at', 'updated_at']
 
 
+@admin.register(PaymentAllocation)
+class PaymentAllocationAdmin(admin.ModelAdmin):
+    list_display = ['payment', 'invoice', 'amount', 'created_at']
+    search_fields = ['payment__transaction_reference', 'invoice__invoice_number']
+    raw_id_fields = ['payment', 'invoice']
+    readonly_fields = ['created_at']
+
+
+@admin.register(StudentAccount)
+class StudentAccountAdmin(admin.ModelAdmin):
+    list_display = ['student', 'total_billed', 'total_paid', 'balance', 'oldest_unpaid_due_date', 'updated_at']
+    search_fields = ['student__admission_number', 'student__first_name', 'student__last_name']
+    ordering = ['-balance']
+    readonly_fields = ['student', 'total_billed', 'total_paid', 'balance', 'oldest_unpaid_due_date', 'updated_at']
+
+
+@admin.register(OverdueSweep)
+class OverdueSweepAdmin(admin.ModelAdmin):
+    list_display = ['as_of', 'window_start', 'invoices_marked', 'reminders_queued', 'ran_at']
+    ordering = ['-as_of']
+    readonly_fields = ['as_of', 'window_start', 'invoices_marked', 'reminders_queued', 'ran_at']
+
+
+@admin.register(DunningReminder)
+class DunningReminderAdmin(admin.ModelAdmin):
+    list_display = ['guardian', 'total_due', 'status', 'sent_at', 'created_at']
+    list_filter = ['status']
+    search_fields = ['guardian__first_name', 'guardian__last_name', 'guardian__email']
+    raw_id_fields = ['guardian', 'sweep', 'invoices']
+    readonly_fields = ['created_at', 'sent_at']
+
 
 @admin.register(Expense)
 class ExpenseAdmin(admin.ModelAdmin):
@@ -47,3 +87,19 @@ class BudgetAdmin(admin.ModelAdmin):
     readonly_fields = ['total_expenses', 'remaining_budget', 'created_at', 'updated_at']
 
 
+@admin.register(LedgerDailyRollup)
+class LedgerDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'kind', 'amount', 'entries', 'updated_at']
+    list_filter = ['kind']
+    date_hierarchy = 'date'
+    ordering = ['-date']
+    readonly_fields = ['kind', 'date', 'amount', 'entries', 'updated_at']
+
+
+@admin.register(ExpenseCube)
+class ExpenseCubeAdmin(admin.ModelAdmin):
+    list_display = ['month', 'category', 'academic_year', 'amount', 'entries', 'updated_at']
+    list_filter = ['category', 'academic_year']
+    date_hierarchy = 'month'
+    ordering = ['-month', 'category']
+    readonly_fields = ['category', 'month', 'academic_year', 'amount', 'entries', 'updated_at']
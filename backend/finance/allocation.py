@@ -0,0 +1,195 @@
+"""
+Payment-to-invoice allocation.
+
+Every completed ``FeePayment`` is split into ``PaymentAllocation`` rows over
+the student's open invoices, oldest due date first. An invoice's
+``paid_amount``, ``balance`` and ``status`` move with its allocations through
+single ``F()`` UPDATEs in the same transaction, so recording a payment costs
+a query per allocation rather than re-aggregating the student's history.
+Payment writes keep their allocations in step (see ``signals.py``); money
+left over once every invoice is settled stays unallocated credit until an
+invoice of the student opens (``allocate_credit``). Cancelling an invoice
+releases its allocations back into credit. ``reconcile_allocations`` (the
+``reconcile_invoice_balances`` command) checks the stored figures against
+the allocations and repairs any drift.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from dashboards.signals import models_changed
+from .accounts import refresh_student_accounts
+from .models import FeePayment, Invoice, PaymentAllocation, expected_status
+
+OPEN_STATUSES = ('sent', 'overdue')
+
+
+def apply_to_invoice(invoice_id, amount):
+    """Add ``amount`` (negative to take it back) to an invoice's paid amount in one UPDATE"""
+    today = timezone.localdate()
+    Invoice.objects.filter(pk=invoice_id).update(
+        # First, so it reads the balance from before this change on every backend
+        status=Case(
+            When(status='cancelled', then=F('status')),
+            When(balance__lte=amount, then=Value('paid')),
+            When(status='paid', due_date__lt=today, then=Value('overdue')),
+            When(status='paid', then=Value('sent')),
+            default=F('status'),
+        ),
+        paid_amount=F('paid_amount') + amount,
+        balance=F('balance') - amount,
+        updated_at=timezone.now(),
+    )
+
+
+def release_allocations(allocations):
+    """Take the given allocations back off their invoices and delete them; returns how many"""
+    released = 0
+    with transaction.atomic():
+        for allocation_id, invoice_id, amount in allocations.values_list('pk', 'invoice_id', 'amount'):
+            apply_to_invoice(invoice_id, -amount)
+            PaymentAllocation.objects.filter(pk=allocation_id).delete()
+            released += 1
+    if released:
+        models_changed(Invoice, PaymentAllocation)
+    return released
+
+
+def allocate_payment(payment):
+    """
+    Spread the unallocated part of a completed ``payment`` over the student's
+    open invoices, oldest due date first, and return the new allocations.
+    """
+    if payment.status != 'completed':
+        return []
+    with transaction.atomic():
+        allocated = payment.allocations.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        remaining = payment.amount_paid - allocated
+        if remaining <= 0:
+            return []
+        invoices = Invoice.objects.select_for_update().filter(
+            student_id=payment.student_id, status__in=OPEN_STATUSES, balance__gt=0
+        ).order_by('due_date', 'issue_date', 'pk').values_list('pk', 'balance')
+
+        allocations = []
+        for invoice_id, balance in invoices:
+            amount = min(remaining, balance)
+            allocations.append(PaymentAllocation(payment=payment, invoice_id=invoice_id, amount=amount))
+            apply_to_invoice(invoice_id, amount)
+            remaining -= amount
+            if remaining <= 0:
+                break
+        PaymentAllocation.objects.bulk_create(allocations)
+    if allocations:
+        models_changed(Invoice, PaymentAllocation)
+    return allocations
+
+
+def with_credit(payments):
+    """The completed ``payments`` that still have money not allocated to an invoice"""
+    return payments.filter(status='completed').annotate(
+        allocated=Sum('allocations__amount')
+    ).filter(Q(allocated__isnull=True) | Q(allocated__lt=F('amount_paid')))
+
+
+def allocate_credit(student_ids):
+    """
+    Apply the unallocated credit of the students' completed payments to their
+    open invoices, oldest payment first. Returns the students whose invoices
+    changed.
+    """
+    changed = set()
+    if not student_ids:
+        return changed
+    for payment in with_credit(FeePayment.objects.filter(student_id__in=student_ids)).order_by('payment_date', 'pk'):
+        if allocate_payment(payment):
+            changed.add(payment.student_id)
+    return changed
+
+
+def sync_invoice_allocations(invoice):
+    """
+    Keep allocations in step with an invoice's status: a cancelled invoice
+    gives its money back as credit for the student's other invoices, and an
+    open one takes whatever credit the student has.
+    """
+    with transaction.atomic():
+        if invoice.status == 'cancelled':
+            if not release_allocations(invoice.allocations.all()):
+                return set()
+        elif invoice.status not in OPEN_STATUSES or invoice.balance <= 0:
+            return set()
+        return allocate_credit({invoice.student_id})
+
+
+def sync_payment_allocations(payment):
+    """
+    Bring ``payment``'s allocations in line with its current state: none
+    unless it is completed, only on its own student's invoices, and never more
+    than the amount paid. Then allocate whatever is left.
+    """
+    with transaction.atomic():
+        allocations = payment.allocations.all()
+        if payment.status != 'completed':
+            release_allocations(allocations)
+            return []
+        release_allocations(allocations.exclude(invoice__student_id=payment.student_id))
+        allocated = allocations.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        if allocated > payment.amount_paid:
+            release_allocations(allocations)
+        return allocate_payment(payment)
+
+
+def reconcile_allocations(repair=False):
+    """
+    Compare every invoice's paid amount, balance and status with its
+    allocations, and find completed payments with credit left while their
+    student has open invoices. With ``repair`` drifted invoices are rewritten
+    and the credit allocated. Returns counts of what was found.
+    """
+    allocated = dict(
+        PaymentAllocation.objects.order_by().values_list('invoice_id').annotate(total=Sum('amount'))
+    )
+    today = timezone.localdate()
+    drifted = []
+    for invoice in Invoice.objects.order_by().only(
+        'pk', 'student_id', 'total_amount', 'paid_amount', 'balance', 'status', 'due_date'
+    ).iterator(chunk_size=2000):
+        paid = allocated.get(invoice.pk, Decimal('0.00'))
+        balance = invoice.total_amount - paid
+        status = expected_status(invoice.status, balance, invoice.due_date, today)
+        if (invoice.paid_amount, invoice.balance, invoice.status) != (paid, balance, status):
+            invoice.paid_amount, invoice.balance, invoice.status = paid, balance, status
+            drifted.append(invoice)
+
+    open_students = Invoice.objects.filter(status__in=OPEN_STATUSES, balance__gt=0).values('student_id')
+    # Drifted invoices count as they will be once repaired
+    reopened = {invoice.student_id for invoice in drifted if invoice.status in OPEN_STATUSES and invoice.balance > 0}
+    credit = with_credit(FeePayment.objects.filter(Q(student_id__in=open_students) | Q(student_id__in=reopened)))
+    stray = PaymentAllocation.objects.filter(
+        ~Q(payment__status='completed') | ~Q(payment__student_id=F('invoice__student_id'))
+    )
+
+    summary = {'invoices': len(drifted), 'stray_allocations': stray.count(), 'payments_with_credit': 0}
+    if not repair:
+        summary['payments_with_credit'] = credit.count()
+        return summary
+
+    with transaction.atomic():
+        now = timezone.now()
+        for invoice in drifted:
+            invoice.updated_at = now
+        Invoice.objects.bulk_update(drifted, ['paid_amount', 'balance', 'status', 'updated_at'], batch_size=1000)
+        students = {invoice.student_id for invoice in drifted}
+        students.update(stray.values_list('invoice__student_id', flat=True))
+        release_allocations(stray)
+        # Oldest payments first, so credit settles the oldest invoices
+        for payment in credit.order_by('payment_date', 'pk'):
+            if allocate_payment(payment):
+                summary['payments_with_credit'] += 1
+                students.add(payment.student_id)
+        refresh_student_accounts(students)
+    models_changed(Invoice, PaymentAllocation)
+    return summary
@@ -0,0 +1,145 @@
+"""
+Expense cube: category x calendar month x academic year.
+
+``ExpenseCube`` holds one row per cell that has expenses. Expense writes
+recompute only the months they touch, and academic year edits the months the
+year spans (see ``signals.py``), so summaries group a few hundred small rows
+instead of scanning Expense:
+
+* ``slice_cube`` rolls the cube up to any subset of the dimensions, sliced by
+  category, academic year and a month range;
+* ``cell_expenses`` drills a cell (or any slice) down to its Expense rows,
+  which the expense list exposes through the same query parameters.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from adminstration.models import AcademicYear
+from .ledger import month_start
+from .models import Expense, ExpenseCube
+
+DIMENSIONS = ('category', 'month', 'academic_year')
+
+
+def next_month(day):
+    return month_start(day, months_back=-1)
+
+
+def parse_month(value):
+    """``YYYY-MM`` (or a full date) as the first of that month; None when empty, ValueError when invalid"""
+    if not value:
+        return None
+    return month_start(date.fromisoformat(value if len(value) > 7 else f'{value}-01'))
+
+
+def expense_year():
+    """The academic year an expense counts toward: the latest-starting year covering its date"""
+    return Subquery(AcademicYear.objects.filter(
+        start_date__lte=OuterRef('expense_date'), end_date__gte=OuterRef('expense_date')
+    ).order_by('-start_date').values('pk')[:1])
+
+
+def cube_rows(expenses):
+    """Aggregate ``expenses`` into unsaved cube cells"""
+    cells = expenses.annotate(month=TruncMonth('expense_date'), year=expense_year()).values(
+        'category', 'month', 'year'
+    ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+    return [
+        ExpenseCube(
+            category=cell['category'], month=cell['month'], academic_year_id=cell['year'],
+            year_key=cell['year'] or 0, amount=cell['total'], entries=cell['count'],
+        )
+        for cell in cells
+    ]
+
+
+def refresh_expense_months(dates):
+    """Recompute the cube cells of the calendar months containing ``dates``"""
+    months = {month_start(day) for day in dates if day is not None}
+    if not months:
+        return
+    within = Q(pk__in=[])
+    for month in months:
+        within |= Q(expense_date__gte=month, expense_date__lt=next_month(month))
+    cells = cube_rows(Expense.objects.filter(within))
+    fresh = {(cell.category, cell.month, cell.year_key) for cell in cells}
+    with transaction.atomic(savepoint=False):
+        # Upsert rather than delete and re-insert, so concurrent writers to one month cannot collide
+        if cells:
+            ExpenseCube.objects.bulk_create(
+                cells,
+                update_conflicts=True,
+                unique_fields=['category', 'month', 'year_key'],
+                update_fields=['academic_year', 'amount', 'entries', 'updated_at'],
+            )
+        stale = [
+            pk for pk, *key in ExpenseCube.objects.filter(month__in=months).values_list(
+                'pk', 'category', 'month', 'year_key'
+            )
+            if tuple(key) not in fresh
+        ]
+        if stale:
+            ExpenseCube.objects.filter(pk__in=stale).delete()
+
+
+def rebuild_expense_cube():
+    """Recompute the whole cube from Expense; returns how many cells were written"""
+    ExpenseCube.objects.all().delete()
+    return len(ExpenseCube.objects.bulk_create(cube_rows(Expense.objects.all()), batch_size=1000))
+
+
+def sliced(queryset, category=None, academic_year=None, month_from=None, month_to=None, month_field='month'):
+    """
+    Restrict ``queryset`` to a slice: categories (one or a list), an academic
+    year and months from/to (inclusive, any day of the month).
+    """
+    if category:
+        queryset = queryset.filter(category__in=[category] if isinstance(category, str) else category)
+    if academic_year:
+        queryset = queryset.filter(academic_year_id=academic_year)
+    if month_from:
+        queryset = queryset.filter(**{f'{month_field}__gte': month_start(month_from)})
+    if month_to:
+        queryset = queryset.filter(**{f'{month_field}__lt': next_month(month_to)})
+    return queryset
+
+
+def slice_cube(by=(), **slice_filters):
+    """
+    Roll the (sliced) cube up to the dimensions in ``by``: one row per
+    combination with its ``amount`` and ``entries``, or a single total row
+    when ``by`` is empty.
+    """
+    cells = sliced(ExpenseCube.objects.all(), **slice_filters)
+    totals = {'amount': Coalesce(Sum('amount'), Value(Decimal('0.00'))), 'entries': Coalesce(Sum('entries'), 0)}
+    if not by:
+        return [cells.aggregate(**totals)]
+    return list(cells.values(*by).annotate(**totals).order_by(*by))
+
+
+def cell_expenses(queryset, category=None, academic_year=None, month_from=None, month_to=None):
+    """Drill a slice of the cube down to the Expense rows behind it"""
+    queryset = sliced(queryset, category=category, month_from=month_from, month_to=month_to, month_field='expense_date')
+    if academic_year:
+        year = AcademicYear.objects.filter(pk=academic_year).values_list('start_date', 'end_date').first()
+        if year is None:
+            return queryset.none()
+        # The range narrows the scan; overlapping years assign each expense to one of them, as the cube does
+        queryset = queryset.filter(expense_date__range=year).alias(cube_year=expense_year()).filter(
+            cube_year=academic_year
+        )
+    return queryset
+
+
+def spent_per_budget(budgets):
+    """Annotate ``budgets`` with ``spent``, their academic year's expenses from the cube"""
+    spent = ExpenseCube.objects.filter(academic_year=OuterRef('academic_year')).order_by().values(
+        'academic_year'
+    ).annotate(total=Sum('amount')).values('total')
+    return budgets.annotate(spent=Coalesce(
+        Subquery(spent), Value(Decimal('0.00')), output_field=DecimalField(max_digits=14, decimal_places=2)
+    ))
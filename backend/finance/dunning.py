@@ -0,0 +1,163 @@
+"""
+Overdue-invoice sweeper and dunning reminders.
+
+``sweep_overdue_invoices`` is meant to run daily (``manage.py
+sweep_overdue_invoices`` from cron). It flips sent invoices whose due date has
+lapsed to ``overdue`` with a single UPDATE over the ``(status, due_date)``
+index, only for due dates since the previous run's ``as_of`` (every lapsed
+invoice on the first run, or with ``full``), and records the run as an
+``OverdueSweep``. The newly overdue invoices are grouped into one queued
+``DunningReminder`` per guardian.
+
+``send_dunning_reminders`` delivers queued reminders by email in batches over
+one connection each, throttled to ``DUNNING_REMINDERS['per_minute']``.
+Invoices settled since they were queued are left out of the message, and a
+reminder with nothing left to chase, or to a guardian without an email
+address, is marked skipped.
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from dashboards.signals import models_changed
+from .models import DunningReminder, Invoice, OverdueSweep
+
+DEFAULT_DUNNING = {
+    'batch_size': 50,
+    'per_minute': 120,
+    'subject': 'Overdue school fees',
+}
+
+
+def dunning_settings(**overrides):
+    config = {**DEFAULT_DUNNING, **getattr(settings, 'DUNNING_REMINDERS', {})}
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
+
+
+def sweep_overdue_invoices(as_of=None, full=False, batch_size=1000):
+    """
+    Mark sent invoices due before ``as_of`` (default today) overdue, queue
+    their guardians' reminders and return the recorded OverdueSweep.
+    """
+    as_of = as_of or timezone.localdate()
+    previous = OverdueSweep.objects.order_by('-as_of').values_list('as_of', flat=True).first()
+    window_start = None if full else previous
+
+    window = {'due_date__lt': as_of}
+    if window_start is not None:
+        window['due_date__gte'] = window_start
+    with transaction.atomic():
+        marked = Invoice.objects.filter(status='sent', balance__gt=0, **window).update(
+            status='overdue', updated_at=timezone.now()
+        )
+        sweep = OverdueSweep.objects.create(as_of=as_of, window_start=window_start, invoices_marked=marked)
+        if marked:
+            sweep.reminders_queued = queue_reminders(sweep, window, batch_size)
+            sweep.save(update_fields=['reminders_queued'])
+            models_changed(Invoice, DunningReminder)
+    return sweep
+
+
+def queue_reminders(sweep, window, batch_size=1000):
+    """One reminder per guardian for the overdue, not yet reminded invoices in ``window``"""
+    lapsed = Invoice.objects.filter(
+        status='overdue', balance__gt=0, student__guardian__isnull=False, dunning_reminders__isnull=True, **window
+    ).order_by('student__guardian_id', 'due_date', 'pk').values_list('pk', 'student__guardian_id', 'balance')
+
+    by_guardian = {}
+    for invoice_id, guardian_id, balance in lapsed.iterator(chunk_size=batch_size):
+        by_guardian.setdefault(guardian_id, []).append((invoice_id, balance))
+    if not by_guardian:
+        return 0
+
+    reminders = DunningReminder.objects.bulk_create([
+        DunningReminder(
+            guardian_id=guardian_id, sweep=sweep, total_due=sum((balance for _, balance in invoices), Decimal('0.00'))
+        )
+        for guardian_id, invoices in by_guardian.items()
+    ], batch_size=batch_size)
+    if any(reminder.pk is None for reminder in reminders):
+        # Backends that cannot return ids from a bulk insert
+        ids = dict(DunningReminder.objects.filter(sweep=sweep).values_list('guardian_id', 'pk'))
+        for reminder in reminders:
+            reminder.pk = ids[reminder.guardian_id]
+    through = DunningReminder.invoices.through
+    through.objects.bulk_create([
+        through(dunningreminder_id=reminder.pk, invoice_id=invoice_id)
+        for reminder in reminders
+        for invoice_id, _ in by_guardian[reminder.guardian_id]
+    ], batch_size=batch_size)
+    return len(reminders)
+
+
+def reminder_message(reminder, invoices, subject):
+    guardian = reminder.guardian
+    lines = [
+        f"  {invoice.invoice_number}  {invoice.student.first_name} {invoice.student.last_name}  "
+        f"due {invoice.due_date:%Y-%m-%d}  balance {invoice.balance}"
+        for invoice in invoices
+    ]
+    body = "\n".join([
+        f"Dear {guardian.first_name} {guardian.last_name},",
+        "",
+        "The following school fees are overdue:",
+        "",
+        *lines,
+        "",
+        f"Total due: {sum((invoice.balance for invoice in invoices), Decimal('0.00'))}",
+        "",
+        "Please settle the balance or contact the school accounts office.",
+    ])
+    return EmailMessage(subject=subject, body=body, from_email=settings.DEFAULT_FROM_EMAIL, to=[guardian.email])
+
+
+def send_dunning_reminders(limit=None, batch_size=None, per_minute=None, sleep=time.sleep):
+    """
+    Deliver up to ``limit`` queued reminders, oldest first, and return counts
+    of sent, failed and skipped reminders.
+    """
+    config = dunning_settings(batch_size=batch_size, per_minute=per_minute)
+    interval = 60 / config['per_minute']
+    queued = DunningReminder.objects.filter(status='queued').order_by('created_at', 'pk')
+    ids = list(queued.values_list('pk', flat=True)[:limit] if limit else queued.values_list('pk', flat=True))
+    unpaid = Invoice.objects.filter(status__in=('sent', 'overdue'), balance__gt=0).select_related(
+        'student'
+    ).order_by('due_date', 'pk')
+
+    counts = {'sent': 0, 'failed': 0, 'skipped': 0}
+    for start in range(0, len(ids), config['batch_size']):
+        started = time.monotonic()
+        batch = list(DunningReminder.objects.filter(pk__in=ids[start:start + config['batch_size']]).select_related(
+            'guardian'
+        ).prefetch_related(Prefetch('invoices', queryset=unpaid, to_attr='unpaid_invoices')).order_by('created_at', 'pk'))
+
+        emails = 0
+        with get_connection() as connection:
+            for reminder in batch:
+                reminder.sent_at = timezone.now()
+                if not reminder.guardian.email or not reminder.unpaid_invoices:
+                    reminder.status = 'skipped'
+                    reminder.error = 'No email address' if not reminder.guardian.email else 'Settled before sending'
+                else:
+                    message = reminder_message(reminder, reminder.unpaid_invoices, config['subject'])
+                    message.connection = connection
+                    emails += 1
+                    try:
+                        message.send()
+                        reminder.status = 'sent'
+                    except Exception as error:
+                        reminder.status, reminder.error = 'failed', str(error)
+                counts[reminder.status] += 1
+        DunningReminder.objects.bulk_update(batch, ['status', 'error', 'sent_at'])
+
+        # Hold the batch to the rate limit before starting the next one
+        remaining = emails * interval - (time.monotonic() - started)
+        if remaining > 0 and start + config['batch_size'] < len(ids):
+            sleep(remaining)
+    return counts
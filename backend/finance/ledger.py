@@ -0,0 +1,138 @@
+"""
+Daily revenue/expense ledger rollup.
+
+``LedgerDailyRollup`` holds one row per (kind, day). Writes to FeePayment and
+Expense refresh only the days they touch (see ``signals.py``), so range
+reports group a few hundred small rows instead of scanning the source tables.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, Count, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from adminstration.models import Term
+from .models import FeePayment, Expense, LedgerDailyRollup
+
+LEDGER_SOURCES = {
+    'revenue': (FeePayment, 'payment_date', 'amount_paid', Q(status='completed')),
+    'expense': (Expense, 'expense_date', 'amount', Q()),
+}
+
+BUCKETS = ('day', 'week', 'month', 'term')
+# Longest range reported day by day
+MAX_DAY_BUCKETS = 366
+
+TRUNCATE = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def refresh_ledger_days(kind, dates):
+    """Recompute the rollup rows of ``kind`` for the given dates from the source table"""
+    dates = {d for d in dates if d is not None}
+    if not dates:
+        return
+
+    model, date_field, amount_field, condition = LEDGER_SOURCES[kind]
+    totals = model.objects.filter(condition, **{f'{date_field}__in': dates}).values(
+        date_field
+    ).annotate(total=Sum(amount_field), entries=Count('id')).order_by()
+
+    rows = [
+        LedgerDailyRollup(kind=kind, date=row[date_field], amount=row['total'], entries=row['entries'])
+        for row in totals
+    ]
+    LedgerDailyRollup.objects.filter(kind=kind, date__in=dates - {r.date for r in rows}).delete()
+    if rows:
+        LedgerDailyRollup.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['kind', 'date'],
+            update_fields=['amount', 'entries', 'updated_at'],
+        )
+
+
+def rebuild_ledger():
+    """Recompute the whole rollup table from FeePayment and Expense"""
+    LedgerDailyRollup.objects.all().delete()
+    created = 0
+    for kind, (model, date_field, amount_field, condition) in LEDGER_SOURCES.items():
+        totals = model.objects.filter(condition).values(date_field).annotate(
+            total=Sum(amount_field), entries=Count('id')
+        ).order_by()
+        rows = LedgerDailyRollup.objects.bulk_create(
+            [
+                LedgerDailyRollup(kind=kind, date=row[date_field], amount=row['total'], entries=row['entries'])
+                for row in totals.iterator()
+            ],
+            batch_size=1000,
+        )
+        created += len(rows)
+    return created
+
+
+def month_start(day, months_back=0):
+    """Return the first day of the calendar month ``months_back`` months before ``day``"""
+    index = day.year * 12 + day.month - 1 - months_back
+    return day.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def _bucket_starts(start, end, bucket):
+    if bucket == 'day':
+        first, step = start, timedelta(days=1)
+    elif bucket == 'week':
+        first, step = start - timedelta(days=start.weekday()), timedelta(weeks=1)
+    else:
+        first, step = start.replace(day=1), None
+
+    current = first
+    while current <= end:
+        yield current
+        current = current + step if step else month_start(current, months_back=-1)
+
+
+def ledger_trends(start, end, bucket='month'):
+    """
+    Return revenue/expense totals between ``start`` and ``end`` (inclusive)
+    grouped into day, week, month or term buckets, oldest first.
+    """
+    rollups = LedgerDailyRollup.objects.filter(date__range=(start, end))
+
+    if bucket == 'term':
+        terms = list(Term.objects.filter(start_date__lte=end, end_date__gte=start).select_related('academic_year'))
+        if not terms:
+            return []
+        period = Case(
+            *[When(date__range=(t.start_date, t.end_date), then=Value(t.pk)) for t in terms],
+            output_field=IntegerField(),
+        )
+        periods = [(t.pk, str(t), t.start_date, t.end_date) for t in terms]
+    else:
+        period = TRUNCATE[bucket]('date')
+        periods = [(p, p.isoformat(), p, None) for p in _bucket_starts(start, end, bucket)]
+
+    totals = {}
+    grouped = rollups.annotate(period=period).exclude(period=None).values('period', 'kind').annotate(
+        total=Sum('amount')
+    ).order_by()
+    for row in grouped:
+        totals[(row['period'], row['kind'])] = row['total']
+
+    trends = []
+    for key, label, period_start, period_end in periods:
+        revenue = totals.get((key, 'revenue')) or Decimal('0')
+        expenses = totals.get((key, 'expense')) or Decimal('0')
+        entry = {
+            'period': label,
+            'start': period_start,
+            'revenue': revenue,
+            'expenses': expenses,
+            'net': revenue - expenses,
+        }
+        if period_end is not None:
+            entry['end'] = period_end
+        trends.append(entry)
+    return trends
@@ -0,0 +1,32 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from adminstration.models import Term
+from finance.services import generate_term_invoices
+
+
+class Command(BaseCommand):
+    help = "Invoice every active enrollment of a term for its mandatory fees; already invoiced students are skipped"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--year", type=int, required=True, help="Academic year id")
+        parser.add_argument("--term", type=int, required=True, help="Term id")
+        parser.add_argument("--class", type=int, action="append", dest="classes", help="Only this class id (repeatable)")
+        parser.add_argument("--issue-date", type=date.fromisoformat, help="YYYY-MM-DD (default: today)")
+        parser.add_argument("--due-date", type=date.fromisoformat, help="YYYY-MM-DD (default: 30 days after issue)")
+        parser.add_argument("--status", choices=["draft", "sent"], default="sent")
+
+    def handle(self, *args, **options):
+        term = Term.objects.filter(pk=options["term"], academic_year_id=options["year"]).first()
+        if term is None:
+            raise CommandError("No such term in that academic year.")
+
+        summary = generate_term_invoices(
+            term, class_ids=options["classes"], issue_date=options["issue_date"],
+            due_date=options["due_date"], status=options["status"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {summary['created']} invoices totalling {summary['total_amount']} for {term}; "
+            f"skipped {summary['skipped']} already invoiced students."
+        ))
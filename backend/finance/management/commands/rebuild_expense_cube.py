@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dashboards.signals import models_changed
+from finance.cube import rebuild_expense_cube
+from finance.models import Expense, ExpenseCube
+
+
+class Command(BaseCommand):
+    help = "Recompute the category x month x academic year expense cube from Expense"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild_expense_cube()
+            # Cached responses are keyed on the source tables the derived rows come from
+            models_changed(ExpenseCube, Expense)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} expense cube cells."))
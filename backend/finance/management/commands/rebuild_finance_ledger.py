@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dashboards.signals import models_changed
+from finance.ledger import rebuild_ledger
+from finance.models import Expense, FeePayment, LedgerDailyRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily revenue/expense ledger rollup from FeePayment and Expense"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild_ledger()
+            # Cached responses are keyed on the source tables the derived rows come from
+            models_changed(LedgerDailyRollup, FeePayment, Expense)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} ledger rollup rows."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dashboards.signals import models_changed
+from finance.accounts import rebuild_student_accounts
+from finance.models import StudentAccount
+
+
+class Command(BaseCommand):
+    help = "Recompute every student's fee account (billed, paid, balance, oldest unpaid due date) from Invoice and FeePayment"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild_student_accounts()
+            models_changed(StudentAccount)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} student accounts."))
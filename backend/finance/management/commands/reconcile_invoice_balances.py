@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from finance.allocation import reconcile_allocations
+
+
+class Command(BaseCommand):
+    help = "Check invoice paid amounts, balances and statuses against the payment allocations and repair any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be repaired")
+
+    def handle(self, *args, **options):
+        summary = reconcile_allocations(repair=not options["dry_run"])
+        verb = "Found" if options["dry_run"] else "Repaired"
+        message = (
+            f"{verb} {summary['invoices']} drifted invoices and {summary['stray_allocations']} stray allocations; "
+            f"{summary['payments_with_credit']} payments with unallocated credit"
+            f"{'' if options['dry_run'] else ' allocated'}."
+        )
+        if options["dry_run"] and any(summary.values()):
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from finance.dunning import send_dunning_reminders, sweep_overdue_invoices
+
+
+class Command(BaseCommand):
+    help = "Mark lapsed sent invoices overdue, queue reminders per guardian and optionally send queued reminders; run daily"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--as-of", type=date.fromisoformat, help="YYYY-MM-DD (default: today)")
+        parser.add_argument("--full", action="store_true", help="Sweep every lapsed invoice, not only those due since the last run")
+        parser.add_argument("--send", action="store_true", help="Send queued reminders after sweeping")
+        parser.add_argument("--limit", type=int, help="Send at most this many reminders")
+        parser.add_argument("--batch-size", type=int, help="Reminders per mail connection (default: settings.DUNNING_REMINDERS)")
+        parser.add_argument("--per-minute", type=int, help="Email rate limit (default: settings.DUNNING_REMINDERS)")
+
+    def handle(self, *args, **options):
+        sweep = sweep_overdue_invoices(as_of=options["as_of"], full=options["full"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Marked {sweep.invoices_marked} invoices overdue as of {sweep.as_of}; "
+            f"queued {sweep.reminders_queued} guardian reminders."
+        ))
+        if options["send"]:
+            counts = send_dunning_reminders(
+                limit=options["limit"], batch_size=options["batch_size"], per_minute=options["per_minute"]
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Sent {counts['sent']} reminders; {counts['failed']} failed, {counts['skipped']} skipped."
+            ))
@@ -1,6 +1,9 @@
-from django.db import models
+from contextvars import ContextVar
+from django.db import models, transaction
 from decimal import Decimal
-from django.db.models import Sum
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from adminstration.models import AcademicYear, Term, SchoolClass
@@ -115,6 +118,62 @@ class FeePayment(models.Model):
         return f"{self.student.first_name} {self.student.last_name} - {self.fee_structure.name} - {self.amount_paid}"
 
 
+# Invoice ids whose totals InvoiceItem writes leave for finance.services.deferred_invoice_totals
+_deferred_invoice_totals = ContextVar('deferred_invoice_totals', default=None)
+
+
+def format_invoice_number(year, number):
+    return f"INV-{year}-{number:04d}"
+
+
+class InvoiceSequence(models.Model):
+    """Next free invoice number per year; numbers are handed out by allocate()"""
+    year = models.PositiveIntegerField(unique=True)
+    next_number = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-year']
+
+    def __str__(self):
+        return f"{self.year}: next {self.next_number}"
+
+    @classmethod
+    def allocate(cls, year, count=1):
+        """
+        Reserve ``count`` consecutive invoice numbers for ``year`` and return
+        them formatted. The reservation is one UPDATE whose row lock is held
+        until the caller's transaction ends, so concurrent allocators queue
+        instead of colliding; allocate inside the transaction that inserts
+        the invoices and a rollback hands the numbers back, leaving no gaps.
+        """
+        with transaction.atomic():
+            reserved = cls.objects.filter(year=year).update(next_number=F('next_number') + count)
+            if not reserved:
+                cls.objects.get_or_create(year=year, defaults={'next_number': cls.first_free_number(year)})
+                cls.objects.filter(year=year).update(next_number=F('next_number') + count)
+            end = cls.objects.filter(year=year).values_list('next_number', flat=True).get()
+        return [format_invoice_number(year, number) for number in range(end - count, end)]
+
+    @staticmethod
+    def first_free_number(year):
+        """Continue after invoices numbered before the year's sequence existed"""
+        prefix = f"INV-{year}-"
+        numbers = Invoice.objects.filter(invoice_number__startswith=prefix).values_list('invoice_number', flat=True)
+        return max((int(number[len(prefix):]) for number in numbers if number[len(prefix):].isdigit()), default=0) + 1
+
+
+def expected_status(status, balance, due_date, today):
+    """The status an invoice should have for ``balance``"""
+    if status == 'cancelled':
+        return status
+    if balance <= 0:
+        return 'paid'
+    if status == 'paid':
+        return 'overdue' if due_date < today else 'sent'
+    return status
+
+
 class Invoice(models.Model):
     """Represents student invoices"""
     STATUS_CHOICES = (
@@ -172,18 +231,44 @@ class Invoice(models.Model):
     def __str__(self):
         return f"Invoice {self.invoice_number} for {self.student.first_name} {self.student.last_name}"
 
-    def save(self, *args, **kwargs):
-        if not self.invoice_number:
-            from datetime import date
-            today = date.today()
-            count = Invoice.objects.filter(issue_date__year=today.year).count() + 1
-            self.invoice_number = f"INV-{today.year}-{count:04d}"
-        
+    def refresh_balance(self):
         self.balance = self.total_amount - self.paid_amount
-        if self.balance <= 0 and self.status not in ['paid', 'cancelled']:
-            self.status = 'paid'
-        
-        super().save(*args, **kwargs)
+        self.status = expected_status(self.status, self.balance, self.due_date, timezone.localdate())
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.save_settled(*args, **kwargs)
+            return
+        self.refresh_balance()
+
+        if self.invoice_number:
+            super().save(*args, **kwargs)
+            return
+        from datetime import date
+        # The number is only consumed if the insert commits
+        try:
+            with transaction.atomic():
+                self.invoice_number = InvoiceSequence.allocate(date.today().year)[0]
+                super().save(*args, **kwargs)
+        except Exception:
+            self.invoice_number = ''
+            raise
+
+    def save_settled(self, *args, update_fields=None, **kwargs):
+        """
+        Save an existing invoice against its stored paid amount, which
+        finance.allocation moves with F() updates: the row is locked and the
+        paid amount re-read, so a stale instance never writes it back.
+        """
+        if update_fields is None:
+            update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+        update_fields = {name for name in update_fields if name != 'paid_amount'} | {'balance', 'status'}
+        with transaction.atomic():
+            self.paid_amount = Invoice.objects.select_for_update().filter(pk=self.pk).values_list(
+                'paid_amount', flat=True
+            ).get()
+            self.refresh_balance()
+            super().save(*args, update_fields=update_fields, **kwargs)
 
     def update_amounts(self):
         """Recalculates total amount from invoice items"""
@@ -191,8 +276,11 @@ class Invoice(models.Model):
         self.save()
 
     def update_paid_amount(self):
-        """Recalculates paid amount from related payments"""
-        self.paid_amount = self.payments.filter(status='completed').aggregate(total=Sum('amount_paid'))['total'] or Decimal('0.00')  # type: ignore[attr-defined]
+        """Recalculates paid amount from the payment allocations"""
+        paid = PaymentAllocation.objects.filter(invoice=OuterRef('pk')).order_by().values('invoice').annotate(
+            total=Sum('amount')
+        ).values('total')
+        Invoice.objects.filter(pk=self.pk).update(paid_amount=Coalesce(Subquery(paid), Value(Decimal('0.00'))))
         self.save()
 
 
@@ -214,12 +302,93 @@ class InvoiceItem(models.Model):
         if not self.description:
             self.description = self.fee_structure.name
         super().save(*args, **kwargs)
-        self.invoice.update_amounts()
+        self.invoice_changed(self.invoice)
 
     def delete(self, *args, **kwargs):
         invoice = self.invoice
         super().delete(*args, **kwargs)
-        invoice.update_amounts()
+        self.invoice_changed(invoice)
+
+    @staticmethod
+    def invoice_changed(invoice):
+        pending = _deferred_invoice_totals.get()
+        if pending is None:
+            invoice.update_amounts()
+        else:
+            pending.add(invoice.pk)
+
+
+class PaymentAllocation(models.Model):
+    """The part of a completed FeePayment applied to one invoice; see finance.allocation"""
+    payment = models.ForeignKey(FeePayment, on_delete=models.CASCADE, related_name='allocations')
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='allocations')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"{self.amount} of {self.payment.transaction_reference} to {self.invoice.invoice_number}"
+
+
+class StudentAccount(models.Model):
+    """A student's running fee position, maintained from Invoice and FeePayment writes; see finance.accounts"""
+    student = models.OneToOneField(StudentProfile, on_delete=models.CASCADE, related_name='account')
+    total_billed = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), db_index=True)
+    oldest_unpaid_due_date = models.DateField(blank=True, null=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['student_id']
+
+    def __str__(self):
+        return f"{self.student.first_name} {self.student.last_name}: {self.balance}"
+
+
+class OverdueSweep(models.Model):
+    """One run of the overdue sweeper; the next run starts where ``as_of`` left off"""
+    as_of = models.DateField(db_index=True)
+    window_start = models.DateField(blank=True, null=True)
+    invoices_marked = models.PositiveIntegerField(default=0)
+    reminders_queued = models.PositiveIntegerField(default=0)
+    ran_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-as_of', '-ran_at']
+
+    def __str__(self):
+        return f"Overdue sweep to {self.as_of}: {self.invoices_marked} invoices"
+
+
+class DunningReminder(models.Model):
+    """A queued overdue-fees reminder to one guardian, covering their children's newly overdue invoices"""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('skipped', 'Skipped'),
+    )
+
+    guardian = models.ForeignKey('admission.Guardian', on_delete=models.CASCADE, related_name='dunning_reminders')
+    sweep = models.ForeignKey(OverdueSweep, on_delete=models.CASCADE, related_name='reminders')
+    invoices = models.ManyToManyField(Invoice, related_name='dunning_reminders')
+    total_due = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Reminder to {self.guardian} for {self.total_due} ({self.status})"
 
 
 class Expense(models.Model):
@@ -246,6 +415,14 @@ class Expense(models.Model):
         limit_choices_to={'role__in': ['admin', 'accountant']},
         db_index=True
     )
+    approved_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='approved_expenses',
+        limit_choices_to={'role': 'admin'},
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -289,14 +466,69 @@ class Budget(models.Model):
 
     @property
     def total_expenses(self):
-        """Calculate total expenses for the budget's academic year"""
-        start_date = self.academic_year.start_date
-        end_date = self.academic_year.end_date
-        return Expense.objects.filter(
-            expense_date__range=(start_date, end_date)
+        """Total expenses of the budget's academic year, from the expense cube"""
+        return ExpenseCube.objects.filter(
+            academic_year_id=self.academic_year_id
         ).aggregate(total=Sum('amount'))['total'] or 0
 
     @property
     def remaining_budget(self):
         """Calculate the remaining budget"""
         return self.total_budget - self.total_expenses
+
+
+class LedgerDailyRollup(models.Model):
+    """Daily revenue and expense totals, maintained from FeePayment and Expense writes"""
+    KIND_CHOICES = (
+        ('revenue', 'Revenue'),
+        ('expense', 'Expense'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    date = models.DateField()
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    entries = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date', 'kind']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'date'],
+                name='unique_ledger_rollup_per_kind_day'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.date}: {self.amount}"  # type: ignore[attr-defined]
+
+
+class ExpenseCube(models.Model):
+    """Expense totals per category, calendar month and academic year, maintained from Expense writes"""
+    category = models.CharField(max_length=50, choices=Expense.CATEGORY_CHOICES)
+    month = models.DateField()
+    academic_year = models.ForeignKey(
+        AcademicYear,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='expense_cells'
+    )
+    # The academic year id, 0 outside every year: a NOT NULL stand-in so upserts conflict on those cells too
+    year_key = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    entries = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['month', 'category']
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'month', 'year_key'], name='unique_expense_cube_cell')
+        ]
+        indexes = [
+            models.Index(fields=['month', 'category']),
+            models.Index(fields=['academic_year', 'category']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_category_display()} {self.month:%Y-%m}: {self.amount}"  # type: ignore[attr-defined]
@@ -1,5 +1,8 @@
+from decimal import Decimal
+
+from django.utils import timezone
 from rest_framework import serializers
-from .models import FeeStructure, FeePayment, Invoice, Expense, Budget
+from .models import FeeStructure, FeePayment, Invoice, PaymentAllocation, StudentAccount, Expense, Budget
 from students.models import StudentProfile
 from adminstration.models import AcademicYear, Term, SchoolClass
 
@@ -23,11 +26,21 @@ class FeeStructureSerializer(serializers.ModelSerializer):
         return value
 
 
+class PaymentAllocationSerializer(serializers.ModelSerializer):
+    invoice_number = serializers.CharField(source='invoice.invoice_number', read_only=True)
+
+    class Meta:
+        model = PaymentAllocation
+        fields = ['id', 'invoice', 'invoice_number', 'amount', 'created_at']
+        read_only_fields = fields
+
+
 class FeePaymentSerializer(serializers.ModelSerializer):
     student_name = serializers.SerializerMethodField()
     fee_structure_name = serializers.CharField(source='fee_structure.name', read_only=True)
     term_name = serializers.CharField(source='term.name', read_only=True)
     recorded_by_name = serializers.SerializerMethodField()
+    allocations = PaymentAllocationSerializer(many=True, read_only=True)
 
     class Meta:
         model = FeePayment
@@ -35,7 +48,7 @@ class FeePaymentSerializer(serializers.ModelSerializer):
             'id', 'student', 'student_name', 'fee_structure', 'fee_structure_name',
             'term', 'term_name', 'amount_paid', 'payment_date', 'payment_method',
             'transaction_reference', 'status', 'remarks', 'recorded_by',
-            'recorded_by_name', 'created_at', 'updated_at'
+            'recorded_by_name', 'allocations', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at', 'recorded_by']
 
@@ -67,11 +80,13 @@ class InvoiceSerializer(serializers.ModelSerializer):
         model = Invoice
         fields = [
             'id', 'invoice_number', 'student', 'student_name', 'academic_year',
-            'academic_year_name', 'term', 'term_name', 'total_amount', 'amount_paid',
+            'academic_year_name', 'term', 'term_name', 'total_amount', 'paid_amount',
             'balance', 'issue_date', 'due_date', 'status', 'notes', 'created_by',
             'created_by_name', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['invoice_number', 'balance', 'issue_date', 'created_at', 'updated_at', 'created_by']
+        read_only_fields = [
+            'invoice_number', 'paid_amount', 'balance', 'issue_date', 'created_at', 'updated_at', 'created_by'
+        ]
 
     def get_student_name(self, obj):
         return f"{obj.student.first_name} {obj.student.last_name}"
@@ -84,8 +99,6 @@ class InvoiceSerializer(serializers.ModelSerializer):
     def validate(self, data):
         if data.get('total_amount', 0) <= 0:
             raise serializers.ValidationError({'total_amount': 'Total amount must be greater than zero.'})
-        if data.get('amount_paid', 0) > data.get('total_amount', 0):
-            raise serializers.ValidationError({'amount_paid': 'Amount paid cannot exceed total amount.'})
         return data
 
     def create(self, validated_data):
@@ -93,21 +106,38 @@ class InvoiceSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class StudentAccountSerializer(serializers.ModelSerializer):
+    student_name = serializers.SerializerMethodField()
+    admission_number = serializers.CharField(source='student.admission_number', read_only=True)
+    is_overdue = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StudentAccount
+        fields = [
+            'student', 'student_name', 'admission_number', 'total_billed', 'total_paid', 'balance',
+            'oldest_unpaid_due_date', 'is_overdue', 'updated_at'
+        ]
+        read_only_fields = fields
+
+    def get_student_name(self, obj):
+        return f"{obj.student.first_name} {obj.student.last_name}"
+
+    def get_is_overdue(self, obj):
+        return obj.oldest_unpaid_due_date is not None and obj.oldest_unpaid_due_date < timezone.localdate()
+
+
 class ExpenseSerializer(serializers.ModelSerializer):
-    academic_year_name = serializers.CharField(source='academic_year.name', read_only=True)
-    term_name = serializers.CharField(source='term.name', read_only=True)
     approved_by_name = serializers.SerializerMethodField()
     recorded_by_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Expense
         fields = [
-            'id', 'title', 'description', 'category', 'amount', 'expense_date',
-            'academic_year', 'academic_year_name', 'term', 'term_name', 'vendor',
-            'receipt_number', 'approved_by', 'approved_by_name', 'recorded_by',
-            'recorded_by_name', 'created_at', 'updated_at'
+            'id', 'category', 'amount', 'description', 'expense_date', 'receipt',
+            'approved_by', 'approved_by_name', 'recorded_by', 'recorded_by_name',
+            'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at', 'recorded_by']
+        read_only_fields = ['created_at', 'updated_at', 'recorded_by', 'approved_by']
 
     def get_approved_by_name(self, obj):
         if obj.approved_by:
@@ -131,34 +161,69 @@ class ExpenseSerializer(serializers.ModelSerializer):
 
 class BudgetSerializer(serializers.ModelSerializer):
     academic_year_name = serializers.CharField(source='academic_year.name', read_only=True)
-    term_name = serializers.CharField(source='term.name', read_only=True)
     created_by_name = serializers.SerializerMethodField()
+    total_expenses = serializers.SerializerMethodField()
+    remaining_budget = serializers.SerializerMethodField()
 
     class Meta:
         model = Budget
         fields = [
-            'id', 'name', 'description', 'academic_year', 'academic_year_name',
-            'term', 'term_name', 'total_budget', 'spent_amount', 'remaining_amount',
-            'status', 'start_date', 'end_date', 'created_by', 'created_by_name',
+            'id', 'academic_year', 'academic_year_name', 'total_budget', 'description',
+            'total_expenses', 'remaining_budget', 'created_by', 'created_by_name',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['remaining_amount', 'created_at', 'updated_at', 'created_by']
+        read_only_fields = ['created_at', 'updated_at', 'created_by']
 
     def get_created_by_name(self, obj):
         if obj.created_by:
             return f"{obj.created_by.first_name} {obj.created_by.last_name}"
         return None
 
-    def validate(self, data):
-        if data.get('total_budget', 0) <= 0:
-            raise serializers.ValidationError({'total_budget': 'Budget must be greater than zero.'})
-        if data.get('start_date') and data.get('end_date'):
-            if data['start_date'] >= data['end_date']:
-                raise serializers.ValidationError({'end_date': 'End date must be later than start date.'})
-        if data.get('spent_amount', 0) > data.get('total_budget', 0):
-            raise serializers.ValidationError({'spent_amount': 'Spent amount cannot exceed total budget.'})
-        return data
+    def spent(self, obj):
+        # Annotated by the viewset's queryset; the property queries the cube
+        spent = getattr(obj, 'spent', None)
+        return Decimal(obj.total_expenses if spent is None else spent)
+
+    def get_total_expenses(self, obj):
+        return self.fields['total_budget'].to_representation(self.spent(obj))
+
+    def get_remaining_budget(self, obj):
+        return self.fields['total_budget'].to_representation(obj.total_budget - self.spent(obj))
+
+    def validate_total_budget(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Budget must be greater than zero.")
+        return value
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
+
+
+class GenerateTermInvoicesSerializer(serializers.Serializer):
+    academic_year = serializers.PrimaryKeyRelatedField(queryset=AcademicYear.objects.all())
+    term = serializers.PrimaryKeyRelatedField(queryset=Term.objects.all())
+    classes = serializers.PrimaryKeyRelatedField(queryset=SchoolClass.objects.all(), many=True, required=False)
+    issue_date = serializers.DateField(required=False)
+    due_date = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=['draft', 'sent'], default='sent')
+
+    def validate(self, data):
+        if data['term'].academic_year_id != data['academic_year'].pk:
+            raise serializers.ValidationError({'term': 'Term does not belong to this academic year.'})
+        if data.get('issue_date') and data.get('due_date') and data['due_date'] < data['issue_date']:
+            raise serializers.ValidationError({'due_date': 'Due date cannot be before the issue date.'})
+        return data
+
+
+class StatementImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    file_format = serializers.ChoiceField(choices=['csv', 'ofx'], required=False)
+    payment_method = serializers.ChoiceField(choices=FeePayment.PAYMENT_METHOD_CHOICES, default='bank_transfer')
+
+    def validate(self, data):
+        if 'file_format' not in data:
+            # Guess from the file name; OFX exports are often named .qfx
+            extension = data['file'].name.rsplit('.', 1)[-1].lower()
+            data['file_format'] = 'ofx' if extension in ('ofx', 'qfx') else 'csv'
+        return data
@@ -0,0 +1,211 @@
+"""
+Set-based invoice writes.
+
+``build_invoices`` creates invoices together with their items: numbers are
+reserved as one block, totals are computed in Python and invoices and items
+go in with one ``bulk_create`` each, so an invoice costs the same handful of
+queries whether it has one item or twenty. Saving ``InvoiceItem`` rows one by
+one still keeps totals right (each save re-aggregates its invoice); wrap
+batch edits in ``deferred_invoice_totals()`` to recompute every touched
+invoice once at the end instead.
+
+``generate_term_invoices`` bills a whole term from the enrollment roster and
+the mandatory fee structures, a chunk of students per transaction.
+"""
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from adminstration.models import Term
+from dashboards.signals import models_changed
+from students.models import Enrollment
+from .accounts import refresh_student_accounts
+from .allocation import OPEN_STATUSES, allocate_credit
+from .models import FeeStructure, Invoice, InvoiceItem, InvoiceSequence, _deferred_invoice_totals
+
+INVOICE_CHUNK_SIZE = 1000
+DEFAULT_DUE_DAYS = 30
+
+
+def build_invoices(drafts, created_by=None, batch_size=1000):
+    """
+    Create invoices from ``drafts`` in one transaction and return them.
+
+    Each draft is a dict with ``student_id``, ``academic_year_id``,
+    ``term_id``, ``issue_date``, ``due_date``, optional ``status`` (default
+    draft) and ``notes``, and ``items``: dicts with a ``fee_structure`` and
+    optional ``amount`` and ``description`` (default: the fee's).
+    """
+    if not drafts:
+        return []
+    with transaction.atomic():
+        numbers = InvoiceSequence.allocate(date.today().year, len(drafts))
+        invoices, items = [], []
+        for number, draft in zip(numbers, drafts):
+            lines = [
+                InvoiceItem(
+                    fee_structure=item['fee_structure'],
+                    description=item.get('description') or item['fee_structure'].name,
+                    amount=item['fee_structure'].amount if item.get('amount') is None else item['amount'],
+                )
+                for item in draft['items']
+            ]
+            invoice = Invoice(
+                invoice_number=number,
+                student_id=draft['student_id'],
+                academic_year_id=draft['academic_year_id'],
+                term_id=draft['term_id'],
+                issue_date=draft['issue_date'],
+                due_date=draft['due_date'],
+                status=draft.get('status', 'draft'),
+                notes=draft.get('notes'),
+                total_amount=sum((line.amount for line in lines), Decimal('0.00')),
+                created_by=created_by,
+            )
+            invoice.refresh_balance()
+            invoices.append(invoice)
+            items.append(lines)
+
+        Invoice.objects.bulk_create(invoices, batch_size=batch_size)
+        if any(invoice.pk is None for invoice in invoices):
+            # Backends that cannot return ids from a bulk insert
+            ids = dict(Invoice.objects.filter(invoice_number__in=numbers).values_list('invoice_number', 'pk'))
+            for invoice in invoices:
+                invoice.pk = ids[invoice.invoice_number]
+        for invoice, lines in zip(invoices, items):
+            for line in lines:
+                line.invoice = invoice
+        InvoiceItem.objects.bulk_create([line for lines in items for line in lines], batch_size=batch_size)
+        allocate_credit({invoice.student_id for invoice in invoices if invoice.status in OPEN_STATUSES})
+        refresh_student_accounts({invoice.student_id for invoice in invoices})
+        models_changed(Invoice, InvoiceItem)
+    return invoices
+
+
+def build_invoice(student_id, academic_year_id, term_id, issue_date, due_date, items, created_by=None, **fields):
+    """Create one invoice and its items; see build_invoices"""
+    draft = {
+        'student_id': student_id, 'academic_year_id': academic_year_id, 'term_id': term_id,
+        'issue_date': issue_date, 'due_date': due_date, 'items': items, **fields,
+    }
+    return build_invoices([draft], created_by=created_by)[0]
+
+
+def recalculate_invoice_totals(invoice_ids):
+    """Recompute total, balance and status of the given invoices with one aggregate"""
+    if not invoice_ids:
+        return
+    totals = dict(
+        InvoiceItem.objects.filter(invoice_id__in=invoice_ids).order_by().values_list('invoice_id').annotate(
+            total=Sum('amount')
+        )
+    )
+    now = timezone.now()
+    with transaction.atomic():
+        # Locked, so allocations cannot move the paid amounts between the read and the write
+        invoices = list(Invoice.objects.select_for_update().filter(pk__in=invoice_ids))
+        for invoice in invoices:
+            invoice.total_amount = totals.get(invoice.pk, Decimal('0.00'))
+            invoice.refresh_balance()
+            invoice.updated_at = now
+        Invoice.objects.bulk_update(invoices, ['total_amount', 'balance', 'status', 'updated_at'])
+        allocate_credit({invoice.student_id for invoice in invoices if invoice.status in OPEN_STATUSES})
+    refresh_student_accounts({invoice.student_id for invoice in invoices})
+    models_changed(Invoice)
+
+
+@contextmanager
+def deferred_invoice_totals():
+    """
+    Batch ``InvoiceItem`` edits: inside the block item saves and deletes only
+    note their invoice, and each noted invoice's totals are recomputed once
+    when the block exits. The block runs in one transaction; nesting joins
+    the outer block.
+    """
+    if _deferred_invoice_totals.get() is not None:
+        yield
+        return
+    pending = set()
+    token = _deferred_invoice_totals.set(pending)
+    try:
+        with transaction.atomic():
+            yield
+            recalculate_invoice_totals(pending)
+    finally:
+        _deferred_invoice_totals.reset(token)
+
+
+def months_in(term):
+    """Calendar months a term touches, for monthly fees"""
+    return (term.end_date.year - term.start_date.year) * 12 + term.end_date.month - term.start_date.month + 1
+
+
+def generate_term_invoices(term, class_ids=None, issue_date=None, due_date=None, status='sent',
+                           created_by=None, chunk_size=INVOICE_CHUNK_SIZE):
+    """
+    Invoice every actively enrolled student of ``term``'s academic year (or
+    of ``class_ids``) for the class's active mandatory fee structures:
+    termly fees every term, monthly fees once per month the term touches,
+    yearly and once-off fees only if the student was not billed them yet.
+    Students who already have an invoice for the term are skipped, so the
+    operation can be re-run safely. Returns a summary dict.
+    """
+    issue_date = issue_date or timezone.localdate()
+    due_date = due_date or issue_date + timedelta(days=DEFAULT_DUE_DAYS)
+    months = months_in(term)
+
+    fees = FeeStructure.objects.filter(academic_year_id=term.academic_year_id, is_active=True, is_mandatory=True)
+    enrollments = Enrollment.objects.filter(academic_year_id=term.academic_year_id, is_active=True)
+    if class_ids:
+        fees = fees.filter(school_class_id__in=class_ids)
+        enrollments = enrollments.filter(school_class_id__in=class_ids)
+    by_class = {}
+    for fee in fees.order_by('name'):
+        by_class.setdefault(fee.school_class_id, []).append(fee)
+    roster = list(enrollments.filter(school_class_id__in=by_class).order_by('student_id').values_list(
+        'student_id', 'school_class_id'
+    ))
+    once = [fee for class_fees in by_class.values() for fee in class_fees if fee.frequency in ('once', 'yearly')]
+
+    summary = {'term': term.pk, 'students': len(roster), 'created': 0, 'skipped': 0, 'total_amount': Decimal('0.00')}
+    for start in range(0, len(roster), chunk_size):
+        chunk = roster[start:start + chunk_size]
+        with transaction.atomic():
+            # Serialise concurrent runs for the term so a student is never invoiced twice
+            Term.objects.select_for_update().filter(pk=term.pk).get()
+            student_ids = [student_id for student_id, _ in chunk]
+            invoiced = set(Invoice.objects.filter(term=term, student_id__in=student_ids).values_list(
+                'student_id', flat=True
+            ))
+            # Read under the lock too, so a run that finished meanwhile is seen
+            billed_once = set(InvoiceItem.objects.filter(
+                fee_structure__in=once, invoice__student_id__in=student_ids
+            ).values_list('invoice__student_id', 'fee_structure_id')) if once else set()
+
+            drafts = []
+            for student_id, class_id in chunk:
+                if student_id in invoiced:
+                    summary['skipped'] += 1
+                    continue
+                items = []
+                for fee in by_class[class_id]:
+                    if fee.frequency == 'monthly':
+                        items.append({
+                            'fee_structure': fee, 'amount': fee.amount * months,
+                            'description': f"{fee.name} ({months} months)",
+                        })
+                    elif fee.frequency == 'termly' or (student_id, fee.pk) not in billed_once:
+                        items.append({'fee_structure': fee})
+                if items:
+                    drafts.append({
+                        'student_id': student_id, 'academic_year_id': term.academic_year_id, 'term_id': term.pk,
+                        'issue_date': issue_date, 'due_date': due_date, 'status': status, 'items': items,
+                    })
+            for invoice in build_invoices(drafts, created_by=created_by):
+                summary['created'] += 1
+                summary['total_amount'] += invoice.total_amount
+    return summary
@@ -0,0 +1,107 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from adminstration.models import AcademicYear
+from .accounts import refresh_student_accounts
+from .allocation import release_allocations, sync_invoice_allocations, sync_payment_allocations
+from .cube import next_month, refresh_expense_months
+from .ledger import month_start, refresh_ledger_days
+from .models import FeePayment, Invoice, Expense
+
+
+@receiver(pre_save, sender=FeePayment)
+@receiver(pre_save, sender=Expense)
+def remember_ledger_date(sender, instance, raw=False, **kwargs):
+    """Keep the previously stored date so moving an entry refreshes both days"""
+    date_field = 'payment_date' if sender is FeePayment else 'expense_date'
+    instance._ledger_previous_date = None
+    if instance.pk and not raw:
+        instance._ledger_previous_date = sender.objects.filter(pk=instance.pk).values_list(
+            date_field, flat=True
+        ).first()
+
+
+@receiver(post_save, sender=FeePayment)
+@receiver(post_delete, sender=FeePayment)
+def refresh_revenue_ledger(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_ledger_days('revenue', {instance.payment_date, getattr(instance, '_ledger_previous_date', None)})
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def refresh_expense_ledger(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    dates = {instance.expense_date, getattr(instance, '_ledger_previous_date', None)}
+    refresh_ledger_days('expense', dates)
+    refresh_expense_months(dates)
+
+
+@receiver(pre_save, sender=AcademicYear)
+def remember_year_range(sender, instance, raw=False, **kwargs):
+    instance._cube_previous_range = None
+    if instance.pk and not raw:
+        instance._cube_previous_range = sender.objects.filter(pk=instance.pk).values_list(
+            'start_date', 'end_date'
+        ).first()
+
+
+@receiver(post_save, sender=AcademicYear)
+@receiver(post_delete, sender=AcademicYear)
+def refresh_year_expense_cells(sender, instance, raw=False, **kwargs):
+    """Expenses are filed under the year covering their date, so re-file the months a year spans (or spanned)"""
+    if raw:
+        return
+    months = set()
+    ranges = {(instance.start_date, instance.end_date), getattr(instance, '_cube_previous_range', None)}
+    for start, end in ranges - {None}:
+        month = month_start(start)
+        while month <= end:
+            months.add(month)
+            month = next_month(month)
+    refresh_expense_months(months)
+
+
+@receiver(post_save, sender=FeePayment)
+def allocate_fee_payment(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    sync_payment_allocations(instance)
+
+
+@receiver(pre_delete, sender=FeePayment)
+def release_fee_payment(sender, instance, **kwargs):
+    """Take the payment off its invoices before its allocations cascade away"""
+    release_allocations(instance.allocations.all())
+
+
+@receiver(post_save, sender=Invoice)
+def allocate_invoice_credit(sender, instance, raw=False, **kwargs):
+    """Open invoices take the student's unallocated credit; cancelled ones release theirs"""
+    if raw:
+        return
+    sync_invoice_allocations(instance)
+
+
+@receiver(pre_save, sender=FeePayment)
+@receiver(pre_save, sender=Invoice)
+def remember_account_student(sender, instance, raw=False, **kwargs):
+    """Keep the previously stored student so moving a row refreshes both accounts"""
+    instance._account_previous_student = None
+    if instance.pk and not raw:
+        instance._account_previous_student = sender.objects.filter(pk=instance.pk).values_list(
+            'student_id', flat=True
+        ).first()
+
+
+# Registered after allocate_fee_payment, so accounts see the allocated invoices
+@receiver(post_save, sender=FeePayment)
+@receiver(post_delete, sender=FeePayment)
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def refresh_account(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_student_accounts({instance.student_id, getattr(instance, '_account_previous_student', None)})
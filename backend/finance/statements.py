@@ -0,0 +1,277 @@
+"""
+Bank and mobile-money statement import.
+
+``import_statement`` reads a CSV or OFX statement row by row, never holding
+the whole file, and reconciles it against ``FeePayment`` in chunks. Before
+the first row it builds in-memory hash indexes: payments by
+``transaction_reference`` (with amount and status) and students by admission
+number (with the fee they are billed under), so each row is settled by a
+couple of dict lookups instead of a query. Credits that match no payment are
+created as ``pending`` payments with one ``bulk_create`` per chunk, for an
+accountant to confirm; the result is a reconciliation report.
+
+CSV statements need ``reference``, ``amount`` and ``date`` columns (a few
+common header spellings are recognised) and optionally ``admission_number``;
+without it the student is looked up from the words of the description.
+"""
+import csv
+import io
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, Value, When
+
+from adminstration.models import Term
+from dashboards.signals import models_changed
+from students.models import Enrollment, StudentProfile
+from .models import FeePayment, FeeStructure
+
+STATEMENT_CHUNK_SIZE = 2000
+# Exception rows kept in the report; the counts always cover every row
+REPORT_ROW_LIMIT = 1000
+
+COLUMN_ALIASES = {
+    'reference': ('reference', 'transaction_reference', 'ref', 'transaction id', 'transaction_id', 'receipt no'),
+    'amount': ('amount', 'credit', 'paid in', 'amount_paid'),
+    'date': ('date', 'value date', 'transaction date', 'payment_date', 'completion time'),
+    'description': ('description', 'details', 'narrative', 'memo', 'remarks'),
+    'admission_number': ('admission_number', 'admission number', 'account', 'account number', 'student'),
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%d.%m.%Y', '%Y%m%d')
+OFX_FIELDS = {'FITID': 'reference', 'TRNAMT': 'amount', 'DTPOSTED': 'date', 'MEMO': 'description', 'NAME': 'name'}
+OFX_TAG = re.compile(r'<(/?)([A-Z0-9.]+)>([^<\r\n]*)')
+
+OUTCOMES = ('matched', 'amount_mismatch', 'unsettled', 'duplicate', 'created', 'unidentified', 'debit', 'invalid')
+# Payments a credit cannot settle; the money arrived anyway, so it needs a look
+UNSETTLED_STATUSES = ('refunded', 'failed')
+
+
+class StatementError(Exception):
+    """The file is not a statement this importer can read"""
+
+
+def text_stream(upload):
+    upload.seek(0)
+    return io.TextIOWrapper(upload, encoding='utf-8-sig', errors='replace', newline='')
+
+
+def csv_rows(stream):
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        raise StatementError('The statement is empty.')
+    header = [column.strip().lower() for column in header]
+    positions = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in header:
+                positions[field] = header.index(alias)
+                break
+    missing = [field for field in ('reference', 'amount', 'date') if field not in positions]
+    if missing:
+        raise StatementError(f"The statement has no {', '.join(missing)} column.")
+    for line, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        yield line, {field: row[index].strip() if index < len(row) else '' for field, index in positions.items()}
+
+
+def ofx_rows(stream):
+    """``STMTTRN`` blocks of an OFX (SGML or XML) statement"""
+    current, found = None, False
+    for line, text in enumerate(stream, start=1):
+        for closing, tag, value in OFX_TAG.findall(text):
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    yield current.pop('line'), current
+                    current = None
+                elif not closing:
+                    current, found = {'line': line}, True
+            elif current is not None and not closing and tag in OFX_FIELDS:
+                current[OFX_FIELDS[tag]] = value.strip()
+    if not found:
+        raise StatementError('The statement has no OFX transactions.')
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(value.replace(',', '').replace(' ', ''))
+    except (InvalidOperation, AttributeError):
+        return None
+    # NaN and Infinity are not amounts
+    if not amount.is_finite():
+        return None
+    return amount.quantize(Decimal('0.01'))
+
+
+def parse_date(value):
+    value = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            # Ignore any time part after the date
+            return datetime.strptime(value[:len(date(2000, 12, 31).strftime(fmt))], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def payment_index():
+    """``{reference: (payment id, amount, status)}`` for every payment"""
+    return {
+        reference: (pk, amount, status)
+        for pk, reference, amount, status in FeePayment.objects.order_by().values_list(
+            'pk', 'transaction_reference', 'amount_paid', 'status'
+        ).iterator(chunk_size=STATEMENT_CHUNK_SIZE)
+    }
+
+
+def student_index():
+    """``{admission number: (student id, fee structure id)}`` from each student's latest active enrollment"""
+    fees = {}
+    # A class's termly fee if it has one, then by name
+    for pk, class_id, year_id in FeeStructure.objects.filter(is_active=True, is_mandatory=True).order_by(
+        Case(When(frequency='termly', then=Value(0)), default=Value(1)), 'name'
+    ).values_list('pk', 'school_class_id', 'academic_year_id'):
+        fees.setdefault((year_id, class_id), pk)
+    billed = {}
+    for student_id, class_id, year_id in Enrollment.objects.filter(is_active=True).order_by(
+        'academic_year__start_date'
+    ).values_list('student_id', 'school_class_id', 'academic_year_id').iterator(chunk_size=STATEMENT_CHUNK_SIZE):
+        if (year_id, class_id) in fees:
+            billed[student_id] = fees[(year_id, class_id)]
+    return {
+        number.upper(): (student_id, billed[student_id])
+        for student_id, number in StudentProfile.objects.filter(admission_number__isnull=False).values_list(
+            'pk', 'admission_number'
+        ).iterator(chunk_size=STATEMENT_CHUNK_SIZE)
+        if student_id in billed
+    }
+
+
+def find_student(row, students):
+    if row.get('admission_number'):
+        return students.get(row['admission_number'].upper())
+    for word in re.findall(r'[A-Za-z0-9/-]+', f"{row.get('description', '')} {row.get('name', '')}"):
+        if word.upper() in students:
+            return students[word.upper()]
+    return None
+
+
+def term_for(day, terms):
+    for term in terms:
+        if term.start_date <= day <= term.end_date:
+            return term.pk
+    return None
+
+
+class StatementReconciler:
+    """Settles statement rows chunk by chunk against the payment and student indexes"""
+
+    def __init__(self, payment_method='bank_transfer', recorded_by=None):
+        self.payment_method = payment_method
+        self.recorded_by = recorded_by
+        self.payments = payment_index()
+        self.students = student_index()
+        self.terms = list(Term.objects.order_by('start_date'))
+        self.seen = set()
+        self.report = {
+            'rows': 0, **{outcome: 0 for outcome in OUTCOMES}, 'created_amount': Decimal('0.00'), 'exceptions': [],
+        }
+
+    def record(self, line, row, outcome, **details):
+        self.report[outcome] += 1
+        if outcome != 'matched' and len(self.report['exceptions']) < REPORT_ROW_LIMIT:
+            self.report['exceptions'].append({
+                'line': line, 'reference': row.get('reference'), 'amount': row.get('amount'), 'outcome': outcome,
+                **details,
+            })
+
+    def classify(self, line, row):
+        """Record ``row``'s outcome, or return the pending payment to create for it"""
+        reference = row.get('reference', '')
+        amount, day = parse_amount(row.get('amount', '')), parse_date(row.get('date'))
+        if not reference or len(reference) > 100 or amount is None or day is None:
+            return self.record(line, row, 'invalid')
+        if amount <= 0:
+            return self.record(line, row, 'debit')
+        if reference in self.seen:
+            return self.record(line, row, 'duplicate')
+        self.seen.add(reference)
+
+        known = self.payments.get(reference)
+        if known is not None:
+            payment_id, paid, status = known
+            if status in UNSETTLED_STATUSES:
+                return self.record(line, row, 'unsettled', payment=payment_id, status=status)
+            if paid == amount:
+                return self.record(line, row, 'matched', payment=payment_id)
+            return self.record(
+                line, row, 'amount_mismatch', payment=payment_id, recorded_amount=str(paid), status=status
+            )
+        student = find_student(row, self.students)
+        if student is None:
+            return self.record(line, row, 'unidentified')
+        student_id, fee_structure_id = student
+        return FeePayment(
+            student_id=student_id, fee_structure_id=fee_structure_id, term_id=term_for(day, self.terms),
+            amount_paid=amount, payment_date=day, payment_method=self.payment_method,
+            transaction_reference=reference, status='pending', remarks=row.get('description') or None,
+            recorded_by=self.recorded_by,
+        )
+
+    def reconcile(self, chunk):
+        new = []
+        for line, row in chunk:
+            self.report['rows'] += 1
+            payment = self.classify(line, row)
+            if payment is not None:
+                new.append((line, row, payment))
+        if not new:
+            return
+
+        with transaction.atomic():
+            FeePayment.objects.bulk_create([payment for _, _, payment in new])
+            if any(payment.pk is None for _, _, payment in new):
+                # Backends that cannot return ids from a bulk insert
+                ids = dict(FeePayment.objects.filter(
+                    transaction_reference__in=[payment.transaction_reference for _, _, payment in new]
+                ).values_list('transaction_reference', 'pk'))
+                for _, _, payment in new:
+                    payment.pk = ids[payment.transaction_reference]
+        models_changed(FeePayment)
+        for line, row, payment in new:
+            self.payments[payment.transaction_reference] = (payment.pk, payment.amount_paid, payment.status)
+            self.report['created_amount'] += payment.amount_paid
+            self.record(line, row, 'created', payment=payment.pk, student=payment.student_id)
+
+    def run(self, rows, chunk_size=STATEMENT_CHUNK_SIZE):
+        chunk = []
+        for line, row in rows:
+            chunk.append((line, row))
+            if len(chunk) >= chunk_size:
+                self.reconcile(chunk)
+                chunk = []
+        if chunk:
+            self.reconcile(chunk)
+        self.report['truncated'] = len(self.report['exceptions']) < self.report['rows'] - self.report['matched']
+        return self.report
+
+
+def import_statement(upload, file_format='csv', payment_method='bank_transfer', recorded_by=None,
+                     chunk_size=STATEMENT_CHUNK_SIZE):
+    """
+    Reconcile the statement in ``upload`` (a binary file) and return the
+    report: counts per outcome, the total of the created payments and up to
+    REPORT_ROW_LIMIT rows that did not simply match, with the payment they
+    concern. Raises StatementError when the file cannot be read as
+    ``file_format``.
+    """
+    stream = text_stream(upload)
+    try:
+        rows = ofx_rows(stream) if file_format == 'ofx' else csv_rows(stream)
+        return StatementReconciler(payment_method, recorded_by).run(rows, chunk_size)
+    finally:
+        # Leave the upload open for its owner
+        stream.detach()
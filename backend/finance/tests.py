@@ -1,2 +1,589 @@
+from datetime import date
+from io import StringIO
+from decimal import Decimal
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from users.models import User
+from adminstration.models import AcademicYear, SchoolClass, Term
+from admission.models import Guardian
+from students.models import StudentProfile, Enrollment
+from .accounts import rebuild_student_accounts
+from .cube import rebuild_expense_cube, slice_cube
+from .allocation import reconcile_allocations
+from .dunning import send_dunning_reminders, sweep_overdue_invoices
+from .ledger import rebuild_ledger
+from .models import (
+    FeeStructure, FeePayment, Expense, Invoice, InvoiceItem, InvoiceSequence, LedgerDailyRollup, PaymentAllocation,
+    StudentAccount, DunningReminder, Budget, ExpenseCube
+)
+from .services import build_invoice, deferred_invoice_totals, generate_term_invoices
+from .statements import import_statement
+
+
+class FinanceTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.accountant = User.objects.create_user(
+            email='acc@example.com', first_name='A', last_name='C', role='accountant', password='pw'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.accountant)
+        self.year = AcademicYear.objects.create(name='2025/26', start_date=date(2025, 9, 1), end_date=date(2026, 7, 31))
+        self.school_class = SchoolClass.objects.create(name='Grade 1', code='G1')
+        self.fee = FeeStructure.objects.create(
+            name='Tuition', school_class=self.school_class, academic_year=self.year, amount=Decimal('500.00')
+        )
+        self.student = StudentProfile.objects.create(first_name='Sam', last_name='Doe', dob=date(2018, 1, 1), gender='M')
+        self.term = Term.objects.create(
+            academic_year=self.year, name='Term 1', start_date=date(2025, 9, 1), end_date=date(2025, 12, 15)
+        )
+
+    def invoice(self, **fields):
+        return Invoice.objects.create(**{
+            'student': self.student, 'academic_year': self.year, 'term': self.term,
+            'issue_date': date(2025, 9, 1), 'due_date': date(2025, 10, 1), 'status': 'sent', **fields,
+        })
+
+    def pay(self, amount, payment_date, reference, status='completed'):
+        return FeePayment.objects.create(
+            student=self.student, fee_structure=self.fee, amount_paid=Decimal(amount),
+            payment_date=payment_date, payment_method='cash', transaction_reference=reference, status=status
+        )
+
+
+class LedgerRollupTests(FinanceTestMixin, TestCase):
+    def test_rollup_follows_payment_writes(self):
+        payment = self.pay('100.00', date(2026, 1, 10), 'R1')
+        self.pay('50.00', date(2026, 1, 10), 'R2', status='pending')
+        self.assertEqual(LedgerDailyRollup.objects.get(kind='revenue', date=date(2026, 1, 10)).amount, Decimal('100.00'))
+
+        payment.payment_date = date(2026, 2, 3)
+        payment.save()
+        self.assertFalse(LedgerDailyRollup.objects.filter(kind='revenue', date=date(2026, 1, 10)).exists())
+        self.assertEqual(LedgerDailyRollup.objects.get(kind='revenue', date=date(2026, 2, 3)).entries, 1)
+
+        payment.delete()
+        self.assertFalse(LedgerDailyRollup.objects.filter(kind='revenue').exists())
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.pay('100.00', date(2026, 1, 10), 'R1')
+        Expense.objects.create(category='utilities', amount=Decimal('40.00'), description='Water', expense_date=date(2026, 1, 12))
+        incremental = list(LedgerDailyRollup.objects.values_list('kind', 'date', 'amount', 'entries'))
+        self.assertEqual(rebuild_ledger(), 2)
+        self.assertEqual(list(LedgerDailyRollup.objects.values_list('kind', 'date', 'amount', 'entries')), incremental)
+
+    def test_trends_endpoint_buckets_by_calendar_month(self):
+        self.pay('100.00', date(2026, 1, 31), 'R1')
+        self.pay('70.00', date(2026, 3, 1), 'R2')
+        Expense.objects.create(category='utilities', amount=Decimal('40.00'), description='Water', expense_date=date(2026, 3, 2))
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/finance/trends/', {'from': '2026-01-01', 'to': '2026-03-31', 'bucket': 'month'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(t['period'], t['revenue'], t['expenses']) for t in response.data['trends']],
+            [
+                ('2026-01-01', Decimal('100.00'), Decimal('0')),
+                ('2026-02-01', Decimal('0'), Decimal('0')),
+                ('2026-03-01', Decimal('70.00'), Decimal('40.00')),
+            ]
+        )
+
+    def test_trends_endpoint_rejects_bad_parameters(self):
+        for params in (
+            {'bucket': 'year'}, {'from': 'garbage'}, {'to': '2026-02-30'},
+            {'from': '2024-01-01', 'to': '2025-12-31', 'bucket': 'day'},
+        ):
+            self.assertEqual(self.client.get('/api/finance/trends/', params).status_code, 400, params)
+        response = self.client.get('/api/finance/trends/', {'from': '2025-01-01', 'to': '2025-12-31', 'bucket': 'day'})
+        self.assertEqual(len(response.data['trends']), 365)
+
+
+class InvoiceNumberingTests(FinanceTestMixin, TestCase):
+    def test_numbers_come_from_the_sequence_without_counting(self):
+        year = date.today().year
+        with CaptureQueriesContext(connection) as ctx:
+            first = self.invoice(total_amount=Decimal('10.00'))
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()])
+        second = self.invoice(total_amount=Decimal('10.00'))
+        self.assertEqual([first.invoice_number, second.invoice_number], [f'INV-{year}-0001', f'INV-{year}-0002'])
+
+        self.assertEqual(InvoiceSequence.allocate(year, 3), [f'INV-{year}-{n:04d}' for n in (3, 4, 5)])
+        self.assertEqual(self.invoice(total_amount=Decimal('10.00')).invoice_number, f'INV-{year}-0006')
+
+    def test_rolled_back_numbers_are_reused_and_old_numbers_respected(self):
+        Invoice.objects.bulk_create([Invoice(
+            invoice_number='INV-2031-0041', student=self.student, academic_year=self.year, term=self.term,
+            issue_date=date(2025, 9, 1), due_date=date(2025, 10, 1),
+        )])
+        self.assertEqual(InvoiceSequence.allocate(2031), ['INV-2031-0042'])
+        try:
+            with transaction.atomic():
+                InvoiceSequence.allocate(2031, 10)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(InvoiceSequence.allocate(2031), ['INV-2031-0043'])
+
+
+class InvoiceBuilderTests(FinanceTestMixin, TestCase):
+    def fees(self, count):
+        return [
+            FeeStructure.objects.create(
+                name=f'Fee {n}', school_class=self.school_class, academic_year=self.year, amount=Decimal('10.00') * (n + 1)
+            )
+            for n in range(count)
+        ]
+
+    def test_builds_an_invoice_with_its_items_in_constant_queries(self):
+        fees = self.fees(8)
+
+        def build(items):
+            with CaptureQueriesContext(connection) as ctx:
+                invoice = build_invoice(
+                    self.student.pk, self.year.pk, self.term.pk, date(2025, 9, 1), date(2025, 10, 1), items,
+                    created_by=self.accountant, status='sent',
+                )
+            return invoice, len(ctx.captured_queries)
+
+        build([{'fee_structure': fees[0]}])  # creates the year's sequence
+        _, single = build([{'fee_structure': fees[0]}])
+        invoice, eight = build(
+            [{'fee_structure': fee} for fee in fees[:-1]] + [{'fee_structure': fees[-1], 'amount': Decimal('5.00')}]
+        )
+        self.assertEqual(eight, single)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, Decimal('285.00'))
+        self.assertEqual((invoice.balance, invoice.status), (Decimal('285.00'), 'sent'))
+        self.assertEqual(invoice.items.count(), 8)
+
+    def test_item_saves_keep_totals_and_batches_recalculate_once(self):
+        first, second, third = self.fees(3)
+        invoice = self.invoice(status='sent')
+        InvoiceItem.objects.create(invoice=invoice, fee_structure=first, amount=Decimal('10.00'))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, Decimal('10.00'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            with deferred_invoice_totals():
+                InvoiceItem.objects.create(invoice=invoice, fee_structure=second, amount=Decimal('20.00'))
+                InvoiceItem.objects.create(invoice=invoice, fee_structure=third, amount=Decimal('30.00'))
+                InvoiceItem.objects.get(fee_structure=first).delete()
+                self.assertEqual(Invoice.objects.get(pk=invoice.pk).total_amount, Decimal('10.00'))
+        aggregates = [
+            q for q in ctx.captured_queries if 'SUM(' in q['sql'].upper() and 'FROM "finance_invoiceitem"' in q['sql']
+        ]
+        self.assertEqual(len(aggregates), 1)
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.total_amount, invoice.balance), (Decimal('50.00'), Decimal('50.00')))
+
+
+class TermInvoicingTests(FinanceTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.fee.frequency = 'termly'
+        self.fee.save()
+        FeeStructure.objects.create(
+            name='Admission', school_class=self.school_class, academic_year=self.year, amount=Decimal('100.00'),
+            frequency='once'
+        )
+        FeeStructure.objects.create(
+            name='Lunch', school_class=self.school_class, academic_year=self.year, amount=Decimal('20.00'),
+            frequency='monthly'
+        )
+        FeeStructure.objects.create(
+            name='Trip', school_class=self.school_class, academic_year=self.year, amount=Decimal('50.00'),
+            is_mandatory=False
+        )
+        self.students = [self.student] + [
+            StudentProfile.objects.create(first_name='S', last_name=str(n), dob=date(2018, 1, 1), gender='F')
+            for n in range(4)
+        ]
+        for student in self.students:
+            Enrollment.objects.create(student=student, academic_year=self.year, school_class=self.school_class)
+
+    def test_invoices_the_term_once_per_student(self):
+        summary = generate_term_invoices(self.term, issue_date=date(2025, 9, 1), chunk_size=2)
+        self.assertEqual((summary['created'], summary['skipped']), (5, 0))
+        # Tuition 500 + admission 100 + lunch 20 x 4 months (Sep-Dec)
+        invoice = Invoice.objects.get(student=self.student, term=self.term)
+        self.assertEqual(invoice.total_amount, Decimal('680.00'))
+        self.assertEqual((invoice.status, invoice.due_date), ('sent', date(2025, 10, 1)))
+        self.assertEqual(invoice.items.get(fee_structure__name='Lunch').description, 'Lunch (4 months)')
+
+        self.assertEqual(generate_term_invoices(self.term)['created'], 0)
+        self.assertEqual(Invoice.objects.count(), 5)
+
+        # The once-off admission fee is not billed again next term
+        spring = Term.objects.create(
+            academic_year=self.year, name='Term 2', start_date=date(2026, 1, 5), end_date=date(2026, 3, 27)
+        )
+        generate_term_invoices(spring)
+        self.assertEqual(Invoice.objects.get(student=self.student, term=spring).total_amount, Decimal('560.00'))
+
+    def test_generate_action(self):
+        response = self.client.post('/api/finance/invoices/generate_term/', {
+            'academic_year': self.year.pk, 'term': self.term.pk, 'classes': [self.school_class.pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual(Invoice.objects.filter(created_by=self.accountant).count(), 5)
+
+
+class PaymentAllocationTests(FinanceTestMixin, TestCase):
+    def figures(self, invoice):
+        invoice.refresh_from_db()
+        return invoice.paid_amount, invoice.balance, invoice.status
+
+    def test_payments_settle_the_oldest_invoices_first(self):
+        older = self.invoice(total_amount=Decimal('300.00'))
+        newer = self.invoice(total_amount=Decimal('200.00'), due_date=date(2025, 11, 1))
+
+        payment = self.pay('400.00', date(2025, 9, 20), 'P-1')
+        self.assertEqual(
+            list(payment.allocations.values_list('invoice_id', 'amount')),
+            [(older.pk, Decimal('300.00')), (newer.pk, Decimal('100.00'))]
+        )
+        self.assertEqual(self.figures(older), (Decimal('300.00'), Decimal('0.00'), 'paid'))
+        self.assertEqual(self.figures(newer), (Decimal('100.00'), Decimal('100.00'), 'sent'))
+
+        # Refunding takes the money back off both invoices
+        payment.status = 'refunded'
+        payment.save()
+        self.assertFalse(PaymentAllocation.objects.exists())
+        self.assertEqual(self.figures(older), (Decimal('0.00'), Decimal('300.00'), 'overdue'))
+
+        payment.status = 'completed'
+        payment.save()
+        self.assertEqual(self.figures(newer), (Decimal('100.00'), Decimal('100.00'), 'sent'))
+        payment.delete()
+        self.assertEqual(self.figures(newer), (Decimal('0.00'), Decimal('200.00'), 'sent'))
+
+    def test_reconcile_repairs_drift_and_allocates_credit(self):
+        invoice = self.invoice(total_amount=Decimal('500.00'))
+        self.pay('150.00', date(2025, 8, 20), 'P-EARLY')
+        # Drift behind the allocation code's back: the payment's allocation is lost
+        PaymentAllocation.objects.all().delete()
+        Invoice.objects.filter(pk=invoice.pk).update(paid_amount=Decimal('500.00'), balance=0, status='paid')
+
+        self.assertEqual(
+            reconcile_allocations(), {'invoices': 1, 'stray_allocations': 0, 'payments_with_credit': 1}
+        )
+        self.assertEqual(self.figures(invoice)[2], 'paid')
+
+        reconcile_allocations(repair=True)
+        self.assertEqual(self.figures(invoice), (Decimal('150.00'), Decimal('350.00'), 'overdue'))
+        self.assertEqual(
+            reconcile_allocations(), {'invoices': 0, 'stray_allocations': 0, 'payments_with_credit': 0}
+        )
+
+    def test_opening_an_invoice_applies_credit_and_cancelling_releases_it(self):
+        payment = self.pay('150.00', date(2025, 8, 20), 'P-EARLY')
+        invoice = self.invoice(total_amount=Decimal('500.00'), status='draft')
+        self.assertFalse(payment.allocations.exists())
+
+        invoice.status = 'sent'
+        invoice.save()
+        self.assertEqual(self.figures(invoice), (Decimal('150.00'), Decimal('350.00'), 'sent'))
+
+        # The credit moves to the student's next open invoice
+        other = self.invoice(total_amount=Decimal('200.00'), due_date=date(2025, 11, 1))
+        invoice.status = 'cancelled'
+        invoice.save()
+        self.assertEqual(self.figures(invoice), (Decimal('0.00'), Decimal('500.00'), 'cancelled'))
+        self.assertEqual(self.figures(other), (Decimal('150.00'), Decimal('50.00'), 'sent'))
+
+    def test_saving_a_stale_invoice_keeps_the_allocated_amount(self):
+        invoice = self.invoice(total_amount=Decimal('300.00'))
+        stale = Invoice.objects.get(pk=invoice.pk)
+        self.pay('300.00', date(2025, 9, 20), 'P-1')
+
+        stale.notes = 'Edited'
+        stale.save()
+        self.assertEqual(self.figures(invoice), (Decimal('300.00'), Decimal('0.00'), 'paid'))
+
+        # A higher total reopens the paid invoice
+        invoice.total_amount = Decimal('400.00')
+        invoice.save()
+        self.assertEqual(self.figures(invoice), (Decimal('300.00'), Decimal('100.00'), 'overdue'))
+
+    def test_mark_paid_needs_a_settled_balance(self):
+        invoice = self.invoice(total_amount=Decimal('500.00'))
+        response = self.client.post(f'/api/finance/invoices/{invoice.pk}/mark_paid/')
+        self.assertEqual(response.status_code, 400)
+
+        self.pay('500.00', date(2025, 9, 20), 'P-1')
+        response = self.client.get(f'/api/finance/invoices/{invoice.pk}/')
+        self.assertEqual((response.data['paid_amount'], response.data['status']), ('500.00', 'paid'))
+
+
+class StatementImportTests(FinanceTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Enrollment.objects.create(student=self.student, academic_year=self.year, school_class=self.school_class)
+        self.pay('500.00', date(2025, 9, 2), 'BANK-1')
+        self.pay('200.00', date(2025, 9, 3), 'BANK-2')
+        self.pay('90.00', date(2025, 9, 4), 'BANK-7', status='refunded')
+
+    def test_csv_rows_are_matched_created_or_reported(self):
+        number = self.student.admission_number
+        statement = SimpleUploadedFile('statement.csv', '\n'.join([
+            'Date,Reference,Details,Amount,Account',
+            '02/09/2025,BANK-1,School fees,"500.00",',
+            '2025-09-03,BANK-2,School fees,250.00,',
+            '2025-09-03,BANK-2,School fees,250.00,',
+            '2025-09-10,BANK-3,Fees,300.00,' + number,
+            f'2025-09-11,BANK-4,Fees for {number.lower()},"1,000.00",',
+            '2025-09-12,BANK-5,Fees,80.00,',
+            '2025-09-12,CHG-1,Bank charge,-5.00,',
+            'someday,BANK-6,Fees,10.00,',
+            '2025-09-13,BANK-8,Fees,NaN,',
+            '2025-09-13,BANK-7,Fees,90.00,',
+        ]).encode())
+
+        report = import_statement(statement, chunk_size=3)
+        self.assertEqual(
+            [report[outcome] for outcome in ('rows', 'matched', 'amount_mismatch', 'unsettled', 'duplicate',
+                                             'created', 'unidentified', 'debit', 'invalid')],
+            [10, 1, 1, 1, 1, 2, 1, 1, 2]
+        )
+        self.assertEqual(report['created_amount'], Decimal('1300.00'))
+        created = FeePayment.objects.get(transaction_reference='BANK-4')
+        self.assertEqual(
+            (created.status, created.amount_paid, created.fee_structure, created.term),
+            ('pending', Decimal('1000.00'), self.fee, self.term)
+        )
+        self.assertFalse(PaymentAllocation.objects.filter(payment=created).exists())
+
+    def test_ofx_upload(self):
+        statement = SimpleUploadedFile('statement.qfx', b"""OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250902120000<TRNAMT>500.00<FITID>BANK-1<MEMO>Fees</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250915<TRNAMT>120.00<FITID>BANK-9<NAME>Unknown payer</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+""")
+        response = self.client.post(
+            '/api/finance/fee-payments/reconcile_statement/', {'file': statement}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['matched'], response.data['unidentified']), (1, 1))
+        self.assertEqual(response.data['exceptions'][0]['reference'], 'BANK-9')
+
+        response = self.client.post('/api/finance/fee-payments/reconcile_statement/', {
+            'file': SimpleUploadedFile('statement.csv', b'Date,Amount\n2025-09-02,5.00\n'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+class StudentAccountTests(FinanceTestMixin, TestCase):
+    def account(self, student=None):
+        account = StudentAccount.objects.get(student=student or self.student)
+        return account.total_billed, account.total_paid, account.balance, account.oldest_unpaid_due_date
+
+    def test_account_follows_invoice_and_payment_writes(self):
+        self.invoice(total_amount=Decimal('300.00'))
+        self.invoice(total_amount=Decimal('200.00'), due_date=date(2025, 11, 1))
+        self.invoice(total_amount=Decimal('999.00'), status='draft')
+        self.assertEqual(self.account(), (Decimal('500.00'), Decimal('0.00'), Decimal('500.00'), date(2025, 10, 1)))
+
+        payment = self.pay('350.00', date(2025, 9, 20), 'P-1')
+        self.assertEqual(self.account(), (Decimal('500.00'), Decimal('350.00'), Decimal('150.00'), date(2025, 11, 1)))
+
+        # Credit beyond what was billed shows as a negative balance
+        self.pay('200.00', date(2025, 9, 21), 'P-2')
+        self.assertEqual(self.account(), (Decimal('500.00'), Decimal('550.00'), Decimal('-50.00'), None))
+
+        payment.delete()
+        self.assertEqual(self.account()[1:3], (Decimal('200.00'), Decimal('300.00')))
+
+        incremental = list(StudentAccount.objects.values_list('student', 'total_billed', 'total_paid', 'balance'))
+        rebuild_student_accounts()
+        self.assertEqual(
+            list(StudentAccount.objects.values_list('student', 'total_billed', 'total_paid', 'balance')), incremental
+        )
+
+    def test_by_class_lists_the_roster_in_constant_queries(self):
+        students = [self.student] + [
+            StudentProfile.objects.create(first_name='S', last_name=str(n), dob=date(2018, 1, 1), gender='F')
+            for n in range(5)
+        ]
+        for student in students:
+            Enrollment.objects.create(student=student, academic_year=self.year, school_class=self.school_class)
+        self.invoice(total_amount=Decimal('300.00'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/finance/student-accounts/by_class/', {
+                'school_class': self.school_class.pk, 'academic_year': self.year.pk,
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 6)
+        owing = {row['student']: (row['balance'], row['is_overdue']) for row in response.data}
+        self.assertEqual(owing[self.student.pk], ('300.00', True))
+        self.assertEqual(owing[students[1].pk], ('0.00', False))
+
+
+class OverdueSweepTests(FinanceTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.guardian = Guardian.objects.create(first_name='Pat', last_name='Doe', phone='1', email='pat@example.com')
+        self.student.guardian = self.guardian
+        self.student.save()
+        sibling = StudentProfile.objects.create(
+            first_name='Kim', last_name='Doe', dob=date(2019, 1, 1), gender='F', guardian=self.guardian
+        )
+        self.first = self.invoice(total_amount=Decimal('300.00'), due_date=date(2025, 10, 1))
+        self.second = self.invoice(student=sibling, total_amount=Decimal('200.00'), due_date=date(2025, 10, 3))
+        self.later = self.invoice(total_amount=Decimal('100.00'), due_date=date(2025, 10, 20))
+        self.draft = self.invoice(total_amount=Decimal('100.00'), due_date=date(2025, 9, 1), status='draft')
+
+    def test_sweep_marks_lapsed_invoices_once_and_groups_reminders(self):
+        with self.assertNumQueries(9):
+            sweep = sweep_overdue_invoices(as_of=date(2025, 10, 10))
+        self.assertEqual((sweep.invoices_marked, sweep.reminders_queued), (2, 1))
+        self.assertEqual(
+            set(Invoice.objects.filter(status='overdue').values_list('pk', flat=True)), {self.first.pk, self.second.pk}
+        )
+        reminder = DunningReminder.objects.get()
+        self.assertEqual((reminder.guardian, reminder.total_due), (self.guardian, Decimal('500.00')))
+
+        # The next run only looks at due dates since the last one
+        Invoice.objects.filter(pk=self.first.pk).update(status='sent')
+        sweep = sweep_overdue_invoices(as_of=date(2025, 10, 25))
+        self.assertEqual((sweep.window_start, sweep.invoices_marked), (date(2025, 10, 10), 1))
+        self.assertEqual(Invoice.objects.get(pk=self.first.pk).status, 'sent')
+        self.assertEqual(sweep_overdue_invoices(as_of=date(2025, 10, 25), full=True).invoices_marked, 1)
+
+    def test_reminders_are_sent_in_rate_limited_batches(self):
+        other = Guardian.objects.create(first_name='No', last_name='Mail', phone='2')
+        orphan = StudentProfile.objects.create(
+            first_name='Lee', last_name='Roe', dob=date(2018, 1, 1), gender='M', guardian=other
+        )
+        self.invoice(student=orphan, total_amount=Decimal('50.00'), due_date=date(2025, 10, 1))
+        third = Guardian.objects.create(first_name='Al', last_name='Poe', phone='3', email='al@example.com')
+        self.invoice(
+            student=StudentProfile.objects.create(
+                first_name='Jo', last_name='Poe', dob=date(2018, 1, 1), gender='M', guardian=third
+            ),
+            total_amount=Decimal('75.00'), due_date=date(2025, 10, 2),
+        )
+        sweep_overdue_invoices(as_of=date(2025, 10, 10))
+        # Paid after queueing: left out of the message
+        self.pay('300.00', date(2025, 10, 11), 'P-1')
+
+        pauses = []
+        counts = send_dunning_reminders(batch_size=2, per_minute=60, sleep=pauses.append)
+        self.assertEqual(counts, {'sent': 2, 'failed': 0, 'skipped': 1})
+        self.assertEqual(len(pauses), 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['al@example.com', 'pat@example.com'])
+        body = next(message.body for message in mail.outbox if message.to == ['pat@example.com'])
+        self.assertIn(self.second.invoice_number, body)
+        self.assertNotIn(self.first.invoice_number, body)
+        self.assertFalse(DunningReminder.objects.filter(status='queued').exists())
+
+
+class ExpenseCubeTests(FinanceTestMixin, TestCase):
+    def spend(self, category, amount, expense_date):
+        return Expense.objects.create(
+            category=category, amount=Decimal(amount), expense_date=expense_date, description=category
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.spend('utilities', '100.00', date(2025, 8, 20))
+        self.spend('utilities', '50.00', date(2025, 9, 5))
+        self.moved = self.spend('supplies', '30.00', date(2025, 9, 9))
+        self.spend('supplies', '20.00', date(2025, 10, 1))
+
+    def test_cube_follows_expense_writes(self):
+        self.assertEqual(slice_cube(by=['month']), [
+            {'month': date(2025, 8, 1), 'amount': Decimal('100.00'), 'entries': 1},
+            {'month': date(2025, 9, 1), 'amount': Decimal('80.00'), 'entries': 2},
+            {'month': date(2025, 10, 1), 'amount': Decimal('20.00'), 'entries': 1},
+        ])
+        # August predates the academic year
+        self.assertEqual(
+            slice_cube(by=['academic_year']),
+            [{'academic_year': None, 'amount': Decimal('100.00'), 'entries': 1},
+             {'academic_year': self.year.pk, 'amount': Decimal('100.00'), 'entries': 3}]
+        )
+        # A second August expense updates the cell outside every year in place
+        self.spend('utilities', '5.00', date(2025, 8, 21))
+        self.assertEqual(
+            list(ExpenseCube.objects.filter(month=date(2025, 8, 1)).values_list('amount', 'entries')),
+            [(Decimal('105.00'), 2)]
+        )
+        Expense.objects.get(amount=Decimal('5.00')).delete()
+
+        self.moved.expense_date = date(2025, 10, 2)
+        self.moved.category = 'maintenance'
+        self.moved.save()
+        self.assertEqual(
+            slice_cube(by=['category'], month_from=date(2025, 10, 1)),
+            [{'category': 'maintenance', 'amount': Decimal('30.00'), 'entries': 1},
+             {'category': 'supplies', 'amount': Decimal('20.00'), 'entries': 1}]
+        )
+
+        # Moving the year's start re-files August
+        self.year.start_date = date(2025, 8, 1)
+        self.year.save()
+        self.assertEqual(slice_cube(academic_year=self.year.pk)[0]['amount'], Decimal('200.00'))
+
+        incremental = list(ExpenseCube.objects.values_list('category', 'month', 'academic_year', 'amount'))
+        rebuild_expense_cube()
+        self.assertEqual(
+            list(ExpenseCube.objects.values_list('category', 'month', 'academic_year', 'amount')), incremental
+        )
+
+    def test_summary_budget_and_drill_down_read_the_cube(self):
+        response = self.client.get('/api/finance/expenses/expense_summary/')
+        self.assertEqual((response.data['total_expenses'], response.data['expense_count']), (Decimal('200.00'), 4))
+        self.assertEqual(response.data['by_category']['supplies']['total'], Decimal('50.00'))
+
+        response = self.client.get('/api/finance/expense-cube/', {'by': 'category,month', 'category': 'utilities'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([cell['month'] for cell in response.data['cells']], [date(2025, 8, 1), date(2025, 9, 1)])
+        self.assertEqual(self.client.get('/api/finance/expense-cube/', {'by': 'vendor'}).status_code, 400)
+
+        # Drill the September utilities cell down to its rows
+        response = self.client.get('/api/finance/expenses/', {
+            'category': 'utilities', 'month_from': '2025-09', 'month_to': '2025-09',
+        })
+        self.assertEqual([row['expense_date'] for row in response.data['results']], ['2025-09-05'])
+        response = self.client.get('/api/finance/expenses/', {'academic_year': self.year.pk})
+        self.assertEqual(len(response.data['results']), 3)
+
+        # Overlapping years: the drill-down files each expense under the same year as the cube
+        later = AcademicYear.objects.create(name='2025/26 B', start_date=date(2025, 10, 1), end_date=date(2026, 9, 30))
+        for academic_year in (self.year, later):
+            response = self.client.get('/api/finance/expenses/', {'academic_year': academic_year.pk})
+            self.assertEqual(len(response.data['results']), slice_cube(academic_year=academic_year.pk)[0]['entries'])
+        self.assertEqual(len(response.data['results']), 1)
+        later.delete()
+
+        AcademicYear.objects.filter(pk=self.year.pk).update(is_active=True)
+        Budget.objects.create(academic_year=self.year, total_budget=Decimal('1000.00'))
+        response = self.client.get('/api/finance/budgets/')
+        self.assertEqual(response.status_code, 200)
+        budget = response.data['results'][0]
+        self.assertEqual((budget['total_expenses'], budget['remaining_budget']), ('100.00', '900.00'))
+        response = self.client.get('/api/finance/budgets/budget_summary/')
+        self.assertEqual(response.data, {
+            'total_budget': Decimal('1000.00'), 'total_spent': Decimal('100.00'),
+            'total_remaining': Decimal('900.00'), 'active_budgets': 1,
+        })
 
+        # A category dropped from the choices still shows in the summary
+        Expense.objects.filter(category='supplies').update(category='legacy')
+        # Rebuilding invalidates the cached summary
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_expense_cube', stdout=StringIO())
+        response = self.client.get('/api/finance/expenses/expense_summary/')
+        self.assertEqual(response.data['by_category']['legacy'], {'name': 'legacy', 'total': Decimal('50.00')})
@@ -4,17 +4,23 @@ from .views import (
     FeeStructureViewSet,
     FeePaymentViewSet,
     InvoiceViewSet,
+    StudentAccountViewSet,
     ExpenseViewSet,
-    BudgetViewSet
+    BudgetViewSet,
+    finance_trends,
+    expense_cube
 )
 
 router = DefaultRouter()
 router.register(r'fee-structures', FeeStructureViewSet, basename='fee-structure')
 router.register(r'fee-payments', FeePaymentViewSet, basename='fee-payment')
 router.register(r'invoices', InvoiceViewSet, basename='invoice')
+router.register(r'student-accounts', StudentAccountViewSet, basename='student-account')
 router.register(r'expenses', ExpenseViewSet, basename='expense')
 router.register(r'budgets', BudgetViewSet, basename='budget')
 
 urlpatterns = [
+    path('trends/', finance_trends, name='finance-trends'),
+    path('expense-cube/', expense_cube, name='finance-expense-cube'),
     path('', include(router.urls)),
 ]
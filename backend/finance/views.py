@@ -1,16 +1,33 @@
+from decimal import Decimal
+
 from rest_framework import viewsets, filters, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django.db.models import Sum, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from users.permissions import IsAdminOrAccountant, IsAdmin
-from .models import FeeStructure, FeePayment, Invoice, Expense, Budget
+from dashboards.cache import cached_response
+from adminstration.models import AcademicYear, Term
+from students.models import Enrollment
+from server.exports import ExportMixin
+from server.pagination import paginated_response
+from .models import FeeStructure, FeePayment, Invoice, StudentAccount, Expense, Budget
+from .cube import DIMENSIONS, cell_expenses, parse_month, slice_cube, spent_per_budget
+from .ledger import BUCKETS, MAX_DAY_BUCKETS, ledger_trends, month_start
+from .services import generate_term_invoices
+from .statements import StatementError, import_statement
 from .serializers import (
     FeeStructureSerializer,
     FeePaymentSerializer,
     InvoiceSerializer,
     ExpenseSerializer,
-    BudgetSerializer
+    BudgetSerializer,
+    GenerateTermInvoicesSerializer,
+    StatementImportSerializer,
+    StudentAccountSerializer
 )
 
 
@@ -32,16 +49,17 @@ class FeeStructureViewSet(viewsets.ModelViewSet):
     def active(self, request):
         """Get all active fee structures"""
         active_structures = self.queryset.filter(is_active=True)
-        serializer = self.get_serializer(active_structures, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, active_structures)
 
 
-class FeePaymentViewSet(viewsets.ModelViewSet):
+class FeePaymentViewSet(ExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing fee payments.
     Only admins and accountants can manage payments.
     """
-    queryset = FeePayment.objects.select_related('student', 'fee_structure', 'term', 'recorded_by')
+    queryset = FeePayment.objects.select_related('student', 'fee_structure', 'term', 'recorded_by').prefetch_related(
+        'allocations__invoice'
+    )
     serializer_class = FeePaymentSerializer
     permission_classes = [IsAdminOrAccountant]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -49,6 +67,19 @@ class FeePaymentViewSet(viewsets.ModelViewSet):
     search_fields = ['student__first_name', 'student__last_name', 'transaction_reference']
     ordering_fields = ['payment_date', 'amount_paid', 'created_at']
     ordering = ['-payment_date']
+    export_filename = 'fee-payments'
+    export_columns = [
+        ('Payment date', 'payment_date'),
+        ('Reference', 'transaction_reference'),
+        ('Admission number', 'student__admission_number'),
+        ('First name', 'student__first_name'),
+        ('Last name', 'student__last_name'),
+        ('Fee', 'fee_structure__name'),
+        ('Term', 'term__name'),
+        ('Amount', 'amount_paid'),
+        ('Method', 'payment_method'),
+        ('Status', 'status'),
+    ]
 
     @action(detail=False, methods=['get'])
     def student_payments(self, request):
@@ -61,10 +92,31 @@ class FeePaymentViewSet(viewsets.ModelViewSet):
             )
         
         payments = self.queryset.filter(student_id=student_id)
-        serializer = self.get_serializer(payments, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, payments)
+
+    @action(detail=False, methods=['post'])
+    def reconcile_statement(self, request):
+        """
+        Reconcile an uploaded bank or mobile-money statement (CSV or OFX)
+        against the recorded payments. Credits matching no payment are
+        recorded as pending payments; returns the reconciliation report.
+        """
+        serializer = StatementImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            report = import_statement(
+                data['file'],
+                file_format=data['file_format'],
+                payment_method=data['payment_method'],
+                recorded_by=request.user,
+            )
+        except StatementError as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK)
 
     @action(detail=False, methods=['get'])
+    @cached_response('finance.payments.summary', [FeePayment])
     def payment_summary(self, request):
         """Get payment summary statistics"""
         payments = self.queryset.filter(status='completed')
@@ -98,28 +150,55 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         outstanding = self.queryset.filter(
             Q(status='sent') | Q(status='overdue')
         ).filter(balance__gt=0)
-        serializer = self.get_serializer(outstanding, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, outstanding)
+
+    @action(detail=False, methods=['post'])
+    def generate_term(self, request):
+        """
+        Invoice every active enrollment of a term (optionally only some
+        classes) for the mandatory fee structures. Students already invoiced
+        for the term are skipped, so the request can be repeated.
+        """
+        serializer = GenerateTermInvoicesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        summary = generate_term_invoices(
+            data['term'],
+            class_ids=[school_class.pk for school_class in data.get('classes', [])],
+            issue_date=data.get('issue_date'),
+            due_date=data.get('due_date'),
+            status=data['status'],
+            created_by=request.user,
+        )
+        return Response(summary, status=status.HTTP_201_CREATED if summary['created'] else status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
     def mark_paid(self, request, pk=None):
-        """Mark an invoice as paid"""
+        """
+        Mark a settled invoice as paid. Paid amounts come from the payments
+        allocated to the invoice, so an outstanding balance has to be paid
+        by recording a payment instead.
+        """
         invoice = self.get_object()
+        if invoice.balance > 0:
+            return Response(
+                {'error': f'Invoice has an outstanding balance of {invoice.balance}; record a payment to settle it'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         invoice.status = 'paid'
-        invoice.amount_paid = invoice.total_amount
-        invoice.balance = 0
         invoice.save()
         serializer = self.get_serializer(invoice)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @cached_response('finance.invoices.summary', [Invoice])
     def invoice_summary(self, request):
         """Get invoice summary statistics"""
         invoices = self.queryset.all()
         summary = {
             'total_invoices': invoices.count(),
             'total_amount': invoices.aggregate(total=Sum('total_amount'))['total'] or 0,
-            'total_paid': invoices.aggregate(total=Sum('amount_paid'))['total'] or 0,
+            'total_paid': invoices.aggregate(total=Sum('paid_amount'))['total'] or 0,
             'total_outstanding': invoices.aggregate(total=Sum('balance'))['total'] or 0,
             'paid_invoices': invoices.filter(status='paid').count(),
             'overdue_invoices': invoices.filter(status='overdue').count(),
@@ -127,37 +206,98 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         return Response(summary)
 
 
+class StudentAccountViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only running fee accounts, one per student.
+    Only admins and accountants can view accounts.
+    """
+    queryset = StudentAccount.objects.select_related('student')
+    serializer_class = StudentAccountSerializer
+    permission_classes = [IsAdminOrAccountant]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields = ['student']
+    search_fields = ['student__admission_number', 'student__first_name', 'student__last_name']
+    ordering_fields = ['balance', 'oldest_unpaid_due_date', 'updated_at']
+    ordering = ['-balance']
+
+    @action(detail=False, methods=['get'])
+    def by_class(self, request):
+        """
+        Accounts of every student actively enrolled in a class (optionally
+        one section) for an academic year, default the active one. Students
+        with no fee activity yet are listed with zero balances.
+        """
+        school_class = request.query_params.get('school_class')
+        if not school_class:
+            return Response(
+                {'error': 'school_class parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        academic_year = request.query_params.get('academic_year') or AcademicYear.objects.filter(
+            is_active=True
+        ).values_list('pk', flat=True).first()
+        roster = Enrollment.objects.filter(
+            school_class_id=school_class, academic_year_id=academic_year, is_active=True
+        ).select_related('student', 'student__account').order_by('student__last_name', 'student__first_name')
+        if request.query_params.get('section'):
+            roster = roster.filter(section_id=request.query_params['section'])
+
+        accounts = []
+        for enrollment in roster:
+            student = enrollment.student
+            account = getattr(student, 'account', None) or StudentAccount(student=student)
+            accounts.append(account)
+        return Response(self.get_serializer(accounts, many=True).data)
+
+
 class ExpenseViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing expenses.
     Only admins and accountants can manage expenses.
+    The list also takes the expense cube's slice parameters (academic_year,
+    month_from, month_to as YYYY-MM), to drill a cube cell down to its rows.
     """
-    queryset = Expense.objects.select_related('academic_year', 'term', 'approved_by', 'recorded_by')
+    queryset = Expense.objects.select_related('recorded_by', 'approved_by')
     serializer_class = ExpenseSerializer
     permission_classes = [IsAdminOrAccountant]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category', 'academic_year', 'term']
-    search_fields = ['title', 'description', 'vendor']
+    filterset_fields = ['category', 'expense_date']
+    search_fields = ['description']
     ordering_fields = ['expense_date', 'amount', 'created_at']
     ordering = ['-expense_date']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        try:
+            return cell_expenses(
+                queryset,
+                academic_year=params.get('academic_year'),
+                month_from=parse_month(params.get('month_from')),
+                month_to=parse_month(params.get('month_to')),
+            )
+        except ValueError:
+            raise ValidationError({'error': 'academic_year must be an id and month_from/month_to months (YYYY-MM)'})
+
     @action(detail=False, methods=['get'])
+    @cached_response('finance.expenses.summary', [Expense])
     def expense_summary(self, request):
         """Get expense summary by category"""
-        expenses = self.queryset.all()
-        total_expenses = expenses.aggregate(total=Sum('amount'))['total'] or 0
-        
-        by_category = {}
-        for category in Expense.CATEGORY_CHOICES:
-            category_total = expenses.filter(category=category[0]).aggregate(total=Sum('amount'))['total'] or 0
-            by_category[category[0]] = {
-                'name': category[1],
-                'total': category_total
-            }
-        
+        by_category = {
+            category: {'name': name, 'total': Decimal('0.00')} for category, name in Expense.CATEGORY_CHOICES
+        }
+        total_expenses, expense_count = Decimal('0.00'), 0
+        for row in slice_cube(by=['category']):
+            # Categories no longer offered keep their stored key as the name
+            by_category.setdefault(row['category'], {'name': row['category']})['total'] = row['amount']
+            total_expenses += row['amount']
+            expense_count += row['entries']
+
         summary = {
             'total_expenses': total_expenses,
-            'expense_count': expenses.count(),
+            'expense_count': expense_count,
             'by_category': by_category
         }
         return Response(summary)
@@ -184,19 +324,19 @@ class BudgetViewSet(viewsets.ModelViewSet):
     Only admins can create/update/delete budgets.
     Accountants can view budgets.
     """
-    queryset = Budget.objects.select_related('academic_year', 'term', 'created_by')
+    queryset = spent_per_budget(Budget.objects.select_related('academic_year', 'created_by'))
     serializer_class = BudgetSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['academic_year', 'term', 'status']
-    search_fields = ['name', 'description']
-    ordering_fields = ['start_date', 'total_budget', 'created_at']
-    ordering = ['-start_date']
+    filterset_fields = ['academic_year']
+    search_fields = ['academic_year__name', 'description']
+    ordering_fields = ['academic_year__start_date', 'total_budget', 'created_at']
+    ordering = ['-academic_year__start_date']
 
     def get_permissions(self):
         """
         Admins have full access, accountants can only view
         """
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'active', 'budget_summary']:
             permission_classes = [IsAdminOrAccountant]
         else:
             permission_classes = [IsAdmin]
@@ -204,29 +344,113 @@ class BudgetViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def active(self, request):
-        """Get all active budgets"""
-        active_budgets = self.queryset.filter(status='active')
-        serializer = self.get_serializer(active_budgets, many=True)
-        return Response(serializer.data)
-
-    @action(detail=True, methods=['post'])
-    def activate(self, request, pk=None):
-        """Activate a budget (admin only)"""
-        budget = self.get_object()
-        budget.status = 'active'
-        budget.save()
-        serializer = self.get_serializer(budget)
-        return Response(serializer.data)
+        """Get the budgets of the active academic year"""
+        active_budgets = self.queryset.filter(academic_year__is_active=True)
+        return paginated_response(self, active_budgets)
 
     @action(detail=False, methods=['get'])
+    @cached_response('finance.budgets.summary', [Budget, Expense, AcademicYear])
     def budget_summary(self, request):
-        """Get budget utilization summary"""
-        budgets = self.queryset.filter(status='active')
+        """Get budget utilization of the active academic year, spent amounts from the expense cube"""
+        budgets = self.queryset.filter(academic_year__is_active=True).values_list('total_budget', 'spent')
+        total_budget = total_spent = Decimal('0.00')
+        for budget, spent in budgets:
+            total_budget += budget
+            total_spent += spent
         summary = {
-            'total_budget': budgets.aggregate(total=Sum('total_budget'))['total'] or 0,
-            'total_spent': budgets.aggregate(total=Sum('spent_amount'))['total'] or 0,
-            'total_remaining': budgets.aggregate(total=Sum('remaining_amount'))['total'] or 0,
-            'active_budgets': budgets.count(),
+            'total_budget': total_budget,
+            'total_spent': total_spent,
+            'total_remaining': total_budget - total_spent,
+            'active_budgets': len(budgets),
         }
         return Response(summary)
 
+
+@api_view(['GET'])
+@permission_classes([IsAdminOrAccountant])
+@cached_response('finance.expense_cube', [Expense, AcademicYear])
+def expense_cube(request):
+    """
+    Expense totals from the category x month x academic year cube.
+    Query params: by (comma-separated dimensions to roll up to; none for the
+    grand total), category (repeatable), academic_year, month_from and
+    month_to (YYYY-MM). Drill a row down with the same slice parameters on
+    the expense list.
+    """
+    by = [dimension for dimension in request.query_params.get('by', '').split(',') if dimension]
+    unknown = [dimension for dimension in by if dimension not in DIMENSIONS]
+    if unknown:
+        return Response(
+            {'error': f"by must be a comma-separated subset of: {', '.join(DIMENSIONS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        month_from = parse_month(request.query_params.get('month_from'))
+        month_to = parse_month(request.query_params.get('month_to'))
+    except ValueError:
+        return Response(
+            {'error': 'month_from and month_to must be valid months (YYYY-MM)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return Response({
+        'by': by,
+        'cells': slice_cube(
+            by=by,
+            category=request.query_params.getlist('category'),
+            academic_year=request.query_params.get('academic_year'),
+            month_from=month_from,
+            month_to=month_to,
+        )
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminOrAccountant])
+@cached_response('finance.trends', [FeePayment, Expense, Term])
+def finance_trends(request):
+    """
+    Revenue/expense trends over an arbitrary date range.
+    Query params: from, to (YYYY-MM-DD) and bucket (day, week, month or term).
+    Defaults to the last six calendar months bucketed by month.
+    """
+    bucket = request.query_params.get('bucket', 'month')
+    if bucket not in BUCKETS:
+        return Response(
+            {'error': f"bucket must be one of: {', '.join(BUCKETS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    dates = {}
+    for param in ('from', 'to'):
+        value = request.query_params.get(param)
+        try:
+            # parse_date returns None for a malformed value and raises for an impossible one
+            dates[param] = parse_date(value) if value else None
+        except ValueError:
+            dates[param] = None
+        if value and dates[param] is None:
+            return Response(
+                {'error': 'from and to must be valid dates (YYYY-MM-DD)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    end = dates['to'] or timezone.now().date()
+    start = dates['from'] or month_start(end, months_back=5)
+
+    if start > end:
+        return Response(
+            {'error': 'from must be on or before to'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if bucket == 'day' and (end - start).days + 1 > MAX_DAY_BUCKETS:
+        return Response(
+            {'error': f'bucket=day covers at most {MAX_DAY_BUCKETS} days'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return Response({
+        'from': start,
+        'to': end,
+        'bucket': bucket,
+        'trends': ledger_trends(start, end, bucket)
+    })
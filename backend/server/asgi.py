@@ -2,6 +2,9 @@
 ASGI config for server project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Long-lived endpoints such as the live overview stream
+(/api/dashboard/overview/stream/) need to be served through it, e.g.
+``uvicorn server.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
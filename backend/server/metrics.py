@@ -0,0 +1,208 @@
+"""
+Per-request SQL instrumentation and a Prometheus text-format metrics view.
+
+``QueryMetricsMiddleware`` wraps every request in ``connection.execute_wrapper``
+and records, per resolved view name (which for router-registered ViewSets
+includes the action, e.g. ``fee-payment-payment-summary``) and method:
+latency and SQL query count histograms, total SQL time, response size and a
+request counter by status. Requests slower than ``SLOW_REQUEST_THRESHOLD_MS``
+are logged together with the SQL they ran. The middleware runs natively under
+both WSGI and ASGI; streaming responses (the dashboard event stream) are
+timed up to their headers and count no body bytes.
+
+Metrics are kept in process memory; each worker exposes its own series.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+MAX_CAPTURED_QUERIES = 200
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+            self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+            self.sql_seconds = defaultdict(float)
+            self.response_bytes = defaultdict(int)
+            self.requests = defaultdict(int)
+
+    def observe(self, view, method, status, seconds, query_count, sql_seconds, size):
+        labels = (view, method)
+        with self._lock:
+            self.latency[labels].observe(seconds)
+            self.queries[labels].observe(query_count)
+            self.sql_seconds[labels] += sql_seconds
+            self.response_bytes[labels] += size
+            self.requests[(view, method, str(status))] += 1
+
+    def render(self):
+        """Return every series in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            self._render_histogram(
+                lines, 'http_request_duration_seconds', 'Request latency per view and method.', self.latency
+            )
+            self._render_histogram(
+                lines, 'http_request_sql_queries', 'SQL queries per request per view and method.', self.queries
+            )
+            self._render_counter(
+                lines, 'http_request_sql_seconds_total', 'Time spent in SQL per view and method.',
+                self.sql_seconds, ('view', 'method')
+            )
+            self._render_counter(
+                lines, 'http_response_size_bytes_total', 'Response body bytes per view and method.',
+                self.response_bytes, ('view', 'method')
+            )
+            self._render_counter(
+                lines, 'http_requests_total', 'Requests per view, method and status.',
+                self.requests, ('view', 'method', 'status')
+            )
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(names, values, extra=''):
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}'
+
+    def _render_histogram(self, lines, name, help_text, series):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        names = ('view', 'method')
+        for labels, histogram in sorted(series.items()):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                bucket_labels = self._labels(names, labels, 'le="%s"' % bound)
+                lines.append(f'{name}_bucket{bucket_labels} {count}')
+            inf_labels = self._labels(names, labels, 'le="+Inf"')
+            lines.append(f'{name}_bucket{inf_labels} {histogram.count}')
+            lines.append(f'{name}_sum{self._labels(names, labels)} {histogram.sum}')
+            lines.append(f'{name}_count{self._labels(names, labels)} {histogram.count}')
+
+    def _render_counter(self, lines, name, help_text, series, label_names):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for labels, value in sorted(series.items()):
+            lines.append(f'{name}{self._labels(label_names, labels)} {value}')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+class QueryRecorder:
+    """``execute_wrapper`` hook counting and timing the SQL run during one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.captured = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.seconds += duration
+            if len(self.captured) < MAX_CAPTURED_QUERIES:
+                self.captured.append((duration, sql))
+
+
+class QueryMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        self.record(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        # Under ASGI a request's sync views and ORM calls share one thread-sensitive
+        # worker thread, so the recorder goes on that thread's connection
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        await sync_to_async(_install_recorder)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_recorder)(recorder)
+        self.record(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, recorder, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(view, request.method, response.status_code, elapsed, recorder.count, recorder.seconds, size)
+
+        threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', None)
+        if threshold is not None and elapsed * 1000 >= threshold:
+            statements = '\n'.join(f'  [{duration * 1000:.1f} ms] {sql}' for duration, sql in recorder.captured)
+            logger.warning(
+                "Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms SQL\n%s",
+                request.method, request.path, view, elapsed * 1000,
+                recorder.count, recorder.seconds * 1000, statements
+            )
+
+
+def _install_recorder(recorder):
+    connection.execute_wrappers.append(recorder)
+
+
+def _remove_recorder(recorder):
+    connection.execute_wrappers.remove(recorder)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, limited to ``METRICS_ALLOWED_IPS``"""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
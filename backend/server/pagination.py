@@ -0,0 +1,195 @@
+"""
+Keyset (cursor) pagination, the default for every DRF list.
+
+``KeysetPagination`` orders by the view's ordering (the ``?ordering=`` filter
+or the view's ``ordering``, default ``-pk``) with the primary key appended as
+a tie-breaker, and encodes the ordering with the last row's values for *all*
+ordering fields in the opaque cursor. The next page is the rows strictly after that key, so every
+page costs one indexed range scan however deep the client pages, and rows
+sharing a date or name are never skipped or repeated.
+
+Pages hold ``page_size`` rows (``?page_size=`` up to the view's or the class's
+``max_page_size``); ``?count=true`` adds the exact total, which costs a
+``COUNT(*)`` and is therefore opt-in.
+"""
+import json
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _positive_int
+from rest_framework.response import Response
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keeps microseconds, which DjangoJSONEncoder rounds away, so cursors compare exactly"""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(CursorPagination):
+    ordering = '-pk'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None, ordering=None):
+        """
+        Return the requested page of ``queryset``. ``ordering`` overrides the
+        view's ordering, for actions listing a different model than the view.
+        """
+        self.request = request
+        self.view = view
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_keys(queryset.model, ordering or self.get_ordering(request, queryset, view))
+        self.cursor = self.decode_cursor(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            self.count = queryset.count()
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        queryset = queryset.order_by(*self.order_by(reverse))
+        if self.cursor is not None and self.cursor.position is not None:
+            queryset = self.filter_after(queryset, self.cursor.position, reverse)
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = self.cursor is not None, has_more
+        self.display_page_controls = self.has_previous or self.has_next
+        return self.page
+
+    def get_page_size(self, request):
+        page_size = getattr(self.view, 'page_size', None) or self.page_size
+        max_page_size = getattr(self.view, 'max_page_size', None) or self.max_page_size
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True, cutoff=max_page_size)
+        except (KeyError, ValueError):
+            return min(page_size, max_page_size)
+
+    def get_keys(self, model, ordering):
+        """``(path, descending)`` per ordering field, foreign keys by raw id, ending with the pk"""
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        keys = []
+        for field in ordering:
+            descending = field.startswith('-')
+            path = field.lstrip('-')
+            if path in ('pk', model._meta.pk.attname):
+                path = 'pk'
+            else:
+                path = self.resolve_path(model, path)
+            keys.append((path, descending))
+            if path == 'pk':
+                break
+        else:
+            keys.append(('pk', keys[0][1] if keys else True))
+        return keys
+
+    def resolve_path(self, model, path):
+        parts = path.split('__')
+        for index, part in enumerate(parts):
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                # An annotation; order by it as written
+                return path
+            if not field.is_relation:
+                break
+            if index == len(parts) - 1:
+                parts[index] = field.attname
+            model = field.related_model
+        return '__'.join(parts)
+
+    def order_by(self, reverse=False):
+        # NULLs sort lowest in both directions so ``after`` can compare with them
+        expressions = []
+        for path, descending in self.ordering:
+            if descending != reverse:
+                expressions.append(F(path).desc(nulls_last=True))
+            else:
+                expressions.append(F(path).asc(nulls_first=True))
+        return expressions
+
+    def signature(self):
+        return ['-' + path if descending else path for path, descending in self.ordering]
+
+    def filter_after(self, queryset, position, reverse=False):
+        """
+        ``queryset`` past an encoded cursor position. A cursor made under
+        another ordering (a link reused with a different ``?ordering=``) or
+        whose values do not fit the ordering fields is rejected as invalid.
+        """
+        try:
+            position = json.loads(position)
+            if position['ordering'] != self.signature() or len(position['key']) != len(self.ordering):
+                raise ValueError(position)
+            return queryset.filter(self.after(position['key'], reverse))
+        except (ValidationError, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def after(self, position, reverse=False):
+        """Rows strictly after ``position`` in the (possibly reversed) ordering"""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (path, descending), value in zip(self.ordering, position):
+            if descending != reverse:
+                # Walking down towards the NULLs at the end
+                beyond = Q(pk__in=[]) if value is None else (
+                    Q(**{f'{path}__lt': value}) | Q(**{f'{path}__isnull': True})
+                )
+            else:
+                beyond = Q(**{f'{path}__isnull': False}) if value is None else Q(**{f'{path}__gt': value})
+            condition |= equal & beyond
+            equal &= Q(**{f'{path}__isnull': True}) if value is None else Q(**{path: value})
+        return condition
+
+    def position(self, instance):
+        values = []
+        for path, _ in self.ordering:
+            value = instance
+            for part in path.split('__'):
+                value = getattr(value, part, None) if value is not None else None
+            values.append(value)
+        return json.dumps({'ordering': self.signature(), 'key': values}, cls=CursorEncoder)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.position(self.page[0])))
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response
+
+
+def paginated_response(view, queryset):
+    """Paginate a custom list action the same way as the view's list"""
+    page = view.paginate_queryset(queryset)
+    if page is None:
+        return Response(view.get_serializer(queryset, many=True).data)
+    return view.get_paginated_response(view.get_serializer(page, many=True).data)
@@ -58,6 +58,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "server.metrics.QueryMetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -135,6 +136,49 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # Keyset pages on every list; views may set page_size/max_page_size
+    "DEFAULT_PAGINATION_CLASS": "server.pagination.KeysetPagination",
+    "PAGE_SIZE": 50,
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "school-erp",
+    }
+}
+
+# Seconds a cached dashboard/statistics response may live; writes to the
+# models it depends on invalidate it earlier.
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# Live overview stream: bursts of writes within this window are sent as one
+# delta, and idle connections get a keepalive comment this often.
+DASHBOARD_STREAM_COALESCE_SECONDS = 1.0
+DASHBOARD_STREAM_KEEPALIVE_SECONDS = 15
+
+# Requests slower than this are logged by server.metrics with the SQL they
+# ran (None disables the log); /api/metrics only answers these addresses.
+SLOW_REQUEST_THRESHOLD_MS = 500
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
+# Chronic-absenteeism rules applied by `manage.py flag_at_risk_students`:
+# attendance below min_percentage, max_absence_streak consecutive absent school
+# days, or monday_friday_absences absences on Mondays/Fridays. Students with
+# fewer than min_marked_days marked days are not scored.
+ATTENDANCE_RISK_RULES = {
+    "min_percentage": 85,
+    "max_absence_streak": 3,
+    "monday_friday_absences": 4,
+    "min_marked_days": 10,
+}
+
+# Overdue-fee reminders sent by `manage.py sweep_overdue_invoices --send`:
+# batch_size emails per SMTP connection, at most per_minute emails a minute.
+DUNNING_REMINDERS = {
+    "batch_size": 50,
+    "per_minute": 120,
+    "subject": "Overdue school fees",
 }
 
 from datetime import timedelta
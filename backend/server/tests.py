@@ -0,0 +1,142 @@
+from datetime import date
+from urllib.parse import urlsplit
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.pagination import Cursor
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from students.models import StudentProfile
+from users.models import User
+from .metrics import registry
+from .pagination import KeysetPagination
+
+
+class QueryMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.admin = User.objects.create_user(
+            email='admin@example.com', first_name='A', last_name='D', role='admin', password='pw'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get('/api/dashboard/overview/')
+        self.client.get('/api/dashboard/overview/')
+
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn(
+            'http_request_duration_seconds_count{view="overview-dashboard",method="GET"} 2', body
+        )
+        self.assertIn('http_requests_total{view="overview-dashboard",method="GET",status="200"} 2', body)
+        self.assertIn('http_request_sql_queries_sum{view="overview-dashboard",method="GET"}', body)
+
+    async def test_asgi_requests_are_recorded_with_their_sql(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.admin)}'}
+        response = await self.async_client.get('/api/dashboard/overview/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        series = registry.queries[('overview-dashboard', 'GET')]
+        self.assertEqual(series.count, 1)
+        self.assertGreater(series.sum, 0)
+
+        # The event stream is timed to its headers without reading the body
+        response = await self.async_client.get(
+            '/api/dashboard/overview/stream/', {'token': str(AccessToken.for_user(self.admin))}
+        )
+        self.assertTrue(response.streaming)
+        self.assertEqual(registry.requests[('overview-stream', 'GET', '200')], 1)
+        self.assertEqual(registry.response_bytes[('overview-stream', 'GET')], 0)
+
+    def test_metrics_are_limited_to_allowed_addresses(self):
+        response = self.client.get('/api/metrics', REMOTE_ADDR='10.0.0.8')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_requests_log_their_sql(self):
+        with self.assertLogs('server.metrics', level='WARNING') as logs:
+            self.client.get('/api/dashboard/overview/')
+        self.assertIn('Slow request GET /api/dashboard/overview/', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            email='admin@example.com', first_name='A', last_name='D', role='admin', password='pw'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        # Repeated first names and missing middle names exercise the tie-breaker and NULL handling
+        for n in range(12):
+            StudentProfile.objects.create(
+                admission_number=f'ADM{n:04d}', first_name=['Cat', 'Ann', 'Ben'][n % 3],
+                middle_name=None if n % 4 == 0 else f'M{n % 5}', last_name=str(n), dob=date(2018, 1, 1), gender='female'
+            )
+
+    def walk(self, url, params=None):
+        pages = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            url, params = response.data['next'], None
+        return pages
+
+    def test_list_pages_follow_the_ordering_without_gaps(self):
+        pages = self.walk('/api/students/students/', {'ordering': 'first_name', 'page_size': 5})
+        self.assertEqual([len(page['results']) for page in pages], [5, 5, 2])
+        self.assertNotIn('count', pages[0])
+        ids = [row['id'] for page in pages for row in page['results']]
+        expected = list(StudentProfile.objects.order_by('first_name', 'pk').values_list('pk', flat=True))
+        self.assertEqual(ids, expected)
+
+        previous = self.client.get(pages[-1]['previous'])
+        self.assertEqual(previous.data['results'], pages[1]['results'])
+
+    def test_count_is_opt_in_and_page_size_is_capped(self):
+        response = self.client.get('/api/students/students/', {'count': 'true', 'page_size': 1000})
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 12)
+        paginator = KeysetPagination()
+        paginator.max_page_size = 3
+        request = Request(APIRequestFactory().get('/', {'page_size': 1000}))
+        self.assertEqual(len(paginator.paginate_queryset(StudentProfile.objects.all(), request)), 3)
+
+    def test_nullable_orderings_page_both_ways(self):
+        queryset = StudentProfile.objects.all()
+        for ordering in (['middle_name'], ['-middle_name', 'first_name']):
+            seen, url = [], '/'
+            while url:
+                paginator = KeysetPagination()
+                request = Request(APIRequestFactory().get(url, {'page_size': 4} if url == '/' else None))
+                page = paginator.paginate_queryset(queryset, request, ordering=ordering)
+                seen.append([student.pk for student in page])
+                url = paginator.get_next_link()
+                if url:
+                    url = '/?' + urlsplit(url).query
+            flat = [pk for page in seen for pk in page]
+            self.assertEqual(sorted(flat), sorted(queryset.values_list('pk', flat=True)))
+
+            # Stepping back from the last page returns the page before it
+            request = Request(APIRequestFactory().get('/?' + urlsplit(paginator.get_previous_link()).query))
+            back = KeysetPagination().paginate_queryset(queryset, request, ordering=ordering)
+            self.assertEqual([student.pk for student in back], seen[-2])
+
+    def test_foreign_or_edited_cursors_are_rejected(self):
+        first = self.client.get('/api/students/students/', {'ordering': 'first_name', 'page_size': 5}).data
+        response = self.client.get(first['next'].replace('ordering=first_name', 'ordering=-created_at'))
+        self.assertEqual(response.status_code, 404)
+
+        paginator = KeysetPagination()
+        paginator.base_url = 'http://testserver/api/students/students/?ordering=-created_at'
+        edited = paginator.encode_cursor(Cursor(
+            offset=0, reverse=False, position='{"ordering": ["-created_at", "-pk"], "key": ["notadate", 3]}'
+        ))
+        self.assertEqual(self.client.get(edited).status_code, 404)
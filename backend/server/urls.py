@@ -19,6 +19,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from server.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/users/", include("users.urls")),
@@ -31,4 +33,5 @@ urlpatterns = [
     path("api/timetable/", include("timetable.urls")),
     path("api/staff/", include("staff.urls")),
     path("api/dashboard/", include("dashboards.urls")),
+    path("api/metrics", metrics_view, name="metrics"),
 ]
@@ -21,6 +21,9 @@ class DepartmentSerializer(serializers.ModelSerializer):
         return None
 
     def get_staff_count(self, obj):
+        # Annotated by DepartmentViewSet.get_queryset; counted per object otherwise
+        if hasattr(obj, 'active_staff_count'):
+            return obj.active_staff_count
         return obj.staff_members.filter(is_active=True).count()
 
 
@@ -12,7 +12,7 @@ router = DefaultRouter()
 router.register(r'departments', DepartmentViewSet, basename='department')
 router.register(r'profiles', StaffProfileViewSet, basename='staff-profile')
 router.register(r'leaves', LeaveViewSet, basename='leave')
-router.register(r'attendance', AttendanceViewSet, basename='attendance')
+router.register(r'attendance', AttendanceViewSet, basename='staff-attendance')
 router.register(r'payroll', PayrollViewSet, basename='payroll')
 
 urlpatterns = [
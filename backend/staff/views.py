@@ -6,6 +6,10 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
 from datetime import datetime, timedelta
 from users.permissions import IsAdminOrHR, IsAdmin
+from dashboards.cache import cached_response
+from users.models import User
+from server.exports import ExportMixin
+from server.pagination import paginated_response
 from .models import Department, StaffProfile, Leave, Attendance, Payroll
 from .serializers import (
     DepartmentSerializer,
@@ -30,12 +34,16 @@ class DepartmentViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
 
+    def get_queryset(self):
+        return Department.objects.select_related('head').annotate(
+            active_staff_count=Count('staff_members', filter=Q(staff_members__is_active=True))
+        )
+
     @action(detail=False, methods=['get'])
     def active(self, request):
         """Get all active departments"""
-        active_depts = self.queryset.filter(is_active=True)
-        serializer = self.get_serializer(active_depts, many=True)
-        return Response(serializer.data)
+        active_depts = self.get_queryset().filter(is_active=True)
+        return paginated_response(self, active_depts)
 
 
 class StaffProfileViewSet(viewsets.ModelViewSet):
@@ -56,8 +64,7 @@ class StaffProfileViewSet(viewsets.ModelViewSet):
     def active(self, request):
         """Get all active staff members"""
         active_staff = self.queryset.filter(is_active=True)
-        serializer = self.get_serializer(active_staff, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, active_staff)
 
     @action(detail=False, methods=['get'])
     def by_department(self, request):
@@ -70,10 +77,10 @@ class StaffProfileViewSet(viewsets.ModelViewSet):
             )
         
         staff = self.queryset.filter(department_id=department_id, is_active=True)
-        serializer = self.get_serializer(staff, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, staff)
 
     @action(detail=False, methods=['get'])
+    @cached_response('staff.profiles.statistics', [StaffProfile, Department, User])
     def statistics(self, request):
         """Get staff statistics"""
         total_staff = self.queryset.filter(is_active=True).count()
@@ -111,8 +118,7 @@ class LeaveViewSet(viewsets.ModelViewSet):
     def pending(self, request):
         """Get all pending leave applications"""
         pending_leaves = self.queryset.filter(status='pending')
-        serializer = self.get_serializer(pending_leaves, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, pending_leaves)
 
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -161,6 +167,7 @@ class LeaveViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @cached_response('staff.leaves.statistics', [Leave])
     def statistics(self, request):
         """Get leave statistics"""
         total_leaves = self.queryset.count()
@@ -181,7 +188,7 @@ class LeaveViewSet(viewsets.ModelViewSet):
         })
 
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(ExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing staff attendance.
     Only admins and HR can manage attendance.
@@ -194,14 +201,24 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     search_fields = ['staff__first_name', 'staff__last_name']
     ordering_fields = ['date', 'created_at']
     ordering = ['-date']
+    export_filename = 'staff-attendance'
+    export_columns = [
+        ('Date', 'date'),
+        ('Employee ID', 'staff__employee_id'),
+        ('First name', 'staff__user__first_name'),
+        ('Last name', 'staff__user__last_name'),
+        ('Status', 'status'),
+        ('Check in', 'check_in_time'),
+        ('Check out', 'check_out_time'),
+        ('Remarks', 'remarks'),
+    ]
 
     @action(detail=False, methods=['get'])
     def today(self, request):
         """Get today's attendance"""
         today = timezone.now().date()
         today_attendance = self.queryset.filter(date=today)
-        serializer = self.get_serializer(today_attendance, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, today_attendance)
 
     @action(detail=False, methods=['get'])
     def by_staff(self, request):
@@ -214,8 +231,7 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             )
         
         attendance = self.queryset.filter(staff_id=staff_id)
-        serializer = self.get_serializer(attendance, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, attendance)
 
     @action(detail=False, methods=['post'])
     def bulk_mark(self, request):
@@ -254,6 +270,7 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_201_CREATED if created_records else status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['get'])
+    @cached_response('staff.attendance.statistics', [Attendance])
     def statistics(self, request):
         """Get attendance statistics"""
         today = timezone.now().date()
@@ -296,8 +313,7 @@ class PayrollViewSet(viewsets.ModelViewSet):
     def pending(self, request):
         """Get all pending/draft payrolls"""
         pending = self.queryset.filter(status='draft')
-        serializer = self.get_serializer(pending, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, pending)
 
     @action(detail=True, methods=['post'])
     def process(self, request, pk=None):
@@ -340,6 +356,7 @@ class PayrollViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @cached_response('staff.payroll.statistics', [Payroll])
     def statistics(self, request):
         """Get payroll statistics"""
         total_payrolls = self.queryset.count()
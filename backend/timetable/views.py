@@ -3,6 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from users.permissions import IsAdminOrTeacher, IsAdmin
+from server.pagination import paginated_response
 from .models import TimeSlot, Timetable, TimetableEntry
 from .serializers import (
     TimeSlotSerializer,
@@ -37,15 +38,13 @@ class TimeSlotViewSet(viewsets.ModelViewSet):
             )
         
         time_slots = self.queryset.filter(day_of_week=day, is_active=True)
-        serializer = self.get_serializer(time_slots, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, time_slots)
 
     @action(detail=False, methods=['get'])
     def active(self, request):
         """Get all active time slots"""
         active_slots = self.queryset.filter(is_active=True)
-        serializer = self.get_serializer(active_slots, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, active_slots)
 
     @action(detail=False, methods=['get'])
     def weekly_schedule(self, request):
@@ -84,8 +83,7 @@ class TimetableViewSet(viewsets.ModelViewSet):
     def active(self, request):
         """Get all active timetables"""
         active_timetables = self.queryset.filter(is_active=True)
-        serializer = self.get_serializer(active_timetables, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, active_timetables)
 
     @action(detail=False, methods=['get'])
     def by_class(self, request):
@@ -104,8 +102,7 @@ class TimetableViewSet(viewsets.ModelViewSet):
         if section_id:
             queryset = queryset.filter(section_id=section_id)
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, queryset)
 
     @action(detail=False, methods=['get'])
     def by_teacher(self, request):
@@ -125,8 +122,7 @@ class TimetableViewSet(viewsets.ModelViewSet):
             entries__teacher_id=teacher_id
         ).distinct()
         
-        serializer = self.get_serializer(timetables, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, timetables)
 
     @action(detail=True, methods=['post'])
     def duplicate(self, request, pk=None):
@@ -192,8 +188,7 @@ class TimetableEntryViewSet(viewsets.ModelViewSet):
             )
         
         entries = self.queryset.filter(timetable_id=timetable_id)
-        serializer = self.get_serializer(entries, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, entries)
 
     @action(detail=False, methods=['get'])
     def teacher_schedule(self, request):